@@ -0,0 +1 @@
+"""__init__.py file for the benchmarks. Each module can be run with `python -m benchmarks.<name>`."""
@@ -0,0 +1,111 @@
+"""Benchmark measuring the responsiveness of the event loop while a slow web request is in flight.
+
+Starts a local web server whose responses take a few seconds, then fetches from it once using the
+blocking `web.get_html()` and once using `async_web.get_html()`. Meanwhile a ticker coroutine,
+standing in for the Discord gateway and `main_update_loop`, records how late each of its ticks is.
+
+Usage: `python -m benchmarks.event_loop_latency`
+"""
+
+# Standard library imports
+import asyncio
+import statistics
+import threading
+import time
+
+# Third-party imports
+from aiohttp import web as aiohttp_web
+from corny_commons.util import web
+
+# Local application imports
+from modules.api import async_web
+
+HOST = "127.0.0.1"
+PORT = 8765
+SLOW_RESPONSE_DELAY = 2  # Seconds
+TICK_INTERVAL = 0.01  # Seconds
+
+
+async def slow_handler(_: aiohttp_web.Request) -> aiohttp_web.Response:
+    """Responds with a small HTML page after a delay."""
+    await asyncio.sleep(SLOW_RESPONSE_DELAY)
+    return aiohttp_web.Response(text="<html><head></head><body>OK</body></html>")
+
+
+def start_server() -> None:
+    """Runs the slow server in a daemon thread with its own event loop, so that blocking the
+    benchmarked event loop does not also block the server."""
+    server_ready = threading.Event()
+
+    def run() -> None:
+        server_loop = asyncio.new_event_loop()
+        app = aiohttp_web.Application()
+        app.router.add_get("/", slow_handler)
+        runner = aiohttp_web.AppRunner(app)
+        server_loop.run_until_complete(runner.setup())
+        site = aiohttp_web.TCPSite(runner, HOST, PORT)
+        server_loop.run_until_complete(site.start())
+        server_ready.set()
+        server_loop.run_forever()
+
+    threading.Thread(target=run, daemon=True).start()
+    server_ready.wait()
+
+
+async def measure_tick_lag(fetch_coroutine) -> list[float]:
+    """Runs the ticker while the fetch coroutine is awaited. Returns each tick's lag in ms."""
+    lags: list[float] = []
+    finished = asyncio.Event()
+
+    async def ticker():
+        while not finished.is_set():
+            expected = time.perf_counter() + TICK_INTERVAL
+            await asyncio.sleep(TICK_INTERVAL)
+            lags.append((time.perf_counter() - expected) * 1000)
+
+    ticker_task = asyncio.create_task(ticker())
+    # Let the ticker settle before starting the request
+    await asyncio.sleep(0.1)
+    await fetch_coroutine
+    finished.set()
+    await ticker_task
+    return lags
+
+
+async def fetch_blocking(url: str) -> None:
+    """Fetches the page the way the bot used to -- a blocking call made on the event loop."""
+    web.get_html(url, ignore_request_limit=True)
+
+
+async def fetch_async(url: str) -> None:
+    """Fetches the page using the pooled asynchronous client."""
+    await async_web.get_html(url, ignore_request_limit=True)
+
+
+def report(name: str, lags: list[float]) -> None:
+    """Prints the summary of the tick lags for a single scenario."""
+    print(
+        f"{name:>10}: ticks={len(lags):4}  max lag={max(lags):8.1f} ms  "
+        f"mean lag={statistics.mean(lags):6.2f} ms"
+    )
+
+
+async def main() -> None:
+    """Runs both scenarios against the local server."""
+    url = f"http://{HOST}:{PORT}/"
+    # Silence the 'Fetching content from ...' messages
+    web.send_log = lambda *_, **__: None
+    print(
+        f"Response delay: {SLOW_RESPONSE_DELAY}s, "
+        f"tick interval: {TICK_INTERVAL * 1000:.0f} ms"
+    )
+    try:
+        report("blocking", await measure_tick_lag(fetch_blocking(url)))
+        report("async", await measure_tick_lag(fetch_async(url)))
+    finally:
+        await async_web.close()
+
+
+if __name__ == "__main__":
+    start_server()
+    asyncio.run(main())
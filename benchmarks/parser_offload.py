@@ -0,0 +1,80 @@
+"""Benchmark measuring the responsiveness of the event loop while lesson plan pages are parsed.
+
+Parses a batch of generated lesson plan pages -- as during a school-wide plan sync -- once inline on
+the event loop and once using the parser process pool, while a ticker coroutine records how late
+each of its ticks is.
+
+Usage: `python -m benchmarks.parser_offload [number of pages]`
+"""
+
+# Standard library imports
+import asyncio
+import sys
+import time
+
+# Local application imports
+from benchmarks.event_loop_latency import measure_tick_lag, report
+from modules import WEEKDAY_NAMES
+from modules.api import lesson_plan, parsing
+
+NUM_PAGES = 17  # The number of classes in the school
+NUM_PERIODS = 11
+LESSONS_PER_CELL = 4
+
+
+def generate_plan_html() -> str:
+    """Returns the HTML of a lesson plan page in the format generated by the timetable software.
+
+    The plan table is the 3rd table on the page, with one tag per line.
+    """
+    lines = ["<html>", "<head></head>", "<body>", "<table></table>", "<table></table>"]
+    lines += ["<table class=\"tabela\">", "<tr>", "<th>Nr</th>", "<th>Godz</th>"]
+    lines += [f"<th>{weekday}</th>" for weekday in WEEKDAY_NAMES[:5]]
+    lines.append("</tr>")
+    lesson = (
+        '<span class="p">j. angielski-{group}/2</span> '
+        '<a href="../plany/n1.html" class="n">AB</a> '
+        '<a href="../plany/s1.html" class="s">{room}</a><br>'
+    )
+    for period in range(1, NUM_PERIODS + 1):
+        lines += ["<tr>", f'<td class="nr">{period}</td>', '<td class="g"> 8:00- 8:45</td>']
+        for _ in WEEKDAY_NAMES[:5]:
+            cell = "".join(
+                lesson.format(group=i % 2 + 1, room=100 + i) for i in range(LESSONS_PER_CELL)
+            )
+            lines.append(f'<td class="l">{cell}</td>')
+        lines.append("</tr>")
+    lines += ["</table>", "</body>", "</html>"]
+    return "\n".join(lines)
+
+
+async def parse_inline(pages: list[str]) -> None:
+    """Parses the pages on the event loop, the way the bot used to. Responses that arrive together
+    are parsed back to back, without the event loop getting a chance to run in between."""
+    for page in pages:
+        lesson_plan.parse_html(page)
+
+
+async def parse_offloaded(pages: list[str]) -> None:
+    """Parses the pages concurrently using the parser process pool."""
+    await asyncio.gather(*[parsing.run_parser(lesson_plan.parse_html, page) for page in pages])
+
+
+async def main(num_pages: int) -> None:
+    """Runs both scenarios."""
+    pages = [generate_plan_html()] * num_pages
+    print(f"Parsing {num_pages} pages of {len(pages[0]) // 1024} KiB each.")
+    # Start the worker processes beforehand so that their start-up time isn't measured
+    await parsing.run_parser(lesson_plan.parse_html, pages[0])
+    try:
+        for name, scenario in (("inline", parse_inline), ("offloaded", parse_offloaded)):
+            start_time = time.perf_counter()
+            lags = await measure_tick_lag(scenario(pages))
+            report(name, lags)
+            print(f"{'':>10}  total time={(time.perf_counter() - start_time) * 1000:.0f} ms")
+    finally:
+        parsing.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else NUM_PAGES))
@@ -0,0 +1,50 @@
+"""Benchmark measuring the time and memory needed to parse the lesson plans of the whole school.
+
+Parses the recorded lesson plan pages in `benchmarks/fixtures` -- one per class, as during the daily
+lesson plan sync -- and reports the mean time per sync and the peak memory allocated while parsing.
+
+Usage: `python -m benchmarks.plan_parser [number of repetitions]`
+"""
+
+# Standard library imports
+import sys
+import time
+import tracemalloc
+
+# Local application imports
+from benchmarks.stand_in import find_fixture, get_fixture_path
+from modules.api import lesson_plan
+
+NUM_CLASSES = 17  # The number of classes in the school
+NUM_REPETITIONS = 50
+
+
+def load_plan_pages() -> list[str]:
+    """Returns the HTML of the recorded lesson plan page of each class."""
+    pages: list[str] = []
+    for plan_id in range(1, NUM_CLASSES + 1):
+        scheme, url = lesson_plan.SOURCE_URL.format(id=plan_id).split("://")
+        with open(find_fixture(get_fixture_path(scheme, url, "")), encoding="UTF-8") as file:
+            pages.append(file.read())
+    return pages
+
+
+def main(num_repetitions: int) -> None:
+    """Parses the pages repeatedly and prints the results."""
+    pages = load_plan_pages()
+    print(f"Parsing {len(pages)} pages of {sum(map(len, pages)) // len(pages) // 1024} KiB each.")
+    start_time = time.perf_counter()
+    for _ in range(num_repetitions):
+        for page in pages:
+            lesson_plan.parse_html(page)
+    mean_time = (time.perf_counter() - start_time) / num_repetitions
+    tracemalloc.start()
+    for page in pages:
+        lesson_plan.parse_html(page)
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"time per sync={mean_time * 1000:.2f} ms  peak memory={peak_memory / 1024:.1f} KiB")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else NUM_REPETITIONS)
@@ -0,0 +1,215 @@
+"""Local stand-in server for the school website, the SU ILO API and the Steam Community Market.
+
+Serves the recorded responses in `benchmarks/fixtures` so that the fetch paths can be tested and
+benchmarked offline and deterministically. Faults can be injected: latency, error responses and
+truncated bodies. In record mode, responses that have no fixture yet are fetched from the real
+service and saved.
+
+The bot, the fetcher and the debug CLIs of the API modules send their requests to the stand-in
+server if the `STAND_IN_URL` environment variable is set, e.g.
+`STAND_IN_URL=http://127.0.0.1:8780 python -m modules.fetcher`.
+
+Usage: `python -m benchmarks.stand_in [--port 8780] [--latency 0.2] [--jitter 0.1]
+[--error-rate 0.1] [--error-codes 403,429,500] [--truncate-rate 0.05] [--seed 0] [--record]`
+
+The URL of a resource on the stand-in server is made of its scheme, host and path, e.g.
+`http://127.0.0.1:8780/http/www.lo1.gliwice.pl/zastepstwa-2/`. Its fixture is the file at the same
+path in the fixtures directory; the query string, if any, is the name of the file in the directory
+of the path. If there is no such file, the `_default` fixture in the same directory is used.
+"""
+
+# Standard library imports
+import argparse
+import asyncio
+import hashlib
+import os
+import random
+import threading
+from datetime import date
+from urllib import parse
+
+# Third-party imports
+import aiohttp
+from aiohttp import web as aiohttp_web
+
+FIXTURES_DIRECTORY = os.path.join(os.path.dirname(__file__), "fixtures")
+DEFAULT_FIXTURE_NAME = "_default"
+HOST = "127.0.0.1"
+PORT = 8780
+# Replaced with today's date in ISO format when serving a fixture, e.g. for the lucky numbers
+TODAY_PLACEHOLDER = b"{{TODAY}}"
+TRUNCATED_FRACTION = 0.5  # Fraction of the body sent before a truncated response is cut off
+
+
+class FaultConfig:
+    """Custom object type containing the faults that the stand-in server injects.
+
+    Attributes:
+        latency -- the number of seconds each response is delayed by.
+        jitter -- the maximum number of seconds randomly added to the latency.
+        error_rate -- the fraction of requests that are answered with an error status code.
+        error_codes -- the status codes that the error responses are chosen from.
+        truncate_rate -- the fraction of requests whose response body is cut off.
+        seed -- the seed of the random number generator, so that the faults are reproducible.
+        record -- if True, missing fixtures are fetched from the real service and saved.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        error_codes: list[int] = None,
+        truncate_rate: float = 0.0,
+        seed: int = 0,
+        record: bool = False,
+    ) -> None:
+        self.latency: float = latency
+        self.jitter: float = jitter
+        self.error_rate: float = error_rate
+        self.error_codes: list[int] = error_codes or [403, 429, 500]
+        self.truncate_rate: float = truncate_rate
+        self.record: bool = record
+        self.random = random.Random(seed)
+
+
+def get_fixture_path(scheme: str, resource_path: str, query: str) -> str:
+    """Returns the path of the fixture file for the resource with the given path and query."""
+    is_directory = resource_path.endswith("/")
+    resource_path = resource_path.strip("/")
+    if query:
+        filename = parse.quote(query, safe="")
+    elif is_directory:
+        # A page such as 'www.lo1.gliwice.pl/zastepstwa-2/'
+        filename = "index.html"
+    else:
+        resource_path, filename = os.path.split(resource_path)
+    return os.path.join(FIXTURES_DIRECTORY, scheme, *resource_path.split("/"), filename)
+
+
+def find_fixture(fixture_path: str) -> str or None:
+    """Returns the path of the fixture if it exists, otherwise that of the default fixture in the
+    same directory. Returns None if neither exists."""
+    if os.path.isfile(fixture_path):
+        return fixture_path
+    directory = os.path.dirname(fixture_path)
+    extension = os.path.splitext(fixture_path)[1]
+    default_path = os.path.join(directory, DEFAULT_FIXTURE_NAME + extension)
+    return default_path if os.path.isfile(default_path) else None
+
+
+async def record_fixture(original_url: str, fixture_path: str) -> None:
+    """Fetches the resource from the real service and saves it as the fixture."""
+    async with aiohttp.ClientSession() as session:
+        async with session.get(original_url) as res:
+            res.raise_for_status()
+            content = await res.read()
+    os.makedirs(os.path.dirname(fixture_path), exist_ok=True)
+    with open(fixture_path, "wb") as file:
+        file.write(content)
+
+
+def get_content_type(fixture_path: str, content: bytes) -> str:
+    """Returns the content type header value for the fixture."""
+    if fixture_path.endswith(".html") or content.lstrip().startswith(b"<"):
+        return "text/html; charset=UTF-8"
+    return "application/json; charset=UTF-8"
+
+
+def make_handler(config: FaultConfig):
+    """Returns the request handler for the stand-in server with the given faults."""
+
+    async def handle_request(request: aiohttp_web.Request) -> aiohttp_web.StreamResponse:
+        scheme = request.match_info["scheme"]
+        resource_path = request.match_info["path"]
+        delay = config.latency + config.random.uniform(0, config.jitter)
+        if delay:
+            await asyncio.sleep(delay)
+        if config.random.random() < config.error_rate:
+            return aiohttp_web.Response(status=config.random.choice(config.error_codes))
+
+        fixture_path = get_fixture_path(scheme, resource_path, request.query_string)
+        found_path = find_fixture(fixture_path)
+        if found_path is None and config.record:
+            query = f"?{request.query_string}" if request.query_string else ""
+            await record_fixture(f"{scheme}://{resource_path}{query}", fixture_path)
+            found_path = fixture_path
+        if found_path is None:
+            return aiohttp_web.Response(status=404)
+        with open(found_path, "rb") as file:
+            content = file.read().replace(TODAY_PLACEHOLDER, str(date.today()).encode())
+
+        etag = f'"{hashlib.sha1(content).hexdigest()}"'
+        if request.headers.get("If-None-Match") == etag:
+            return aiohttp_web.Response(status=304, headers={"ETag": etag})
+        headers = {
+            "ETag": etag,
+            "Content-Type": get_content_type(found_path, content),
+            "Content-Length": str(len(content)),
+        }
+        if config.random.random() >= config.truncate_rate:
+            return aiohttp_web.Response(body=content, headers=headers)
+        # Send only part of the body, then drop the connection
+        response = aiohttp_web.StreamResponse(headers=headers)
+        await response.prepare(request)
+        await response.write(content[: int(len(content) * TRUNCATED_FRACTION)])
+        request.transport.close()
+        return response
+
+    return handle_request
+
+
+def make_app(config: FaultConfig) -> aiohttp_web.Application:
+    """Returns the stand-in server application."""
+    app = aiohttp_web.Application()
+    app.router.add_get("/{scheme:https?}/{path:.+}", make_handler(config))
+    return app
+
+
+def start_in_thread(config: FaultConfig = None, port: int = PORT) -> str:
+    """Runs the stand-in server in a daemon thread with its own event loop, so that benchmarks can
+    use it without it competing with the benchmarked event loop. Returns the server's URL."""
+    server_ready = threading.Event()
+
+    def run() -> None:
+        server_loop = asyncio.new_event_loop()
+        runner = aiohttp_web.AppRunner(make_app(config or FaultConfig()))
+        server_loop.run_until_complete(runner.setup())
+        site = aiohttp_web.TCPSite(runner, HOST, port)
+        server_loop.run_until_complete(site.start())
+        server_ready.set()
+        server_loop.run_forever()
+
+    threading.Thread(target=run, daemon=True).start()
+    server_ready.wait()
+    return f"http://{HOST}:{port}"
+
+
+def parse_args() -> tuple[FaultConfig, int]:
+    """Returns the fault configuration and the port given by the command-line arguments."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n", maxsplit=1)[0])
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-codes", default="403,429,500")
+    parser.add_argument("--truncate-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--record", action="store_true")
+    args = parser.parse_args()
+    config = FaultConfig(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        error_codes=[int(code) for code in args.error_codes.split(",")],
+        truncate_rate=args.truncate_rate,
+        seed=args.seed,
+        record=args.record,
+    )
+    return config, args.port
+
+
+if __name__ == "__main__":
+    fault_config, server_port = parse_args()
+    print(f"Stand-in server running at http://{HOST}:{server_port}. Set STAND_IN_URL to use it.")
+    aiohttp_web.run_app(make_app(fault_config), host=HOST, port=server_port, print=None)
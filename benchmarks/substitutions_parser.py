@@ -0,0 +1,75 @@
+"""Benchmark comparing the full-tree and the streaming parsers of the substitutions page.
+
+Parses the recorded substitutions page in `benchmarks/fixtures` using `parse_html_new()`, which
+builds the tree of the whole page, and `parse_html_streamed()`, which only builds the tree of the
+post. Reports the mean parse time and how much the peak resident set size of the process grows
+while the page is parsed once.
+
+Measuring the peak RSS uses the Linux /proc interface and glibc's `malloc_trim()`, so that memory
+freed by earlier parses is not reused.
+
+Usage: `python -m benchmarks.substitutions_parser [number of repetitions]`
+"""
+
+# Standard library imports
+import ctypes
+import gc
+import sys
+import time
+
+# Local application imports
+from benchmarks.stand_in import find_fixture, get_fixture_path
+from modules.api import substitutions
+
+NUM_REPETITIONS = 200
+NUM_MEMORY_SAMPLES = 5  # The lowest of the measurements is reported, as the first one is noisy
+PARSERS = {"full tree": "parse_html_new", "streamed": "parse_html_streamed"}
+
+
+def load_page() -> str:
+    """Returns the HTML of the recorded substitutions page."""
+    scheme, url = substitutions.SOURCE_URL.split("://")
+    with open(find_fixture(get_fixture_path(scheme, url, "")), encoding="UTF-8") as file:
+        return file.read()
+
+
+def get_memory_status(field_name: str) -> int:
+    """Returns the value of the given field of the process' memory status in KiB, e.g. 'VmRSS'."""
+    with open("/proc/self/status", encoding="UTF-8") as file:
+        for line in file:
+            if line.startswith(field_name + ":"):
+                return int(line.split()[1])
+    raise LookupError(field_name)
+
+
+def measure_peak_rss(parser, html: str) -> int:
+    """Parses the page once and returns how much the process' peak RSS grew in KiB."""
+    gc.collect()
+    ctypes.CDLL("libc.so.6").malloc_trim(0)
+    # Reset the peak RSS to the current RSS
+    with open("/proc/self/clear_refs", "w", encoding="UTF-8") as file:
+        file.write("5")
+    rss_before = get_memory_status("VmRSS")
+    parser(html)
+    return get_memory_status("VmHWM") - rss_before
+
+
+def main(num_repetitions: int) -> None:
+    """Runs both parsers and prints the results."""
+    html = load_page()
+    print(f"Parsing a page of {len(html.encode()) // 1024} KiB.")
+    results = [getattr(substitutions, parser_name)(html) for parser_name in PARSERS.values()]
+    if any(result != results[0] for result in results):
+        print("The parsers' results differ!")
+    for name, parser_name in PARSERS.items():
+        parser = getattr(substitutions, parser_name)
+        start_time = time.perf_counter()
+        for _ in range(num_repetitions):
+            parser(html)
+        mean_time = (time.perf_counter() - start_time) / num_repetitions
+        peak_rss = min(measure_peak_rss(parser, html) for _ in range(NUM_MEMORY_SAMPLES))
+        print(f"{name:>10}: time={mean_time * 1000:.2f} ms  peak RSS increase={peak_rss} KiB")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else NUM_REPETITIONS)
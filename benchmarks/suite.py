@@ -0,0 +1,318 @@
+"""Benchmark suite for the parsers and the scrapers, run offline over a corpus of recorded pages.
+
+Times and memory-profiles `lesson_plan.parse_html()`, `substitutions.parse_html()`,
+`parse_html_new()` and `parse_html_streamed()` on each page of the corpus, as well as
+`get_int_ranges_from_string()` and the full `get_substitutions()` cache path: fetching the page from
+the stand-in server, parsing it and saving the cache. The corpus consists of the recorded pages in
+`benchmarks/fixtures`, which the stand-in server serves, and the unusually large pages in
+`benchmarks/corpus`, e.g. the substitutions during the mock exams.
+
+The results of each case are the mean time per call, the peak memory allocated by Python objects
+during one call (traced with tracemalloc) and how much the peak RSS of the process grows during one
+call, which also includes the memory allocated by lxml (None if that is unavailable on this
+platform). They are written as JSON and compared with the stored baseline; a case has regressed if
+any of its measurements exceeds the baseline's by more than the threshold. Since the measurements
+depend on the machine, the baseline should be updated on the machine that the suite is run on; the
+times are also scaled by the time of a reference workload, to account for how busy the machine is.
+
+Usage: `python -m benchmarks.suite [--repetitions 20] [--output results.json]
+[--baseline benchmarks/baseline.json] [--threshold 0.5] [--update-baseline] [--filter lesson_plan]`
+
+Exits with status 1 if any case has regressed.
+"""
+
+# Standard library imports
+import argparse
+import contextlib
+import gc
+import glob
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Third-party imports
+from corny_commons import file_manager
+
+# Local application imports
+from benchmarks.stand_in import find_fixture, get_fixture_path, start_in_thread
+from modules.api import lesson_plan, shadow, substitutions
+
+CORPUS_DIRECTORY = os.path.join(os.path.dirname(__file__), "corpus")
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+STAND_IN_PORT = 8781
+NUM_REPETITIONS = 20  # The minimum number of calls per round
+MIN_ROUND_TIME = 0.2  # Seconds; fast cases are called more times so that the rounds are not noisy
+NUM_ROUNDS = 5  # The fastest round's mean time is reported, as the others are slowed by noise
+NUM_MEMORY_SAMPLES = 3  # The lowest peak RSS increase is reported, for the same reason
+REGRESSION_THRESHOLD = 0.5  # The fraction by which a measurement may exceed the baseline's
+MEMORY_SLACK_KIB = 256  # Absolute allowance for the memory measurements, which vary between runs
+RECORDED_PLAN_IDS = [1, 2, 3]
+# The period strings found on the substitutions pages
+PERIOD_STRINGS = ["1l", "6l", "1,2l", "3-5l", "1-3i5-7l", "7,8l", " 2-4l ", "1,3,5l"]
+
+
+class Case:
+    """Custom object type containing a benchmark case.
+
+    Attributes:
+        name -- the name of the case in the results, e.g. 'lesson_plan.parse_html[o1]'.
+        function -- the benchmarked function.
+        args -- the arguments to call the function with.
+        input_kib -- the size of the parsed page, if any.
+    """
+
+    def __init__(self, name: str, function, args: tuple = (), input_kib: float = None) -> None:
+        self.name: str = name
+        self.function = function
+        self.args: tuple = args
+        self.input_kib: float = input_kib
+
+    def run(self) -> any:
+        """Calls the benchmarked function once."""
+        return self.function(*self.args)
+
+
+def read_page(path: str) -> str:
+    """Returns the contents of the page at the given path."""
+    with open(path, encoding="UTF-8") as file:
+        return file.read()
+
+
+def get_recorded_page_path(url: str) -> str:
+    """Returns the path of the fixture that the stand-in server serves for the URL."""
+    scheme, resource_path = url.split("://")
+    return find_fixture(get_fixture_path(scheme, resource_path, ""))
+
+
+def load_corpus() -> dict[str, dict[str, str]]:
+    """Returns the HTML of the lesson plan and substitutions pages in the corpus, keyed by the
+    type of the page and then by the name of the page."""
+    corpus = {"plan": {}, "substitutions": {}}
+    for plan_id in RECORDED_PLAN_IDS:
+        path = get_recorded_page_path(lesson_plan.SOURCE_URL.format(id=plan_id))
+        corpus["plan"][f"o{plan_id}"] = read_page(path)
+    path = get_recorded_page_path(substitutions.SOURCE_URL)
+    corpus["substitutions"]["recorded"] = read_page(path)
+    for path in sorted(glob.glob(os.path.join(CORPUS_DIRECTORY, "*.html"))):
+        page_type, page_name = os.path.splitext(os.path.basename(path))[0].split("-", maxsplit=1)
+        corpus[page_type][page_name] = read_page(path)
+    return corpus
+
+
+def run_reference_workload() -> None:
+    """Runs a fixed workload independent of the bot's code, whose time is used to account for the
+    speed of the machine at the time of the run when comparing with the baseline."""
+    data = [{"name": f"lesson {i}", "periods": list(range(i % 10))} for i in range(200)]
+    json.loads(json.dumps(data))
+    sorted(str(item) for item in data)
+
+
+def parse_period_strings() -> None:
+    """Parses each of the period strings found on the substitutions pages."""
+    for lessons_string in PERIOD_STRINGS:
+        substitutions.get_int_ranges_from_string(lessons_string)
+
+
+def get_substitutions_uncached() -> None:
+    """Fetches, parses and saves the substitutions as if there were no cache."""
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(os.path.join(file_manager.CACHE_DIRECTORY, "subs.json"))
+    substitutions.get_substitutions(force_update=True)
+
+
+def get_substitutions_not_modified() -> None:
+    """Refreshes the existing substitutions cache, to which the server responds 304 Not Modified."""
+    substitutions.get_substitutions(force_update=True)
+
+
+def get_cases(corpus: dict[str, dict[str, str]]) -> list[Case]:
+    """Returns the benchmark cases for the pages in the corpus."""
+    cases = []
+    for page_name, html in corpus["plan"].items():
+        size = len(html.encode()) / 1024
+        parser = lesson_plan.parse_html
+        cases.append(Case(f"lesson_plan.parse_html[{page_name}]", parser, (html,), size))
+    for parser_name in ("parse_html", "parse_html_new", "parse_html_streamed"):
+        parser = getattr(substitutions, parser_name)
+        for page_name, html in corpus["substitutions"].items():
+            size = len(html.encode()) / 1024
+            cases.append(Case(f"substitutions.{parser_name}[{page_name}]", parser, (html,), size))
+    cases += [
+        Case("substitutions.get_int_ranges_from_string", parse_period_strings),
+        Case("substitutions.get_substitutions[uncached]", get_substitutions_uncached),
+        Case("substitutions.get_substitutions[not modified]", get_substitutions_not_modified),
+    ]
+    return cases
+
+
+def measure_time(case: Case, num_repetitions: int) -> float:
+    """Returns the mean time per call of the fastest round, in seconds. Like `timeit`, the garbage
+    collector is disabled meanwhile, so that the garbage of the earlier cases is not counted."""
+    gc.collect()
+    gc.disable()
+    try:
+        return measure_rounds(case, num_repetitions)
+    finally:
+        gc.enable()
+
+
+def measure_rounds(case: Case, num_repetitions: int) -> float:
+    """Runs the rounds of calls and returns the mean time per call of the fastest round."""
+    start_time = time.perf_counter()
+    case.run()
+    call_time = time.perf_counter() - start_time
+    num_repetitions = max(num_repetitions, int(MIN_ROUND_TIME / call_time))
+    round_times = []
+    for _ in range(NUM_ROUNDS):
+        start_time = time.perf_counter()
+        for _ in range(num_repetitions):
+            case.run()
+        round_times.append((time.perf_counter() - start_time) / num_repetitions)
+    return min(round_times)
+
+
+def measure_python_memory(case: Case) -> float:
+    """Returns the peak memory allocated by Python objects during one call, in KiB."""
+    tracemalloc.start()
+    try:
+        case.run()
+        return tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def measure_peak_rss(case: Case) -> int or None:
+    """Returns how much the process' peak RSS grows during one call in KiB, or None if that is
+    unavailable on this platform."""
+    shadow.reset_peak_memory()
+    rss_before = shadow.get_memory_status("VmRSS")
+    case.run()
+    peak_rss = shadow.get_memory_status("VmHWM")
+    return None if None in (rss_before, peak_rss) else peak_rss - rss_before
+
+
+def run_case(case: Case, num_repetitions: int) -> dict[str, float]:
+    """Runs the case and returns its measurements."""
+    # Warm up the caches, e.g. the lesson plans used by `substitutions.parse_html()`
+    case.run()
+    rss_samples = [measure_peak_rss(case) for _ in range(NUM_MEMORY_SAMPLES)]
+    return {
+        "input_kib": case.input_kib,
+        "seconds": measure_time(case, num_repetitions),
+        "peak_python_kib": measure_python_memory(case),
+        "peak_rss_kib": None if None in rss_samples else min(rss_samples),
+    }
+
+
+def get_regressions(report: dict, baseline: dict, threshold: float) -> list[str]:
+    """Returns a description of each measurement that exceeds the baseline by more than the
+    threshold. The baseline's times are scaled by how much faster or slower the reference workload
+    ran than when the baseline was made.
+
+    Arguments:
+        report -- the results of the suite.
+        baseline -- the stored results of the suite.
+        threshold -- the fraction by which a measurement may exceed the baseline's, e.g. 0.5.
+    """
+    speed_ratio = report["reference_seconds"] / baseline["reference_seconds"]
+    regressions = []
+    for case_name, measurements in report["cases"].items():
+        baseline_measurements = baseline["cases"].get(case_name, {})
+        for metric in ("seconds", "peak_python_kib", "peak_rss_kib"):
+            value = measurements.get(metric)
+            baseline_value = baseline_measurements.get(metric)
+            if value is None or baseline_value is None:
+                continue
+            if metric == "seconds":
+                baseline_value *= speed_ratio
+            slack = 0 if metric == "seconds" else MEMORY_SLACK_KIB
+            if value > baseline_value * (1 + threshold) + slack:
+                change = (value / baseline_value - 1) * 100 if baseline_value else float("inf")
+                regressions.append(
+                    f"{case_name}: {metric} {value:.6g} vs {baseline_value:.6g} ({change:+.0f}%)"
+                )
+    return regressions
+
+
+def format_results(results: dict[str, dict[str, float]]) -> str:
+    """Returns the measurements of each case as a table."""
+    lines = [f"{'case':<52} {'time (ms)':>10} {'py peak (KiB)':>14} {'RSS peak (KiB)':>15}"]
+    for case_name, measurements in results.items():
+        peak_rss = measurements["peak_rss_kib"]
+        lines.append(
+            f"{case_name:<52} {measurements['seconds'] * 1000:>10.3f} "
+            f"{measurements['peak_python_kib']:>14.1f} {'-' if peak_rss is None else peak_rss:>15}"
+        )
+    return "\n".join(lines)
+
+
+def parse_args() -> argparse.Namespace:
+    """Returns the command-line arguments."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n", maxsplit=1)[0])
+    parser.add_argument("--repetitions", type=int, default=NUM_REPETITIONS)
+    parser.add_argument("--output", help="path of the JSON file to write the results to")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--filter", default="", help="only run the cases containing this string")
+    return parser.parse_args()
+
+
+def main() -> int:
+    """Runs the suite and returns the exit status."""
+    args = parse_args()
+    baseline_path = os.path.abspath(args.baseline)
+    output_path = args.output and os.path.abspath(args.output)
+    corpus = load_corpus()
+    # Parse inline, so that the parsing is measured in this process
+    os.environ["PARSER_PROCESSES"] = "0"
+    os.environ["STAND_IN_URL"] = start_in_thread(port=STAND_IN_PORT)
+    results = {}
+    reference_seconds = measure_time(Case("reference", run_reference_workload), NUM_REPETITIONS)
+    # Keep the caches and the logs written by the scrapers out of the working directory
+    with tempfile.TemporaryDirectory() as temp_directory:
+        working_directory = os.getcwd()
+        os.chdir(temp_directory)
+        try:
+            for case in get_cases(corpus):
+                if args.filter in case.name:
+                    results[case.name] = run_case(case, args.repetitions)
+        finally:
+            os.chdir(working_directory)
+    print(format_results(results))
+
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "repetitions": args.repetitions,
+        "reference_seconds": reference_seconds,
+        "cases": results,
+    }
+    if output_path:
+        with open(output_path, "w", encoding="UTF-8") as file:
+            json.dump(report, file, indent=2)
+    if args.update_baseline:
+        with open(baseline_path, "w", encoding="UTF-8") as file:
+            json.dump(report, file, indent=2)
+        print(f"Updated the baseline at {baseline_path}.")
+        return 0
+    try:
+        with open(baseline_path, encoding="UTF-8") as file:
+            baseline = json.load(file)
+    except FileNotFoundError:
+        print(f"There is no baseline at {baseline_path}; create it with --update-baseline.")
+        return 0
+    regressions = get_regressions(report, baseline, args.threshold)
+    if regressions:
+        print(f"\nRegressed by more than {args.threshold:.0%}:", *regressions, sep="\n")
+        return 1
+    print(f"\nNo case regressed by more than {args.threshold:.0%} against the baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
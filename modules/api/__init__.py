@@ -1,3 +1,13 @@
 """__init__.py file for the web API modules."""
 
-__all__ = ["lesson_plan", "lucky_numbers", "steam_market", "substitutions"]
+__all__ = [
+    "async_web",
+    "cache",
+    "lesson_plan",
+    "lucky_numbers",
+    "parsing",
+    "shadow",
+    "steam_market",
+    "substitutions",
+    "timetable",
+]
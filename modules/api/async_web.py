@@ -0,0 +1,345 @@
+"""Asynchronous web request functionality shared by all of the web API modules.
+
+The requests are made using a single keep-alive connection pool per event loop, so that fetching
+data from the external APIs never blocks the Discord client's event loop.
+
+Each host has a circuit breaker. After several consecutive failed requests the circuit opens and
+requests to that host fail immediately, without waiting for a timeout, until the backoff expires.
+A single trial request is then let through, and the others keep failing until it has succeeded.
+
+Conditional requests can be made to resources whose ETag or Last-Modified headers were seen before,
+in which case the server can reply with 304 Not Modified instead of sending the whole page again.
+
+If the `STAND_IN_URL` environment variable is set, all requests are sent to the local stand-in
+server at that URL instead (see `benchmarks.stand_in`), so that the fetch paths can be tested and
+benchmarked offline.
+"""
+
+# Standard library imports
+import asyncio
+import json
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib import parse
+
+# Third-party imports
+import aiohttp
+from corny_commons.util import web
+
+MAX_CONNECTIONS = 20  # Total number of simultaneous connections in the pool
+MAX_CONNECTIONS_PER_HOST = 4  # Maximum number of simultaneous connections to a single host
+KEEP_ALIVE_TIMEOUT = 30  # Seconds; how long an idle connection is kept open for reuse
+REQUEST_TIMEOUT = 10  # Seconds; same as the limit used by `web.make_request()`
+CONNECT_TIMEOUT = 5  # Seconds
+
+DEFAULT_HEADERS = {"Accept-Encoding": "gzip, deflate"}
+
+BREAKER_FAILURE_THRESHOLD = 3  # Consecutive failed requests after which the circuit opens
+BREAKER_INITIAL_BACKOFF = 30  # Seconds; doubles with every failed request after the threshold
+BREAKER_MAX_BACKOFF = 1800  # Seconds
+# Response status codes that indicate a struggling or blocking host (as well as all 5xx codes)
+FAILURE_STATUS_CODES = [403, 408, 429]
+NOT_MODIFIED = 304
+
+# One client session per event loop. The debug CLIs and the synchronous wrappers run their own
+# short-lived event loops, and an aiohttp session cannot be shared between loops.
+_sessions: dict[asyncio.AbstractEventLoop, aiohttp.ClientSession] = {}
+
+
+class CircuitOpenException(web.InvalidResponseException):
+    """Raised when a request is not made because the circuit breaker for its host is open.
+
+    Attributes:
+        host -- the host whose circuit is open
+        retry_after -- the number of seconds until requests to the host are allowed again
+        message -- explanation of the error
+    """
+
+    _MESSAGE_TEMPLATE = "Circuit open for {host}; retrying in {retry_after:.0f}s."
+
+    def __init__(self, host: str, retry_after: float, message: str = _MESSAGE_TEMPLATE):
+        self.host = host
+        self.retry_after = retry_after
+        super().__init__(503)
+        self.message = message.format(host=host, retry_after=retry_after)
+        self.args = (self.message,)
+
+
+class CircuitBreaker:
+    """Custom object type that keeps track of the consecutive failed requests to a single host.
+
+    Once the circuit is open, requests are rejected until the backoff has expired. The next
+    request is then let through as a trial, and the others are rejected until it has finished; if
+    it fails too, the circuit opens again for twice as long. The backoff is randomised so that
+    retries are not synchronised with other clients.
+    """
+
+    def __init__(self, host: str) -> None:
+        self.host: str = host
+        self.failures: int = 0
+        self.open_until: float = 0.0
+        self.is_trial_in_progress: bool = False
+
+    @property
+    def is_open(self) -> bool:
+        """Returns a boolean indicating if requests to the host are currently being rejected."""
+        return time.time() < self.open_until or self.is_trial_in_progress
+
+    def ensure_closed(self) -> bool:
+        """Raises CircuitOpenException if requests to the host are currently being rejected.
+
+        Returns a boolean indicating if the request is let through as the trial request, in which
+        case `end_trial()` must be called once it has finished.
+        """
+        if self.is_open:
+            raise CircuitOpenException(self.host, max(0.0, self.open_until - time.time()))
+        if self.failures < BREAKER_FAILURE_THRESHOLD:
+            return False
+        # The backoff has expired; let only this request through until it has finished
+        self.is_trial_in_progress = True
+        return True
+
+    def end_trial(self) -> None:
+        """Lets the next request through once the trial request has finished, whatever its
+        outcome was, e.g. if it was cancelled before getting a response."""
+        self.is_trial_in_progress = False
+
+    def record_success(self) -> None:
+        """Closes the circuit after a successful request."""
+        if self.failures >= BREAKER_FAILURE_THRESHOLD:
+            web.send_log(f"Circuit for {self.host} closed.", force=True)
+        self.failures = 0
+        self.open_until = 0.0
+
+    def record_failure(self) -> None:
+        """Counts the failed request, opening the circuit if there were too many in a row."""
+        self.failures += 1
+        if self.failures < BREAKER_FAILURE_THRESHOLD:
+            return
+        exponent = self.failures - BREAKER_FAILURE_THRESHOLD
+        backoff = min(BREAKER_MAX_BACKOFF, BREAKER_INITIAL_BACKOFF * 2**exponent)
+        # Equal jitter: wait at least half of the backoff
+        backoff = random.uniform(backoff / 2, backoff)
+        self.open_until = time.time() + backoff
+        web.send_log(
+            f"Circuit for {self.host} opened for {backoff:.0f}s "
+            f"after {self.failures} failed requests.",
+            force=True,
+        )
+
+
+_breakers: dict[str, CircuitBreaker] = {}
+
+# The ETag and Last-Modified headers of the last successful response from each URL
+_validators: dict[str, dict[str, str]] = {}
+
+
+class Response:
+    """Custom object type containing the already-read contents of a web response.
+
+    The attribute names mirror those of `requests.Response` so that the existing code using the
+    synchronous `web.make_request()` works with it without any changes.
+    """
+
+    def __init__(self, url: str, status_code: int, headers: dict, content: bytes) -> None:
+        self.url: str = url
+        self.status_code: int = status_code
+        self.headers: dict[str, str] = headers
+        self.content: bytes = content
+
+    @property
+    def text(self) -> str:
+        """Returns the response content decoded as UTF-8."""
+        return self.content.decode("UTF-8")
+
+    def json(self) -> any:
+        """Returns the response content deserialised from JSON."""
+        return json.loads(self.content)
+
+
+def _get_session() -> aiohttp.ClientSession:
+    """Returns the client session for the running event loop, creating it if necessary."""
+    event_loop = asyncio.get_running_loop()
+    session = _sessions.get(event_loop)
+    if session is None or session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=MAX_CONNECTIONS,
+            limit_per_host=MAX_CONNECTIONS_PER_HOST,
+            keepalive_timeout=KEEP_ALIVE_TIMEOUT,
+        )
+        timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT, connect=CONNECT_TIMEOUT)
+        session = aiohttp.ClientSession(
+            connector=connector, timeout=timeout, headers=DEFAULT_HEADERS
+        )
+        _sessions[event_loop] = session
+    return session
+
+
+def get_request_url(url: str) -> str:
+    """Returns the URL that the request for the given resource should actually be sent to.
+
+    This is the URL itself, unless the stand-in server is in use. Then it is the URL of the
+    resource on the stand-in server, e.g. 'http://127.0.0.1:8780/https/steamcommunity.com/...'.
+    """
+    stand_in_url = os.environ.get("STAND_IN_URL")
+    if not stand_in_url:
+        return url
+    parts = parse.urlsplit(url)
+    query = f"?{parts.query}" if parts.query else ""
+    return f"{stand_in_url.rstrip('/')}/{parts.scheme}/{parts.netloc}{parts.path}{query}"
+
+
+def get_host(url: str) -> str:
+    """Returns the host name of the given URL, e.g. 'www.lo1.gliwice.pl'."""
+    return parse.urlsplit(url).hostname or ""
+
+
+def get_breaker(url: str) -> CircuitBreaker:
+    """Returns the circuit breaker for the host of the given URL."""
+    host = get_host(url)
+    if host not in _breakers:
+        _breakers[host] = CircuitBreaker(host)
+    return _breakers[host]
+
+
+def is_circuit_open(url: str) -> bool:
+    """Returns a boolean indicating if requests to the host of the given URL are being rejected."""
+    return get_breaker(url).is_open
+
+
+def get_conditional_headers(url: str) -> dict[str, str]:
+    """Returns the headers that make a request to the URL conditional on the resource having
+    changed since the last successful response. Empty if no validators are known."""
+    validators = _validators.get(url, {})
+    headers = {}
+    if "ETag" in validators:
+        headers["If-None-Match"] = validators["ETag"]
+    if "Last-Modified" in validators:
+        headers["If-Modified-Since"] = validators["Last-Modified"]
+    return headers
+
+
+def forget_validators(url: str) -> None:
+    """Forgets the validators of the URL so that the next request to it is unconditional."""
+    _validators.pop(url, None)
+
+
+async def make_request(
+    url: str,
+    headers: dict = None,
+    params: dict = None,
+    ignore_request_limit: bool = False,
+    conditional: bool = False,
+) -> Response:
+    """Make an asynchronous web request. Behaves the same as `web.make_request()`.
+
+    Arguments:
+        url -- the url of resource whose data should be requested.
+        headers -- a dictionary containing the header keys and values.
+        params -- a dictionary containing the query string parameters.
+        ignore_request_limit -- a boolean indicating if the 3 second limit should be ignored.
+        conditional -- a boolean indicating if the request should be conditional on the resource
+        having been modified. If it wasn't, the response has the status code 304 and no content.
+
+    Raises:
+        web.TooManyRequestsException if there was more than one request made per 3 seconds.
+        web.InvalidResponseException if the request timed out or if it responds with an error code.
+        CircuitOpenException if there have recently been too many failed requests to the host.
+    """
+    breaker = get_breaker(url)
+    is_trial = breaker.ensure_closed()
+    try:
+        return await _make_request(breaker, url, headers, params, ignore_request_limit, conditional)
+    finally:
+        if is_trial:
+            breaker.end_trial()
+
+
+async def _make_request(
+    breaker: CircuitBreaker,
+    url: str,
+    headers: dict,
+    params: dict,
+    ignore_request_limit: bool,
+    conditional: bool,
+) -> Response:
+    """Makes the request once it has been let through by the circuit breaker of its host."""
+    current_time = time.time()
+    time_passed = current_time - web.TooManyRequestsException.last_request_time
+    if time_passed < web.MAX_REQUEST_COOLDOWN and not ignore_request_limit:
+        raise web.TooManyRequestsException(int(current_time))
+    web.TooManyRequestsException.last_request_time = current_time
+    web.send_log(f"Fetching content from {url} ...", force=True)
+    if conditional:
+        headers = {**(headers or {}), **get_conditional_headers(url)}
+    session = _get_session()
+    try:
+        async with session.get(get_request_url(url), headers=headers, params=params) as res:
+            content = await res.read()
+            response = Response(url, res.status, dict(res.headers), content)
+            if 200 <= res.status < 300 and not params:
+                validators = {key: res.headers.get(key) for key in ("ETag", "Last-Modified")}
+                _validators[url] = {key: val for key, val in validators.items() if val}
+    except asyncio.TimeoutError as timeout_exc:
+        breaker.record_failure()
+        raise web.InvalidResponseException(408) from timeout_exc
+    except aiohttp.ClientError as client_exc:
+        # The connection could not be established or was interrupted
+        breaker.record_failure()
+        raise web.InvalidResponseException(503) from client_exc
+    status = response.status_code
+    if status >= 500 or status in FAILURE_STATUS_CODES:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+    if conditional and status == NOT_MODIFIED:
+        return response
+    if not 200 <= status < 300:
+        raise web.InvalidResponseException(status)
+    return response
+
+
+async def get_html(url: str, ignore_request_limit: bool, conditional: bool = False) -> str:
+    """Same as `make_request()`, but returns the response's decoded HTML content.
+
+    Returns None if the request was conditional and the page has not been modified.
+    """
+    res = await make_request(
+        url, ignore_request_limit=ignore_request_limit, conditional=conditional
+    )
+    if res.status_code == NOT_MODIFIED:
+        return None
+    return res.text.replace("<html><head>", "<html>\n<head>", 1)
+
+
+async def close() -> None:
+    """Closes the client session belonging to the running event loop, if there is one."""
+    session = _sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None and not session.closed:
+        await session.close()
+
+
+async def _run_and_close(coroutine) -> any:
+    """Awaits the coroutine, then closes the session that it may have opened."""
+    try:
+        return await coroutine
+    finally:
+        await close()
+
+
+def run_sync(coroutine) -> any:
+    """Runs the coroutine to completion and returns its result. Used by the synchronous API
+    functions, e.g. in the debug CLIs of each module.
+
+    If this is called from within a running event loop, the coroutine is run in a separate thread
+    with its own event loop, since the running one cannot be re-entered.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        # There is no running event loop in this thread
+        return asyncio.run(_run_and_close(coroutine))
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, _run_and_close(coroutine)).result()
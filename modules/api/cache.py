@@ -0,0 +1,247 @@
+"""Asynchronous counterpart of `file_manager.get_cache()`, used by the web API modules.
+
+Cache refreshes are single-flight: if a cache is already being refreshed when another caller needs
+it refreshed, that caller waits for the refresh in progress and shares its result (or its error)
+instead of fetching and parsing the same page again. If the caller performing the refresh is
+cancelled, one of the waiting callers takes it over.
+
+Callers that do not force an update are never kept waiting if there is a previous copy of the
+cache: while its source's circuit breaker is open, while it is already being refreshed, or if the
+refresh fails, they are given that copy as a `StaleCache` instead.
+
+A refresh callback may raise `CacheUnchanged` if it finds that its source has not changed since the
+cache was saved. The existing cache is then kept as it is and counts as freshly refreshed.
+
+While a separate fetcher process (`modules.fetcher`) is keeping the caches up-to-date, `read_only`
+is set and the caches are only read from the disk. The old cache is then the copy that the same
+consumer, e.g. the substitutions poll, last read, so that changes published by the fetcher can still
+be detected. Reads without a consumer, e.g. by user commands, do not count as having seen a copy.
+A cache that the fetcher has not saved yet raises `CacheNotFoundException` instead of being fetched.
+"""
+
+# Standard library imports
+import asyncio
+import json
+import os
+import time
+
+# Third-party imports
+from corny_commons import file_manager
+from corny_commons.util import web
+
+# Local application imports
+from modules.api import async_web
+
+
+# The refreshes that are currently in progress, keyed by cache name
+_in_flight: dict[str, asyncio.Future] = {}
+
+# How many refreshes were actually performed for each cache, how many callers were instead
+# coalesced into a refresh that was already in progress, and how many were given a stale copy.
+# View with `!exec api.cache.stats`.
+stats: dict[str, dict[str, int]] = {}
+
+# Set while the caches are being refreshed by the fetcher process instead of this one
+read_only: bool = False
+
+# The copy of each cache that was last returned to each consumer while in read-only mode, keyed by
+# the cache name and the consumer
+_last_seen: dict[tuple[str, str], dict] = {}
+
+
+class CacheUnchanged(Exception):
+    """Raised by a cache refresh callback when the source data has not changed since the cache was
+    last saved, so there is nothing to parse or save."""
+
+
+class CacheNotFoundException(web.InvalidResponseException):
+    """Raised in read-only mode when a cache has not been saved yet, since only the fetcher process
+    may fetch the data.
+
+    Attributes:
+        cache_name -- the name of the missing cache
+        message -- explanation of the error
+    """
+
+    _MESSAGE_TEMPLATE = "The {cache_name} cache has not been saved by the fetcher yet."
+
+    def __init__(self, cache_name: str, message: str = _MESSAGE_TEMPLATE):
+        self.cache_name = cache_name
+        super().__init__(503)
+        self.message = message.format(cache_name=cache_name)
+        self.args = (self.message,)
+
+
+class StaleCache(dict):
+    """Custom object type that derives from the `dict` base type.
+
+    Contains a previous copy of a cache that is served because it could not be refreshed.
+    The `age` attribute is the time since the copy was saved, in seconds.
+    """
+
+    def __init__(self, data: dict, age: float) -> None:
+        super().__init__(data)
+        self.age: float = age
+
+
+def _count(cache_name: str, counter: str) -> None:
+    """Increments the given counter for the cache."""
+    cache_stats = stats.setdefault(
+        cache_name, {"refreshes": 0, "coalesced": 0, "stale": 0}
+    )
+    cache_stats[counter] += 1
+
+
+def get_cache_age(cache_name: str) -> float or None:
+    """Returns the time since the cache was last saved in seconds, or None if it doesn't exist."""
+    filepath = os.path.join(file_manager.CACHE_DIRECTORY, f"{cache_name}.json")
+    try:
+        return time.time() - os.path.getmtime(filepath)
+    except OSError:
+        return None
+
+
+def write_cache(cache_name: str, data: dict) -> None:
+    """Same as `file_manager.write_cache()`, but replaces the file atomically so that the bot never
+    reads a cache that the fetcher process is still writing, or vice versa."""
+    os.makedirs(file_manager.CACHE_DIRECTORY, exist_ok=True)
+    filepath = os.path.join(file_manager.CACHE_DIRECTORY, f"{cache_name}.json")
+    temp_filepath = f"{filepath}.{os.getpid()}.tmp"
+    with open(temp_filepath, "w", encoding="UTF-8") as file:
+        json.dump(data, file, indent=2, ensure_ascii=False)
+    os.replace(temp_filepath, filepath)
+
+
+def _touch(cache_name: str) -> None:
+    """Updates the modification time of the cache so that its age starts counting again."""
+    filepath = os.path.join(file_manager.CACHE_DIRECTORY, f"{cache_name}.json")
+    try:
+        os.utime(filepath)
+    except OSError:
+        pass
+
+
+def _serve_stale(cache_name: str, cache: dict, reason: str) -> tuple[dict, dict]:
+    """Returns the previous copy of the cache, marked with its age."""
+    _count(cache_name, "stale")
+    stale_cache = StaleCache(cache, get_cache_age(cache_name) or 0)
+    file_manager.log(
+        f"Serving stale cache for {cache_name} ({stale_cache.age:.0f}s old); {reason}.",
+        filename="bot",
+        force=False,
+    )
+    return stale_cache, stale_cache
+
+
+async def _refresh(cache_name: str, callback_function, old_cache: dict) -> tuple[dict, dict]:
+    """Generates the new cache using the callback, saves it and returns it with the old cache.
+
+    If the callback reports that the source is unchanged, returns the existing cache twice.
+    """
+    try:
+        cache = await callback_function()
+    except CacheUnchanged:
+        if not old_cache:
+            raise RuntimeError(f"There is no cache of {cache_name} to keep.") from None
+        _touch(cache_name)
+        return old_cache, old_cache
+    write_cache(cache_name + "_old", old_cache)
+    write_cache(cache_name, cache)
+    return cache, old_cache
+
+
+async def get_cache(
+    cache_name: str,
+    force_update: bool,
+    callback_function,
+    source_url: str = None,
+    max_age: float = None,
+    consumer: str = None,
+) -> tuple[dict, dict]:
+    """Attempts to get the cache if it exists, is not older than `max_age` and the 'force_update'
+    argument is set to False.
+
+    If the above criteria are not met, the callback coroutine function is awaited and its return
+    value is saved as the new cache. If the cache is already being refreshed, the refresh in
+    progress is awaited instead. In read-only mode, an existing cache is always returned as is,
+    and CacheNotFoundException is raised if there is none.
+
+    Arguments:
+        cache_name -- the filename of the cache without the .json extension.
+        force_update -- a boolean indicating if any existing caches should be updated forcefully.
+        callback_function -- a coroutine function that generates the new cache.
+        source_url -- the URL the data is fetched from, used to check its host's circuit breaker.
+        max_age -- the number of seconds after which the cache is refreshed. Defaults to never.
+        consumer -- the name of the caller that checks the cache for changes in read-only mode, so
+        that other callers reading the cache in the meantime do not hide the changes from it.
+
+    Returns a tuple consisting of the cached data and the old cache (defaults to an empty dict).
+    """
+    cache = file_manager.read_cache(cache_name)
+    file_manager.log(
+        f"Cache for {cache_name} was {'*not* ' * (not cache)}found.",
+        filename="bot",
+        force=False,
+    )
+    if read_only:
+        if get_cache_age(cache_name) is None:
+            raise CacheNotFoundException(cache_name)
+        if consumer is None:
+            # The caller is not interested in changes
+            return cache, cache
+        old_cache = _last_seen.setdefault((cache_name, consumer), cache)
+        if cache == old_cache:
+            # Return the identical object so that callers can tell nothing has changed
+            return old_cache, old_cache
+        _last_seen[cache_name, consumer] = cache
+        return cache, old_cache
+    is_expired = max_age is not None and (get_cache_age(cache_name) or 0) > max_age
+    if not force_update and cache and not is_expired:
+        # The cache has no need to be updated.
+        return cache, cache
+    # Only serve a stale copy to callers who would be satisfied by an existing cache
+    can_serve_stale = not force_update and cache
+
+    event_loop = asyncio.get_running_loop()
+    in_flight = _in_flight.get(cache_name)
+    if in_flight is not None and in_flight.get_loop() is event_loop:
+        if can_serve_stale:
+            return _serve_stale(cache_name, cache, "refresh already in progress")
+        # Another caller is already refreshing this cache; share its result.
+        _count(cache_name, "coalesced")
+        file_manager.log(
+            f"Joining refresh of {cache_name} already in progress.",
+            filename="bot",
+            force=False,
+        )
+        # Waiting does not cancel the refresh if this caller is cancelled
+        await asyncio.wait([in_flight])
+        if in_flight.cancelled():
+            # The caller performing the refresh was cancelled; take over the refresh
+            return await get_cache(
+                cache_name, force_update, callback_function, source_url, max_age, consumer
+            )
+        return in_flight.result()
+    if can_serve_stale and source_url and async_web.is_circuit_open(source_url):
+        return _serve_stale(cache_name, cache, "source circuit is open")
+
+    _count(cache_name, "refreshes")
+    in_flight = _in_flight[cache_name] = event_loop.create_future()
+    try:
+        result = await _refresh(cache_name, callback_function, dict(cache))
+    except Exception as exc:
+        in_flight.set_exception(exc)
+        # Mark the exception as retrieved in case no other callers were waiting for it
+        in_flight.exception()
+        if can_serve_stale and isinstance(exc, web.WebException):
+            return _serve_stale(cache_name, cache, f"refresh failed ({exc})")
+        raise
+    else:
+        in_flight.set_result(result)
+        return result
+    finally:
+        if not in_flight.done():
+            # The refresh was cancelled; let one of the other callers take it over
+            in_flight.cancel()
+        if _in_flight.get(cache_name) is in_flight:
+            del _in_flight[cache_name]
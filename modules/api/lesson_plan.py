@@ -1,32 +1,50 @@
 """Functionality for parsing the data from lo1.gliwice.pl to retrieve lesson plan details."""
 
 # Standard library imports
+import asyncio
+import hashlib
 import json
 import re
+import sys
+import time
 
 # Third-party imports
-from corny_commons import file_manager
+import lxml.html
+from corny_commons import file_manager, util as ccutil
 from corny_commons.util import web
 
 # Local application imports
-from modules import Colour
+from modules import Colour, util
+from modules.api import async_web, cache, parsing, timetable
 from modules.util import OUR_CLASS
 
-PERIOD_PATTERN = re.compile(r"^<td class=\"nr\">(\d\d?)</td>$")
-DURATION_PATTERN = r"^<td class=\"g\">\s?(\d\d?):(\d\d)-\s?(\d\d?):(\d\d)</td>$"
-DURATION_PATTERN = re.compile(DURATION_PATTERN)
+PERIOD_PATTERN = re.compile(r"^\s*(\d\d?)\s*$")
+DURATION_PATTERN = re.compile(r"^\s?(\d\d?):(\d\d)-\s?(\d\d?):(\d\d)$")
 LESSON_PATTERN = (
     r"<span class=\"p\">([^#]+?)(?:-(\d+)/(\d+))?</span>.*?(?:<a .*?class=\"n\">"
     r"(.+?)</a>|<span class=\"p\">(#.+?)</span>) <a .*?class=\"s\">(.+?)</a>"
 )
 LESSON_PATTERN = re.compile(LESSON_PATTERN)
+# Either the start of a table row, or a whole table cell with its tag name, attributes and content
+TABLE_TOKEN_PATTERN = re.compile(
+    r"<tr\b[^>]*>|<(t[dh])\b([^>]*)>([^<]*(?:<(?!/t[dh]>)[^<]*)*)</t[dh]>"
+)
+CLASS_PATTERN = re.compile(r"class=\"([^\"]*)\"")
 
-# Tags that should not increment or decrement a line's tag depth
-IGNORED_TAGS = ["hr", "br"]
+PLAN_TABLE_INDEX = 3  # The lesson plan is in the 3rd table on the page
+PARSER_CHUNK_SIZE = 2 * 1024  # Characters processed at once
 SOURCE_URL = "http://www.lo1.gliwice.pl/wp-content/uploads/static/plan/plany/o{id}.html"
+MAX_CACHE_AGE = 24 * 60 * 60  # Seconds; the lesson plans rarely change
+# Maximum number of lesson plans fetched at once by `sync_lesson_plans()`
+SYNC_CONCURRENCY = async_web.MAX_CONNECTIONS_PER_HOST
+HASHES_CACHE_NAME = "plan_hashes"
+
+# The class list page of the timetable, which links to the plan of each class
+INDEX_URL = "http://www.lo1.gliwice.pl/wp-content/uploads/static/plan/lista.html"
+INDEX_CACHE_NAME = "plan_index"
+PLAN_LINK_PATTERN = re.compile(r"(?:^|/)o(\d+)\.html$")
 
-# Until the end of school year 2022-2023, classes ABC are non-IB and classes DE are IB.
-# Change this in sept 2023 when there are 4 non-IB classes and classes EF are IB.
+# The classes in school year 2022-2023. Only used if the plan index could never be fetched.
 CLASSES_PER_YEAR = {4: 3, 3: 3, 2: 5, 1: 6}
 NUM_IB_CLASSES_PER_YEAR = 2
 IB_FIRST_YEAR = 3
@@ -38,73 +56,146 @@ SUBJECT_NAME_MAPPINGS = {
     "chem.": "chemia",
     "fiz.": "fizyka",
 }
+# The subject name codes, keyed by the names used in the timetable
+_lesson_names: dict[str, str] = {}
+# The content hash of each plan stored in the timetable, keyed by plan ID, and the timetable they
+# were computed for. The saved timetable can be reloaded in read-only mode, which resets them.
+_stored_hashes: dict[int, str] = {}
+_hashed_timetable: timetable.Timetable = None
 
 
-def get_plan_id(input_id: str or int = None) -> int:
-    """Gets the plan ID that is used on the school website of a given class.
+def get_default_plan_index() -> dict[str, int]:
+    """Returns the map of class names to plan IDs derived from `CLASSES_PER_YEAR`.
+
+    This is only used if the plan index has never been successfully fetched.
+    """
+    index: dict[str, int] = {}
+    for year in sorted(CLASSES_PER_YEAR, reverse=True):
+        for letter in range(CLASSES_PER_YEAR[year]):
+            index[f"{year}{chr(letter + ord('a'))}"] = len(index) + 1
+    return index
+
+
+def normalise_class_name(class_name: str) -> str:
+    """Returns the class name in the form used in the plan index, e.g. ' 2A ' -> '2a'."""
+    return class_name.strip().lower()
+
+
+def parse_index(html: str) -> dict[str, int]:
+    """Parses the HTML of the timetable's list page and collects the links to the class plans.
 
     Arguments:
-        class_id -- a string representing the name of the class,
-        or an integer representing the lesson plan ID.
+        html -- a string containing whole HTML code, e.g. from the contents of a web response.
+
+    Returns a dictionary that assigns the plan ID to each class name.
+    """
+    index: dict[str, int] = {}
+    for link in lxml.html.fromstring(html).iter("a"):
+        match = PLAN_LINK_PATTERN.search(link.get("href", ""))
+        if match:
+            index[normalise_class_name(link.text_content())] = int(match.group(1))
+    return index
+
+
+def set_plan_index(index: dict[str, int]) -> None:
+    """Replaces the maps between the class names and plan IDs with those given by the index."""
+    plan_ids = dict(index)
+    # Classes with a suffix, e.g. '4ap', can also be referred to without it if that's unambiguous
+    short_names = [name[:2] for name in index]
+    for name, plan_id in index.items():
+        if short_names.count(name[:2]) == 1:
+            plan_ids.setdefault(name[:2], plan_id)
+    util.plan_ids = plan_ids
+    util.plan_class_names = {plan_id: name for name, plan_id in index.items()}
+
+
+def _ensure_plan_index() -> None:
+    """Loads the plan index from the cache if it hasn't been loaded yet."""
+    if not util.plan_ids:
+        set_plan_index(file_manager.read_cache(INDEX_CACHE_NAME) or get_default_plan_index())
+
+
+async def update_plan_index_async(force_update: bool = False) -> None:
+    """Discovers the plan IDs of all classes from the timetable's list page.
+
+    The index is cached and only fetched again once it's older than a day, so that the classes
+    of each new school year are picked up without any changes to the code.
+
+    Arguments:
+        force_update -- a boolean indicating if the cache should be forcefully updated.
     """
 
-    # LESSON PLANS:
-    # o1 -- 4ap
-    # o2 -- 4bp
-    # o3 -- 4cp
+    async def update_cache_callback() -> dict:
+        html: str = await async_web.get_html(INDEX_URL, ignore_request_limit=True)
+        index = await parsing.run_parser(parse_index, html)
+        if not index:
+            _log("Found no class plans in the plan index; keeping the previous one.")
+            raise cache.CacheUnchanged()
+        return index
 
-    # o4 -- 3a
-    # o5 -- 3b
-    # o6 -- 3c
+    try:
+        index, _ = await cache.get_cache(
+            INDEX_CACHE_NAME,
+            force_update,
+            update_cache_callback,
+            source_url=INDEX_URL,
+            max_age=MAX_CACHE_AGE,
+        )
+    except (web.WebException, RuntimeError) as exc:
+        _log(f"Could not update the plan index: {exc}")
+        _ensure_plan_index()
+    else:
+        set_plan_index(index)
 
-    #  o7 -- 2a
-    #  o8 -- 2b
-    #  o9 -- 2c
-    # o10 -- 2d
-    # o11 -- 2e
 
-    # o12 -- 1a
-    # o13 -- 1b
-    # o14 -- 1c
-    # o15 -- 1d
-    # o16 -- 1e
-    # o17 -- 1f
+def get_plan_id(input_id: str or int = None) -> int:
+    """Gets the plan ID that is used on the school website of a given class.
 
+    Arguments:
+        class_id -- a string representing the name of the class,
+        or an integer representing the lesson plan ID.
+    """
+    _ensure_plan_index()
     # If the input is already an integer, validate it
     if isinstance(input_id, int):
-        if not 1 <= input_id <= 17:
+        if input_id not in util.plan_class_names:
             raise ValueError(f"Invalid integer plan ID: {input_id}.") from None
         return input_id
 
     input_id = OUR_CLASS if input_id is None else input_id
     try:
-        class_year = int(input_id[0])
-    except (ValueError, IndexError) as raw_exc:
-        raise ValueError(f"'{input_id}' does not start with a number.") from raw_exc
-    num_classes_this_year = CLASSES_PER_YEAR.get(class_year)
-    if num_classes_this_year is None:
-        raise ValueError(f"Year {class_year} is an invalid class year.")
-    try:
-        class_letter = input_id[1].lower()
-    except IndexError as raw_exc:
-        raise ValueError(
-            f"Missing class letter in class name '{input_id}'."
-        ) from raw_exc
-    class_letters = [chr(letter + ord("a")) for letter in range(num_classes_this_year)]
+        return util.plan_ids[normalise_class_name(input_id)]
+    except KeyError:
+        raise ValueError(f"There is no lesson plan for class '{input_id}'.") from None
+
+
+def get_plan_ids() -> list[int]:
+    """Returns a list of the plan IDs of all the classes in the school."""
+    _ensure_plan_index()
+    return sorted(util.plan_class_names)
+
+
+def is_timetable_complete() -> bool:
+    """Checks if the lesson plans of all classes in the plan index are in the school-wide
+    timetable, i.e. if it can be used to answer questions about the whole school."""
+    school_timetable = timetable.get_timetable()
+    return all(plan_id in school_timetable for plan_id in get_plan_ids())
 
-    try:
-        class_id = class_letters.index(class_letter) + 1
-    except ValueError as raw_exc:
-        msg = f"Invalid class letter: there is no class '{class_letter}' in year {class_year}."
-        raise ValueError(msg) from raw_exc
 
-    # This is not an IB class
-    for year in range(4, class_year, -1):
-        # Add the number of classes each year before the current class
-        class_id += CLASSES_PER_YEAR[year]
+def get_dp_times_plan_id() -> int:
+    """Returns the plan ID of the class whose period times are used for the DP lesson plan, which
+    has no page of its own. This is the last class in the plan index, since the IDs of the classes
+    change with each school year."""
+    return get_plan_ids()[-1]
 
-    # Recursive call to validate the plan ID integer
-    return get_plan_id(class_id)
+
+def get_class_name(plan_id: int) -> str:
+    """Gets the name of the class with the given lesson plan ID, e.g. 7 -> '2a'.
+
+    Arguments:
+        plan_id -- the lesson plan ID integer.
+    """
+    return util.plan_class_names[get_plan_id(plan_id)]
 
 
 def get_plan_link(class_id: str or int) -> str:
@@ -117,6 +208,149 @@ def get_plan_link(class_id: str or int) -> str:
     return SOURCE_URL.format(id=get_plan_id(class_id))
 
 
+def get_lesson_name(lesson_name: str) -> str:
+    """Returns the code used by the bot for the subject name used in the timetable."""
+    if lesson_name in _lesson_names:
+        return _lesson_names[lesson_name]
+    mappings = (
+        ("r_j.", "j."),  # Remove the "r_" prefix for extended language classes
+        (" DW", ""),  # Remove "DW" (stands for "dwujęzyczne"; taught in two languages)
+        ("j. ", "j."),  # Remove trailing spaces
+        ("r_", "r-"),  # Replace '_' with '-' to improve Discord markdown formatting
+        (" ", "-"),  # Replace whitespaces with hyphens so the code is one word
+    )
+    name: str = lesson_name
+    for mapping in mappings:
+        name = name.replace(*mapping)
+    # Edge case mappings
+    name = SUBJECT_NAME_MAPPINGS.get(name, name).lower()
+    _lesson_names[lesson_name] = name
+    return name
+
+
+def parse_cell(cell_class: str, content: str) -> any:
+    """Extracts the data from a given table cell.
+
+    Arguments:
+        cell_class -- the value of the cell's class attribute, e.g. 'nr'.
+        content -- the HTML code inside the cell.
+    """
+    if cell_class == "nr":
+        # Cell containing the lesson period number
+        return int(PERIOD_PATTERN.match(content).groups()[-1])
+    if cell_class == "g":
+        # Cell containing the lesson period start hour, start minute, end hour and end minute
+        # e.g. [8, 0, 8, 45] corresponds to the lesson during 08:00 - 08:45
+        times = tuple(int(time) for time in DURATION_PATTERN.match(content).groups())
+        return times[:2], times[2:]
+    # Cell containing lesson information for a given period
+    lessons: list[dict[str, str]] = []
+    for match in LESSON_PATTERN.findall(content):
+        lesson_name, group, groups, teacher, code, room_id = match
+        if group:
+            if int(groups) == 5:
+                group = ["RB", "RCH", "RH", "RG", "RF"][int(group) - 1]
+        else:
+            # Group is not specified in timetable
+            if code:
+                # If the room code is specified, use that instead.
+                group = code.lstrip("#")
+            elif lesson_name == "religia":
+                # If the current lesson is Religious Studies, use that code.
+                group = "rel"
+            else:
+                # Set group to 'grupa_0' (whole class).
+                group = "0"
+        lesson = {"name": get_lesson_name(lesson_name), "group": "grupa_" + group}
+        lesson["room_id"] = room_id
+        if teacher:
+            # Add the teacher to the returned lesson info if they are specified
+            lesson["teacher"] = teacher
+        lessons.append(lesson)
+    return lessons
+
+
+class PlanParser:
+    """Custom object type that parses a lesson plan page incrementally, as it is fed in chunks.
+
+    The page is skipped up to the lesson plan table, whose rows are then parsed as soon as they are
+    complete. The parser is finished once the table is closed, so the rest of the page is ignored.
+    Unlike parsing the page line by line, this does not depend on how the HTML is line-wrapped.
+    """
+
+    def __init__(self) -> None:
+        self._buffer: str = ""
+        self._seen_tables: int = 0
+        self._seen_rows: int = 0
+        self.headers: list[str] = []
+        self.data: dict[str, list[list[dict[str, str]]]] = {}
+        self.finished: bool = False
+        self.closed: bool = False
+
+    def feed(self, chunk: str) -> None:
+        """Parses the next part of the page."""
+        if self.finished:
+            return
+        self._buffer = self._buffer + chunk if self._buffer else chunk
+        position = 0
+        while self._seen_tables < PLAN_TABLE_INDEX:
+            position = self._buffer.find("<table", position)
+            if position == -1:
+                # Keep the end of the chunk in case it ends with part of a table tag
+                self._buffer = self._buffer[-len("<table") + 1 :]
+                return
+            self._seen_tables += 1
+            position += len("<table")
+        table_end = self._buffer.find("</table>", position)
+        if table_end != -1:
+            self._parse_rows(position, table_end)
+            self._buffer = ""
+            self.finished = True
+            return
+        # Leave the last row in the buffer if it is not complete yet
+        rows_end = self._buffer.rfind("</tr>", position)
+        if rows_end != -1:
+            rows_end += len("</tr>")
+            self._parse_rows(position, rows_end)
+            position = rows_end
+        self._buffer = self._buffer[position:]
+
+    def _parse_rows(self, start: int, end: int) -> None:
+        """Collects the data from the complete rows of the lesson plan table in the buffer.
+
+        Arguments:
+            start -- the index in the buffer at which the rows start.
+            end -- the index in the buffer at which the rows end.
+        """
+        column_number = 0
+        for token in TABLE_TOKEN_PATTERN.finditer(self._buffer, start, end):
+            tag_name, attributes, content = token.groups()
+            if tag_name is None:
+                # Start of a new row
+                self._seen_rows += 1
+                column_number = 0
+            elif tag_name == "th":
+                if self._seen_rows == 1:
+                    self.headers.append(content)
+            else:
+                weekday = self.headers[column_number]
+                column_number += 1
+                cell_class = CLASS_PATTERN.search(attributes)
+                cell_data = parse_cell(cell_class and cell_class.group(1), content)
+                self.data.setdefault(weekday, []).append(cell_data)
+
+    def close(self) -> dict[str, list[list[dict[str, str]]]]:
+        """Returns the collected timetable data. Can be called more than once."""
+        if self.closed:
+            return self.data
+        self.closed = True
+        # Add a timetable entry that is not present in the online lesson plan
+        if "Godz" in self.data and isinstance(self.data["Godz"], list):
+            # Lesson period 10 from 16:10 - 16:55
+            self.data["Godz"].append([[16, 10], [16, 55]])
+        return self.data
+
+
 def parse_html(html: str) -> dict[str, list[list[dict[str, str]]]]:
     """Parses the HTML and finds a specific table, then collects the timetable data from it.
 
@@ -126,133 +360,20 @@ def parse_html(html: str) -> dict[str, list[list[dict[str, str]]]]:
     Returns a dictionary that assigns a list of lessons (lesson, group, room_id, [teacher])
     to each weekday name.
     """
-    tag_index = seen_tables = row_number = column_number = 0
-    headers = []
-    data: dict[str, list[list[dict[str, str]]]] = {}
-
-    def extract_regex(raw_line: str) -> any:
-        """Extracts the data from a given table row."""
-
-        # Return an empty list if the current cell is empty
-        if raw_line == '<td class="l">&nbsp;</td>':
-            return []
-        if raw_line.startswith('<td class="nr">'):
-            # Row containing the lesson period number
-            return int(PERIOD_PATTERN.match(raw_line).groups()[-1])
-        if raw_line.startswith('<td class="g">'):
-            # Row containing the lesson period start hour, start minute, end hour and end minute
-            # e.g. [8, 0, 8, 45] corresponds to the lesson during 08:00 - 08:45
-            times = tuple(
-                int(time) for time in DURATION_PATTERN.match(raw_line).groups()
-            )
-            return times[:2], times[2:]
-            # Don't use below code since the timetable has since been updated to be accurate.
-
-            # Check if the lesson start hour is less than 12:00 (i.e. old timetable still relevant)
-            # lesson_start_hour = times[0]
-            # if lesson_start_hour < 12:
-            #     return times[:2], times[2:]
-            # The lesson is after or 12:00.
-            # We must manually change the returned values since the timetable is not up-to-date.
-            # After 12:00, the breaks last 5 minutes instead of 10.
-            # new_times = {
-            #     12: ((12, 50), (13, 35)),
-            #     13: ((13, 40), (14, 25)),
-            #     14: ((14, 30), (15, 15)),
-            #     15: ((15, 20), (16, 5)),
-            # }
-            # return new_times[lesson_start_hour]
-        # Row containing lesson information for a given period
-        tmp: list[dict[str, str]] = []
-        for match in LESSON_PATTERN.findall(raw_line):
-            lesson_name, group, groups, teacher, code, room_id = match
-            if group:
-                if int(groups) == 5:
-                    group = ["RB", "RCH", "RH", "RG", "RF"][int(group) - 1]
-            else:
-                # Group is not specified in timetable
-                if code:
-                    # If the room code is specified, use that instead.
-                    group = code.lstrip("#")
-                elif lesson_name == "religia":
-                    # If the current lesson is Religious Studies, use that code.
-                    group = "rel"
-                else:
-                    # Set group to 'grupa_0' (whole class).
-                    group = "0"
-            mappings = (
-                ("r_j.", "j."),  # Remove the "r_" prefix for extended language classes
-                (
-                    " DW",
-                    "",
-                ),  # Remove "DW" (stands for "dwujęzyczne"; taught in two languages)
-                ("j. ", "j."),  # Remove trailing spaces
-                (
-                    "r_",
-                    "r-",
-                ),  # Replace '_' with '-' to improve Discord markdown formatting
-                (" ", "-"),  # Replace whitespaces with hyphens so the code is one word
-            )
-            name: str = lesson_name
-            for mapping in mappings:
-                name = name.replace(*mapping)
-            # Edge case mappings
-            name = SUBJECT_NAME_MAPPINGS.get(name, name)
-            tmp.append(
-                {"name": name.lower(), "group": "grupa_" + group, "room_id": room_id}
-            )
-            if teacher:
-                # Add the teacher to the returned lesson info if they are specified
-                tmp[-1]["teacher"] = teacher
-        return tmp
-
-    # Go through each line in the inputted HTML
-    for row in html.splitlines():
-        # Increment the tag depth if the line introduces a new tag
-        # Decremenet the tag depth if the line contains a closing tag
-        # Ignore tags like '<hr>', '<br>' that are defined above
-        tag_index += (
-            row.count("<")
-            - 2 * row.count("</")
-            - sum([row.count(f"<{tag}>") for tag in IGNORED_TAGS])
-        )
-        if "<table" in row:
-            # Increment the number of tables that have been met so far
-            seen_tables += row.count("<table")
-        # The table containing the lesson plans is the 3rd table
-        if seen_tables == 3:
-            if row == "<tr>":
-                row_number += 1
-                column_number = 0
-                continue
-            if row_number == 1 and row.startswith("<th>"):
-                headers.append(row.lstrip("<th>").rstrip("</th>"))
-            elif row.startswith("<td"):
-                weekday = headers[column_number]
-                column_number += 1
-                if weekday not in data:
-                    data[weekday] = []
-                data[weekday].append(extract_regex(row))
-    # Report summary of scraped data
-    # for key in data:
-    #     _log(f"{key}: {len(data[key])}")
-    #     if key in ["Nr", "Godz"]:
-    #         continue
-    #     for period, lessons in enumerate(data[key]):
-    #         _log(f"    period {period}: {len(lessons)} lesson(s)")
-
-    # Add a timetable entry that is not present in the online lesson plan
-    if "Godz" in data and isinstance(data["Godz"], list):
-        # Lesson period 10 from 16:10 - 16:55
-        data["Godz"].append([[16, 10], [16, 55]])
-    return data
+    parser = PlanParser()
+    for start in range(0, len(html), PARSER_CHUNK_SIZE):
+        parser.feed(html[start : start + PARSER_CHUNK_SIZE])
+        if parser.finished:
+            # Don't go through the rest of the page
+            break
+    return parser.close()
 
 
-def get_lesson_plan(
+async def get_lesson_plan_async(
     class_id=OUR_CLASS, force_update: bool or None = False
-) -> tuple[dict, bool]:
+) -> tuple[dict, dict]:
     """Gets the lesson plan for a given class. Returns a tuple containing the data itself
-    and a boolean indicating if the cache already existed.
+    and the old cached data.
 
     Arguments:
         `class_id` -- the lesson plan ID integer, or a string representing the name of the class.
@@ -263,25 +384,174 @@ def get_lesson_plan(
     """
     plan_id = get_plan_id(class_id)
 
-    def update_cache_callback() -> dict:
+    async def update_cache_callback() -> dict:
         ignore_limit: bool = force_update or force_update is None
         plan_link: str = get_plan_link(plan_id)
-        html: str = web.get_html(plan_link, ignore_request_limit=ignore_limit)
-        return parse_html(html)
+        html: str = await async_web.get_html(plan_link, ignore_request_limit=ignore_limit)
+        return await parsing.run_parser(parse_html, html)
 
     log_msg = f"Getting lesson plan with ID {plan_id} for class '{class_id}' ({force_update=}) ..."
     _log(log_msg)
-    return file_manager.get_cache(
-        f"plan_{plan_id}", force_update, update_cache_callback
+    new_plan, old_plan = await cache.get_cache(
+        f"plan_{plan_id}",
+        force_update,
+        update_cache_callback,
+        source_url=SOURCE_URL,
+        max_age=MAX_CACHE_AGE,
     )
+    update_timetable(plan_id, new_plan)
+    return new_plan, old_plan
 
 
-def get_lesson_plan_dp():
+def update_timetable(plan_id: int, plan: dict, save: bool = True) -> None:
+    """Stores the lesson plan in the school-wide timetable if it differs from the stored one.
+
+    The contents are compared rather than whether the plan was refreshed, since in read-only mode
+    the plans are refreshed by the fetcher process and are only ever read from the cache here.
+
+    Arguments:
+        plan_id -- the lesson plan ID integer.
+        plan -- the parsed lesson plan.
+        save -- a boolean indicating if the saved timetable should be updated when the plan changed,
+        so that it stays in line with the cache file.
+    """
+    global _hashed_timetable  # pylint: disable=global-statement
+    if not plan:
+        return
+    school_timetable = timetable.get_timetable()
+    if school_timetable is not _hashed_timetable:
+        _stored_hashes.clear()
+        _hashed_timetable = school_timetable
+    if plan_id in school_timetable and plan_id not in _stored_hashes:
+        _stored_hashes[plan_id] = get_plan_hash(school_timetable.get_plan(plan_id))
+    plan_hash = get_plan_hash(plan)
+    if _stored_hashes.get(plan_id) == plan_hash:
+        return
+    school_timetable.set_plan(plan_id, plan)
+    _stored_hashes[plan_id] = plan_hash
+    if save and not cache.read_only:
+        timetable.save()
+
+
+def get_plan_hash(plan: dict) -> str:
+    """Returns the hash of the parsed lesson plan data, which is used to detect timetable changes.
+
+    The parsed data is hashed rather than the HTML since the generated pages also contain
+    information that changes without the timetable itself changing.
+    """
+    serialised = json.dumps(plan, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(serialised.encode("UTF-8")).hexdigest()
+
+
+async def sync_lesson_plan(plan_id: int, hashes: dict[str, str]) -> bool:
+    """Refreshes the cache of a single lesson plan using a conditional request.
+
+    Arguments:
+        plan_id -- the lesson plan ID integer.
+        hashes -- the dictionary containing the content hash of each plan, which is updated.
+
+    Returns a boolean indicating if the timetable has changed since the plan was last synced.
+    """
+    cache_name = f"plan_{plan_id}"
+    plan_link: str = get_plan_link(plan_id)
+
+    async def update_cache_callback() -> dict:
+        cached_plan: dict = file_manager.read_cache(cache_name)
+        known_hash = hashes.get(str(plan_id))
+        if known_hash is None and cached_plan:
+            known_hash = hashes[str(plan_id)] = get_plan_hash(cached_plan)
+        # Only make the request conditional if there is a cache to fall back on
+        html = await async_web.get_html(
+            plan_link, ignore_request_limit=True, conditional=bool(cached_plan)
+        )
+        if html is None:
+            raise cache.CacheUnchanged()
+        plan = await parsing.run_parser(parse_html, html)
+        plan_hash = get_plan_hash(plan)
+        if plan_hash == known_hash:
+            raise cache.CacheUnchanged()
+        hashes[str(plan_id)] = plan_hash
+        return plan
+
+    new_plan, old_plan = await cache.get_cache(
+        cache_name, True, update_cache_callback, source_url=SOURCE_URL, consumer="sync"
+    )
+    # The timetable is saved once all of the plans are synced
+    update_timetable(plan_id, new_plan, save=False)
+    return new_plan is not old_plan
+
+
+async def sync_lesson_plans(plan_ids: list[int] = None) -> dict[str, list[int]]:
+    """Concurrently refreshes the lesson plans of all classes (or the given ones).
+
+    Each plan is fetched using a conditional request, so plans whose pages have not been modified
+    only cost a 304 response. The content hash of each plan is saved so that the plans whose
+    timetables have changed since the last sync can be reported.
+
+    Arguments:
+        plan_ids -- the IDs of the lesson plans to sync. Defaults to all of the school's classes.
+
+    Returns a dictionary containing the lists of plan IDs that were 'changed', 'unchanged' and
+    that 'failed' to sync.
+    """
+    if plan_ids is None:
+        await update_plan_index_async()
+        plan_ids = get_plan_ids()
+    hashes: dict[str, str] = file_manager.read_cache(HASHES_CACHE_NAME)
+    semaphore = asyncio.Semaphore(SYNC_CONCURRENCY)
+
+    async def sync_with_limit(plan_id: int) -> bool:
+        async with semaphore:
+            return await sync_lesson_plan(plan_id, hashes)
+
+    start_time = time.perf_counter()
+    results = await asyncio.gather(
+        *[sync_with_limit(plan_id) for plan_id in plan_ids], return_exceptions=True
+    )
+    report: dict[str, list[int]] = {"changed": [], "unchanged": [], "failed": []}
+    for plan_id, result in zip(plan_ids, results):
+        if isinstance(result, Exception):
+            exc: str = ccutil.format_exception_info(result)
+            _log(f"Could not sync lesson plan {plan_id}:\n{exc}")
+            report["failed"].append(plan_id)
+        elif isinstance(result, BaseException):
+            # The sync was cancelled
+            raise result
+        else:
+            report["changed" if result else "unchanged"].append(plan_id)
+    if not cache.read_only:
+        # Otherwise the hashes and the timetable are kept by the fetcher process
+        cache.write_cache(HASHES_CACHE_NAME, hashes)
+        timetable.save()
+    elapsed = time.perf_counter() - start_time
+    _log(
+        f"Synced {len(plan_ids)} lesson plans in {elapsed:.2f}s. Changed: "
+        f"{[get_class_name(plan_id) for plan_id in report['changed']]}, "
+        f"failed: {report['failed']}."
+    )
+    return report
+
+
+def get_lesson_plan(
+    class_id=OUR_CLASS, force_update: bool or None = False
+) -> tuple[dict, dict]:
+    """Synchronous version of `get_lesson_plan_async()`."""
+    return async_web.run_sync(get_lesson_plan_async(class_id, force_update))
+
+
+async def get_lesson_plan_dp_async():
     """Reads the lesson plan for the DP class."""
     with open("plan-dp1.json", "r", encoding="utf-8") as file:
         lesson_plan: list[list[dict]] = json.load(file)
-    random_plan, _ = get_lesson_plan(17)
-    return {"times": random_plan["Godz"], "weekdays": lesson_plan}
+    times_plan_id = get_dp_times_plan_id()
+    await get_lesson_plan_async(times_plan_id)
+    times = timetable.get_timetable().period_times[times_plan_id]
+    return {"times": times, "weekdays": lesson_plan}
+
+
+def get_lesson_plan_dp():
+    """Synchronous version of `get_lesson_plan_dp_async()`."""
+    return async_web.run_sync(get_lesson_plan_dp_async())
 
 
 def _log(*args):
@@ -292,6 +562,7 @@ def _log(*args):
 
 
 if __name__ == "__main__":
+    # Use `python -m modules.api.lesson_plan --sync` to sync the lesson plans of all classes
     colours = vars(Colour)
     for col in colours:
         if not col.startswith("_") and col is not None:
@@ -301,6 +572,10 @@ if __name__ == "__main__":
         f"{Colour.OKBLUE}Enter {Colour.OKGREEN}{Colour.UNDERLINE}class name{Colour.ENDC}"
         f"{Colour.OKBLUE}...\n{Colour.WARNING}> "
     )
+    if "--sync" in sys.argv:
+        sync_report = async_web.run_sync(sync_lesson_plans())
+        _log(json.dumps(sync_report))
+        sys.exit()
     try:
         while True:
             try:
@@ -5,8 +5,12 @@ from datetime import date, datetime
 import json
 
 # Third-party imports
+from corny_commons import file_manager
 from corny_commons.util import web
 
+# Local application imports
+from modules.api import async_web, cache
+
 # Data JSON structure:
 # {
 #     "date": "dd/mm/YYYY",
@@ -18,9 +22,10 @@ cached_data: dict[str, date or list[int or str]] = {}
 
 MAX_CACHE_AGE = 1  # Days
 SOURCE_URL = "https://europe-west1-suilo-page.cloudfunctions.net/app/api/luckyNumbers/v2"
+CACHE_NAME = "lucky_numbers"
 
 
-def get_lucky_numbers() -> dict[str, str or list[int or str]]:
+async def get_lucky_numbers_async() -> dict[str, str or list[int or str]]:
     """Updates the cache if it is outdated then returns it."""
     current_date: date = date.today()
     try:
@@ -30,27 +35,50 @@ def get_lucky_numbers() -> dict[str, str or list[int or str]]:
     except (KeyError, ValueError):
         # If the cache is empty or too old
         try:
-            update_cache()
+            await update_cache_async()
         except web.InvalidResponseException:
             # Do not update the cache if new data could not be fetched
             pass
     return cached_data
 
 
-def update_cache() -> dict[str, str or list[int or str]]:
+def get_lucky_numbers() -> dict[str, str or list[int or str]]:
+    """Synchronous version of `get_lucky_numbers_async()`."""
+    return async_web.run_sync(get_lucky_numbers_async())
+
+
+async def update_cache_async() -> dict[str, str or list[int or str]]:
     """Updates the cache with current data from the SU ILO website.
 
     Returns the old cache so that it can be compared with the new one.
     """
     old_cache = dict(cached_data or {})
+    if cache.read_only:
+        # The data is fetched by the fetcher process; read the copy it has saved
+        new_cache = file_manager.read_cache(CACHE_NAME) or serialise(old_cache)
+        cached_data.clear()
+        load_data(new_cache)
+        return old_cache
     cached_data.clear()
-    res = web.make_request(SOURCE_URL, ignore_request_limit=True)
-    cached_data.update(res.json())
+    res = await async_web.make_request(SOURCE_URL, ignore_request_limit=True)
+    load_data(res.json())
+    cache.write_cache(CACHE_NAME, serialise())
+    return old_cache
+
+
+def load_data(data: dict) -> None:
+    """Updates the cached data with the given data, as found in the API response or in the cache
+    file."""
+    cached_data.update(data)
     # If the date string is present in the dictionary, convert it into a date object.
-    if cached_data["date"]:
+    if isinstance(cached_data.get("date"), str) and cached_data["date"]:
         data_timestamp = datetime.strptime(cached_data["date"], "%Y-%m-%d")
         cached_data["date"] = data_timestamp.date()
-    return old_cache
+
+
+def update_cache() -> dict[str, str or list[int or str]]:
+    """Synchronous version of `update_cache_async()`."""
+    return async_web.run_sync(update_cache_async())
 
 
 def serialise(data: dict = None, pretty: bool = False) -> dict or str:
@@ -0,0 +1,132 @@
+"""Functionality for running the HTML parsers of the web API modules in a process pool.
+
+Parsing a large page takes long enough to delay the Discord gateway heartbeats if it is done on the
+event loop thread, especially when many lesson plans are refreshed at once. The parsers are pure
+functions of the raw HTML that return plain dictionaries, so they can instead be run in separate
+processes. If the pool cannot be started or its processes crash, the parsers are run inline.
+
+The number of processes can be set with the `PARSER_PROCESSES` environment variable; setting it to
+0 disables the pool so that all parsing is done inline.
+"""
+
+# Standard library imports
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Third-party imports
+from corny_commons import file_manager
+
+# Local application imports
+from modules.api import cache
+
+# Spawned rather than forked, since forking a process with a running event loop and other threads
+# is unsafe.
+START_METHOD = "spawn"
+
+_executor: ProcessPoolExecutor = None
+# Set if the pool could not be used, after which all parsing is done inline
+_disabled: bool = False
+
+# How many pages were parsed in the process pool and how many inline.
+# View with `!exec api.parsing.stats`.
+stats: dict[str, int] = {"pool": 0, "inline": 0}
+
+
+def get_max_workers() -> int:
+    """Returns the number of processes in the pool; by default, the number of available cores."""
+    try:
+        return int(os.environ["PARSER_PROCESSES"])
+    except (KeyError, ValueError):
+        pass
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        # Not available on this platform
+        return os.cpu_count() or 1
+
+
+def _get_executor() -> ProcessPoolExecutor or None:
+    """Returns the process pool, starting it if necessary. Returns None if it is disabled."""
+    global _executor, _disabled  # pylint: disable=global-statement
+    if _disabled:
+        return None
+    if _executor is None:
+        max_workers = get_max_workers()
+        if max_workers < 1:
+            _disabled = True
+            return None
+        try:
+            context = multiprocessing.get_context(START_METHOD)
+            _executor = ProcessPoolExecutor(
+                max_workers, mp_context=context, initializer=_init_worker
+            )
+        except (OSError, ValueError, NotImplementedError) as exc:
+            _log(f"Could not start the parser process pool; parsing inline. ({exc})")
+            _disabled = True
+            return None
+    return _executor
+
+
+def _init_worker() -> None:
+    """Disables the pool in its own processes, so that a parser that itself calls `run_parser()`,
+    e.g. to get a lesson plan, parses inline instead of starting a nested pool.
+
+    The caches are only read in the pool processes, and a missing cache raises an exception
+    instead of being fetched. Spawned processes do not inherit the state of the bot process, so
+    they rely on the saved caches and timetable instead.
+    """
+    global _disabled  # pylint: disable=global-statement
+    _disabled = True
+    cache.read_only = True
+
+
+def is_pool_available() -> bool:
+    """Checks if the parsers are run in the process pool rather than inline."""
+    return _get_executor() is not None
+
+
+async def run_parser(parser_function, *args, inline_fallback: bool = True) -> any:
+    """Runs the parser function with the given arguments in the process pool and returns its
+    result. Falls back to running it inline if the pool is unavailable.
+
+    Arguments:
+        parser_function -- a module-level function, so that it can be sent to the pool processes.
+        args -- the arguments to call the function with, usually the raw HTML.
+        inline_fallback -- a boolean indicating if the function may be run inline on the event loop
+        thread. If not, RuntimeError is raised if the pool is unavailable.
+    """
+    global _executor  # pylint: disable=global-statement
+    executor = _get_executor()
+    if executor is not None:
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(
+                executor, parser_function, *args
+            )
+        except (BrokenProcessPool, OSError) as exc:
+            # A process crashed or could not be started; a new pool is started next time
+            _log(f"Parser process pool failed; parsing inline. ({exc!r})")
+            executor.shutdown(wait=False)
+            if _executor is executor:
+                _executor = None
+        else:
+            stats["pool"] += 1
+            return result
+    if not inline_fallback:
+        raise RuntimeError("The parser process pool is unavailable.")
+    stats["inline"] += 1
+    return parser_function(*args)
+
+
+def shutdown() -> None:
+    """Stops the processes of the pool, if it was started."""
+    global _executor  # pylint: disable=global-statement
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def _log(*args) -> None:
+    file_manager.log(*args, filename="bot")
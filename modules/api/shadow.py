@@ -0,0 +1,230 @@
+"""Functionality for shadow-parsing the fetched pages with alternate or candidate parsers.
+
+When shadow parsing is enabled, each page that is fetched is also parsed in the background by the
+shadow parsers, in the parser process pool. Only the primary parser's result is ever used by the
+bot; the shadow parsers' results are compared with it, and the time and memory that each parser
+needed are recorded in a rolling report. This way a parser can be switched or optimised with
+evidence from production, without risking the announcements.
+
+The shadow parsers are set with the `SHADOW_PARSERS` environment variable, as a comma-separated list
+of the full names of the parser functions, e.g. 'modules.api.substitutions.parse_html'. Shadow
+parsing is disabled if it is unset or empty, and while the parsers are run inline rather than in the
+process pool.
+"""
+
+# Standard library imports
+import asyncio
+import ctypes
+import gc
+import importlib
+import os
+import time
+from collections import deque
+from datetime import datetime
+
+# Third-party imports
+from corny_commons import file_manager, util as ccutil
+
+# Local application imports
+from modules.api import parsing
+
+REPORT_SIZE = 50  # The number of the latest comparisons kept in the report
+MAX_DIFFERENCES = 20  # The maximum number of differences recorded for each comparison
+
+# The latest comparisons, oldest first. View with `!exec api.shadow.report`.
+report: deque[dict[str, any]] = deque(maxlen=REPORT_SIZE)
+# The totals for each parser, keyed by its full name. View with `!exec api.shadow.stats`.
+stats: dict[str, dict[str, float]] = {}
+
+# References to the running shadow parses, so that they are not garbage-collected
+_tasks: set[asyncio.Task] = set()
+
+
+def get_shadow_parsers() -> list[str]:
+    """Returns the full names of the shadow parsers from the `SHADOW_PARSERS` variable."""
+    names = os.environ.get("SHADOW_PARSERS", "").split(",")
+    return [name.strip() for name in names if name.strip()]
+
+
+def resolve_parser(full_name: str):
+    """Returns the parser function with the given full name, e.g. 'package.module.function'.
+
+    Raises ImportError or AttributeError if there is no such function.
+    """
+    module_name, function_name = full_name.rsplit(".", maxsplit=1)
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+def get_memory_status(field_name: str) -> int or None:
+    """Returns the value of the given field of the process' memory status in KiB, e.g. 'VmRSS'.
+
+    Returns None if it is not available on this platform.
+    """
+    try:
+        with open("/proc/self/status", encoding="UTF-8") as file:
+            for line in file:
+                if line.startswith(field_name + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def reset_peak_memory() -> None:
+    """Returns the freed memory to the system and resets the process' peak RSS to its current RSS,
+    so that the next peak can be attributed to the next parse. Does nothing on other platforms."""
+    gc.collect()
+    try:
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+        with open("/proc/self/clear_refs", "w", encoding="UTF-8") as file:
+            file.write("5")
+    except (OSError, AttributeError):
+        pass
+
+
+def measure_parser(full_name: str, html: str) -> tuple[any, dict[str, float]]:
+    """Parses the page with the given parser.
+
+    Returns a tuple consisting of the parser's result and its measurements: the time it took in
+    seconds and by how much it increased the peak RSS in KiB (None if that is unavailable).
+    """
+    parser = resolve_parser(full_name)
+    reset_peak_memory()
+    rss_before = get_memory_status("VmRSS")
+    start_time = time.perf_counter()
+    result = parser(html)
+    seconds = time.perf_counter() - start_time
+    peak_rss = get_memory_status("VmHWM")
+    peak_rss_increase = None if None in (rss_before, peak_rss) else peak_rss - rss_before
+    return result, {"seconds": seconds, "peak_rss_kib": peak_rss_increase}
+
+
+def get_differences(expected: any, actual: any, path: str = "$") -> list[str]:
+    """Returns a description of each structural difference between the two parsing results.
+
+    Arguments:
+        expected -- the primary parser's result.
+        actual -- the shadow parser's result.
+        path -- the location of the compared values in the results, e.g. "$['lessons'][2]".
+    """
+    if isinstance(expected, dict) and isinstance(actual, dict):
+        differences = [f"{path}[{key!r}] missing" for key in expected if key not in actual]
+        differences += [f"{path}[{key!r}] added" for key in actual if key not in expected]
+        for key in expected.keys() & actual.keys():
+            differences += get_differences(expected[key], actual[key], f"{path}[{key!r}]")
+        return differences
+    if isinstance(expected, (list, tuple)) and isinstance(actual, (list, tuple)):
+        differences = []
+        if len(expected) != len(actual):
+            differences.append(f"{path} has {len(actual)} items instead of {len(expected)}")
+        for index, (expected_item, actual_item) in enumerate(zip(expected, actual)):
+            differences += get_differences(expected_item, actual_item, f"{path}[{index}]")
+        return differences
+    if type(expected) is not type(actual):
+        return [f"{path} is {type(actual).__name__} instead of {type(expected).__name__}"]
+    return [] if expected == actual else [f"{path}: {actual!r} instead of {expected!r}"]
+
+
+def compare_parsers(primary_name: str, shadow_names: list[str], html: str) -> list[dict]:
+    """Parses the page with the primary parser and each shadow parser, and compares the results.
+    Run in the parser process pool.
+
+    Returns a list of the measurements of each parser, the primary parser first. The entry of each
+    shadow parser also contains the differences between its result and the primary parser's, or
+    the error that the parser raised.
+    """
+    expected, measurements = measure_parser(primary_name, html)
+    entries = [{"parser": primary_name, **measurements}]
+    for shadow_name in shadow_names:
+        try:
+            actual, measurements = measure_parser(shadow_name, html)
+        except Exception as exc:  # pylint: disable=broad-except
+            entries.append({"parser": shadow_name, "error": ccutil.format_exception_info(exc)})
+            continue
+        differences = get_differences(expected, actual)
+        entries.append(
+            {
+                "parser": shadow_name,
+                **measurements,
+                "num_differences": len(differences),
+                "differences": differences[:MAX_DIFFERENCES],
+            }
+        )
+    return entries
+
+
+def record(source: str, entries: list[dict]) -> None:
+    """Adds the comparison to the report and the totals of each parser.
+
+    Arguments:
+        source -- the name of the page that was parsed, e.g. 'substitutions'.
+        entries -- the comparison results returned by `compare_parsers()`.
+    """
+    report.append({"time": str(datetime.now()), "source": source, "parsers": entries})
+    for entry in entries:
+        totals = stats.setdefault(
+            entry["parser"],
+            {"runs": 0, "seconds": 0.0, "max_peak_rss_kib": 0, "mismatches": 0, "errors": 0},
+        )
+        totals["runs"] += 1
+        if "error" in entry:
+            totals["errors"] += 1
+            _log(f"Shadow parser {entry['parser']} failed on the {source}:\n{entry['error']}")
+            continue
+        totals["seconds"] += entry["seconds"]
+        totals["max_peak_rss_kib"] = max(totals["max_peak_rss_kib"], entry["peak_rss_kib"] or 0)
+        if entry.get("num_differences"):
+            totals["mismatches"] += 1
+            _log(
+                f"Shadow parser {entry['parser']} differs from {entries[0]['parser']} on the "
+                f"{source} in {entry['num_differences']} places, e.g. {entry['differences'][0]}"
+            )
+
+
+async def shadow_parse(source: str, primary_name: str, shadow_names: list[str], html: str) -> None:
+    """Compares the parsers on the page in the parser process pool and records the results."""
+    try:
+        # Comparing the parsers inline would block the event loop with several full parses
+        entries = await parsing.run_parser(
+            compare_parsers, primary_name, shadow_names, html, inline_fallback=False
+        )
+    except Exception as exc:  # pylint: disable=broad-except
+        # The primary parser failed, which is reported by the fetch itself
+        _log(f"Could not shadow-parse the {source}: {exc!r}")
+        return
+    record(source, entries)
+
+
+def schedule(source: str, primary_name: str, html: str) -> None:
+    """Shadow-parses the fetched page in the background if there are any shadow parsers.
+
+    Arguments:
+        source -- the name of the page, e.g. 'substitutions'.
+        primary_name -- the full name of the parser whose result the bot uses.
+        html -- the page's HTML code.
+    """
+    shadow_names = [name for name in get_shadow_parsers() if name != primary_name]
+    if not shadow_names or not parsing.is_pool_available():
+        # Shadow parsing is disabled, or there is no process pool to run it in
+        return
+    task = asyncio.create_task(shadow_parse(source, primary_name, shadow_names, html))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+
+
+def get_report() -> str:
+    """Returns a summary of the totals of each parser."""
+    lines = []
+    for parser_name, totals in stats.items():
+        successful_runs = totals["runs"] - totals["errors"]
+        mean_time = totals["seconds"] / (successful_runs or 1) * 1000
+        lines.append(
+            f"{parser_name}: {totals['runs']:.0f} runs, {mean_time:.1f} ms on average, "
+            f"peak RSS +{totals['max_peak_rss_kib']:.0f} KiB, "
+            f"{totals['mismatches']:.0f} mismatches, {totals['errors']:.0f} errors"
+        )
+    return "\n".join(lines) or "No pages have been shadow-parsed."
+
+
+def _log(*args) -> None:
+    file_manager.log(*args, filename="bot")
@@ -1,6 +1,7 @@
 """Functionality for accessing the Steam Community web API."""
 
 # Standard library imports
+import hashlib
 import json
 from urllib import parse
 
@@ -9,6 +10,7 @@ from corny_commons.util import web
 
 # Local application imports
 from modules import bot
+from modules.api import async_web, cache
 
 
 CURRENCY_IDS = [
@@ -46,6 +48,8 @@ CURRENCY_IDS = [
     "AED",  # Emirati Dirham
 ]
 
+MAX_CACHE_AGE = 15 * 60  # Seconds; the tracked items are checked every 30 minutes
+
 COULD_NOT_FIND_PRICE_MSG = "Could not find item's lowest price. Check if this is true:"
 
 SOURCE_URL_A = (
@@ -86,7 +90,7 @@ class NoSuchItemException(web.WebException):
         super().__init__(self.message)
 
 
-def _make_api_request(url_template, raw_query: str, force: bool) -> dict[str, any]:
+async def _make_api_request(url_template, raw_query: str, force: bool) -> dict[str, any]:
     """Makes a query on the Steam API searching for market items with the given name.
 
     Returns a dictionary containing the JSON response.
@@ -94,9 +98,10 @@ def _make_api_request(url_template, raw_query: str, force: bool) -> dict[str, an
     """
     query_encoded = parse.quote(raw_query)
     try:
-        result = web.make_request(
+        response = await async_web.make_request(
             url_template + query_encoded, ignore_request_limit=force
-        ).json()
+        )
+        result = response.json()
     except web.InvalidResponseException as not_found_exc:
         raise NoSuchItemException(raw_query) from not_found_exc
     else:
@@ -106,8 +111,12 @@ def _make_api_request(url_template, raw_query: str, force: bool) -> dict[str, an
         return result
 
 
-def get_item(
-    raw_query: str, app_id: int = 730, currency: str = "PLN", force: bool = False
+async def get_item_async(
+    raw_query: str,
+    app_id: int = 730,
+    currency: str = "PLN",
+    force: bool = False,
+    tracked: bool = False,
 ) -> dict[str, bool or str]:
     """Makes a web query on the Steam Community Market API for the specified search term.
 
@@ -116,7 +125,10 @@ def get_item(
         app_id -- the ID of the game whose market contains the searched item (default 730 - CS:GO).
         currency -- the ISO abbreviation for the currency that the results are to be returned in
         (defaults to PLN for Polish Złotys).
-        force -- a boolean indicating if the request limit should be ignored. Defaults to False.
+        force -- a boolean indicating if the request limit and the cache should be ignored.
+        Defaults to False.
+        tracked -- a boolean indicating if the price of the item is being tracked, in which case the
+        response is cached for `MAX_CACHE_AGE`, so that the fetcher process can keep it up-to-date.
 
     Returns a dictionary containing the JSON response.
     #### JSON response structure:
@@ -133,10 +145,34 @@ def get_item(
     """
     currency_id = get_currency_id(currency)
     url_template = SOURCE_URL_A.format(app_id, currency_id)
-    return _make_api_request(url_template, raw_query, force)
 
+    async def update_cache_callback() -> dict:
+        return await _make_api_request(url_template, raw_query, force)
+
+    # Hash the query so that the file name is not too long
+    query_hash = hashlib.sha1(raw_query.encode("UTF-8")).hexdigest()
+    cache_name = f"steam_{app_id}_{currency_id}_{query_hash}"
+    if not tracked or (cache.read_only and cache.get_cache_age(cache_name) is None):
+        # Only the tracked items are cached, and the fetcher may not have fetched this one yet
+        return await update_cache_callback()
+    result, _ = await cache.get_cache(
+        cache_name, force, update_cache_callback, source_url=url_template, max_age=MAX_CACHE_AGE
+    )
+    return result
 
-def search_item(raw_query: str, force: bool = False) -> dict[str, any]:
+
+def get_item(
+    raw_query: str,
+    app_id: int = 730,
+    currency: str = "PLN",
+    force: bool = False,
+    tracked: bool = False,
+) -> dict[str, bool or str]:
+    """Synchronous version of `get_item_async()`."""
+    return async_web.run_sync(get_item_async(raw_query, app_id, currency, force, tracked))
+
+
+async def search_item_async(raw_query: str, force: bool = False) -> dict[str, any]:
     """Makes a query on the Steam API searching for market items with the given name.
 
     Arguments:
@@ -149,7 +185,12 @@ def search_item(raw_query: str, force: bool = False) -> dict[str, any]:
     start_index = 0
     max_results = 10
     url_template = SOURCE_URL_B.format(start_index, max_results)
-    return _make_api_request(url_template, raw_query, force)
+    return await _make_api_request(url_template, raw_query, force)
+
+
+def search_item(raw_query: str, force: bool = False) -> dict[str, any]:
+    """Synchronous version of `search_item_async()`."""
+    return async_web.run_sync(search_item_async(raw_query, force))
 
 
 def get_item_price(item_data: dict[str, bool or str]) -> str:
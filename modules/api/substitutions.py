@@ -3,19 +3,22 @@ details.
 """
 
 # Standard library imports
+import asyncio
+import hashlib
 import json
 import re
 import datetime
-from sqlite3 import IntegrityError
+from typing import Iterable, Iterator
 
 # Third-party imports
+import lxml.etree
 import lxml.html
 from corny_commons import file_manager, util as ccutil
-from corny_commons.util import web
 
 # Local application imports
-from modules import WEEKDAY_NAMES, Colour, util
-from modules.api.lesson_plan import get_lesson_plan
+from modules import WEEKDAY_NAMES, Colour, util, polling
+from modules.api import async_web, cache, parsing, shadow, timetable
+from modules.api.lesson_plan import get_lesson_plan_async, get_plan_id
 
 
 SUB_INFO_PATTERN = r"(I*)([A-Z]*)([pg]?)\s?(?:(?:gr.\s|,\s|\si\s)p. [^,]+?[^-])*\s(.*)"
@@ -29,6 +32,22 @@ TEACHER_PATTERN = re.compile(
 TEACHERS_PATTERN = re.compile(r"(?<=p. )[^\s,]+")
 
 SOURCE_URL = "http://www.lo1.gliwice.pl/zastepstwa-2/"
+MAX_CACHE_AGE = 60 * 60  # Seconds; the cache is normally refreshed every hour by the bot
+POST_XPATH = "//div[@id='content']/div"
+# The start tag of the div containing the post, where the streaming parser starts
+CONTENT_DIV_PATTERN = re.compile(r"<div\b[^>]*\bid=[\"']?content\b")
+POST_PARSER_CHUNK_SIZE = 16 * 1024  # Characters fed to the streaming parser at once
+# The parser whose results are used, which the shadow parsers are compared with (see `api.shadow`)
+PRIMARY_PARSER = "modules.api.substitutions.parse_html_streamed"
+
+# How many substitutions refreshes were skipped because the server responded with 304 Not Modified
+# or because the post's content hash was unchanged, and how many pages were actually parsed.
+poll_stats: dict[str, int] = {"not_modified": 0, "unchanged_hash": 0, "parsed": 0}
+
+# The content hash of the substitutions post that the cache was last generated from
+_last_post_hash: str = None
+# The time at which the substitutions were last checked for changes by this process
+_last_check_time: datetime.datetime = None
 
 
 def get_int_ranges_from_string(lessons_string: str) -> list[int]:
@@ -74,34 +93,107 @@ def extract_from_table(elem, table: dict[str, any]) -> None:
             column_data[j].append(cell_text)
 
 
-def get_substituted_lessons(class_name: str, weekday: int, period: IntegrityError):
-    """Checks the lesson plan for the lessons that would normally have taken place."""
-    class_id: str = util.format_class(class_name, reverse=True)
-    try:
-        lesson_plan: dict[str, list[list[dict]]] = get_lesson_plan(
-            class_id, force_update=None
-        )[0]
-    except ValueError:
-        # The class has no lesson plan
-        lessons_on_period: list[dict] = []
-    else:
-        weekday_name = WEEKDAY_NAMES[weekday]
-        lessons_on_period: list[dict] = lesson_plan[weekday_name][period]
-    return lessons_on_period
-
+class PlanContext:
+    """Custom object type containing the lesson plans of the classes mentioned on a substitutions
+    page. Created for each parse, so that each class' plan is only resolved once for the whole page.
+    """
 
-def extract_substitutions_text(elem_text: str, subs_data: dict) -> None:
-    """Parses the substitution text elements."""
+    def __init__(self) -> None:
+        # The lesson plan ID of each class in the school-wide timetable, keyed by class name.
+        # None if the class has no lesson plan, or the exception that was raised while getting it.
+        self.plans: dict[str, int or Exception or None] = {}
+
+    async def load_async(self, class_names: Iterable[str]) -> None:
+        """Gets the lesson plans of the given classes concurrently."""
+        class_ids = {name: util.format_class(name, reverse=True) for name in class_names}
+        unique_ids = list(set(class_ids.values()))
+        results = await asyncio.gather(
+            *[get_lesson_plan_async(class_id, force_update=None) for class_id in unique_ids],
+            return_exceptions=True,
+        )
+        results_by_id = dict(zip(unique_ids, results))
+        for class_name, class_id in class_ids.items():
+            result = results_by_id[class_id]
+            if isinstance(result, ValueError):
+                # The class has no lesson plan
+                self.plans[class_name] = None
+            elif isinstance(result, Exception):
+                self.plans[class_name] = result
+            else:
+                # Getting the plan has stored it in the timetable
+                self.plans[class_name] = get_plan_id(class_id)
+
+    def load(self, class_names: Iterable[str]) -> None:
+        """Synchronous version of `load_async()`."""
+        class_names = set(class_names) - self.plans.keys()
+        if class_names:
+            async_web.run_sync(self.load_async(class_names))
+
+    def get_substituted_lessons(self, class_name: str, weekday: int, period: int) -> list[dict]:
+        """Checks the lesson plan for the lessons that would normally have taken place."""
+        if class_name not in self.plans:
+            self.load([class_name])
+        plan_id = self.plans[class_name]
+        if plan_id is None:
+            # The class has no lesson plan
+            return []
+        if isinstance(plan_id, Exception):
+            raise plan_id
+        school_timetable = timetable.get_timetable()
+        if weekday >= len(WEEKDAY_NAMES) or period >= len(school_timetable.period_numbers[plan_id]):
+            # Not in the lesson plan; the page structure is not as expected
+            raise IndexError(f"no lessons on period {period} of weekday {weekday} in {class_name}")
+        return school_timetable.get_lessons(plan_id, weekday, period)
+
+
+def split_substitutions_text(elem_text: str) -> tuple[str, str] or None:
+    """Splits the substitution text into the lesson periods and the substitution info.
+
+    Returns None if this is not substitutions data.
+    """
     # Check which dash symbol is used in the substitutions text
     # Usually it's the EN dash, although it's possible it's the minus symbol
     # Yes, this is supposed to be U+2013
     separator = " - " if " - " in elem_text else " – "
-    try:
-        lessons, info = elem_text.split(separator, maxsplit=1)
-    except ValueError:
+    parts = elem_text.split(separator, maxsplit=1)
+    return tuple(parts) if len(parts) == 2 else None
+
+
+def get_class_names(info_match: re.Match) -> list[str]:
+    """Returns the names of the classes that the matched substitution info applies to."""
+    class_year, classes, class_info, _ = info_match.groups()
+    return [
+        f"{class_year or ''}{class_letter}{class_info or ''}" for class_letter in classes or "?"
+    ]
+
+
+def get_mentioned_class_names(post_elem: lxml.html.Element) -> set[str]:
+    """Returns the names of the classes mentioned in the substitution texts of the post."""
+    class_names: set[str] = set()
+    for elem in post_elem:
+        if elem.tag != "p" or elem.xpath("./*") or not elem.text:
+            continue
+        parts = split_substitutions_text(elem.text)
+        info_match = parts and SUB_INFO_PATTERN.match(parts[1])
+        if info_match:
+            class_names.update(get_class_names(info_match))
+    return class_names
+
+
+def extract_substitutions_text(elem_text: str, subs_data: dict, context: PlanContext) -> None:
+    """Parses the substitution text elements.
+
+    Arguments:
+        elem_text -- the text of the element.
+        subs_data -- the dictionary to add the extracted data to.
+        context -- the lesson plans of the classes on the page.
+    """
+    parts = split_substitutions_text(elem_text)
+    if parts is None:
         # This is not substitutions data
         subs_data["misc"].append(elem_text)
         return
+    lessons, info = parts
     lesson_ints = get_int_ranges_from_string(lessons)
     if "date" in subs_data:
         # Parse the date from the substitutions page
@@ -122,16 +214,15 @@ def extract_substitutions_text(elem_text: str, subs_data: dict) -> None:
     if match is None:
         file_manager.log("Could not find a lesson entry match for", info)
         return
-    class_year, classes, class_info, details = match.groups()
+    details = match.groups()[-1]
 
     for lesson in lesson_ints:
         subs_data["lessons"].setdefault(lesson, {})
-        for class_letter in classes or "?":
-            class_name = f"{class_year or ''}{class_letter}{class_info or ''}"
+        for class_name in get_class_names(match):
             subs_data["lessons"][lesson].setdefault(
                 class_name,
                 {
-                    "substituted_lessons": get_substituted_lessons(
+                    "substituted_lessons": context.get_substituted_lessons(
                         class_name, weekday_int, lesson
                     ),
                     "substitutions": [],
@@ -177,6 +268,76 @@ def extract_header_data(elem, child_elems, subs_data) -> tuple[str, any]:
         subs_data["date"] = str(date.date())
 
 
+def free_element(elem: lxml.html.Element) -> None:
+    """Frees the memory used by an element that has been fully processed during streaming, along
+    with its preceding siblings, which have already been freed themselves."""
+    elem.clear()
+    parent = elem.getparent()
+    while elem.getprevious() is not None:
+        del parent[0]
+
+
+def iter_post_elements(html: str, post_hash=None) -> Iterator[lxml.html.Element]:
+    """Parses the page incrementally and yields each child element of the substitutions post as
+    soon as it is complete.
+
+    Parsing starts at the content div, so the head and the menus before it are never parsed. Only
+    the post is kept in memory: every element before it is freed as soon as it is closed, each
+    child of the post is freed once it has been processed, and parsing stops when the post is
+    closed, so the sidebars and scripts after it are never parsed either.
+
+    Arguments:
+        html -- a string containing whole HTML code.
+        post_hash -- a hash object (e.g. from `hashlib.sha1()`) to update with the HTML code of
+        each child element, if given.
+
+    Raises IndexError if the page does not contain the post.
+    """
+    content_match = CONTENT_DIV_PATTERN.search(html)
+    if content_match is None:
+        raise IndexError("The content div could not be found.")
+    parser = lxml.etree.HTMLPullParser(events=("start", "end"))
+    parser.set_element_class_lookup(lxml.html.HtmlElementClassLookup())
+    content_elem = post_elem = None
+    for start in range(content_match.start(), len(html), POST_PARSER_CHUNK_SIZE):
+        parser.feed(html[start : start + POST_PARSER_CHUNK_SIZE])
+        for event, elem in parser.read_events():
+            if event == "start":
+                if post_elem is not None or elem.tag != "div":
+                    continue
+                if content_elem is None and elem.get("id") == "content":
+                    content_elem = elem
+                elif content_elem is not None and elem.getparent() is content_elem:
+                    post_elem = elem
+            elif elem is post_elem:
+                # The rest of the page is irrelevant
+                return
+            elif post_elem is None:
+                # The element is not part of the post
+                free_element(elem)
+            elif elem.getparent() is post_elem:
+                if post_hash is not None:
+                    post_hash.update(lxml.html.tostring(elem, with_tail=False))
+                yield elem
+                free_element(elem)
+    raise IndexError("The substitutions post could not be found.")
+
+
+def get_post_hash(html: str) -> str or None:
+    """Returns the SHA-1 hash of the substitutions post's HTML subtree, ignoring the rest of the
+    page (sidebars, scripts etc.) whose contents can change on every request.
+
+    Returns None if the post element could not be found.
+    """
+    post_hash = hashlib.sha1()
+    try:
+        for _ in iter_post_elements(html, post_hash):
+            pass
+    except IndexError:
+        return None
+    return post_hash.hexdigest()
+
+
 def parse_html(html: str) -> dict:
     """Parses the HTML and finds a specific hard-coded substitutions post, then collects the
     relevant data from it.
@@ -188,9 +349,8 @@ def parse_html(html: str) -> dict:
     Returns a dictionary containing the extracted data.
     """
     root: lxml.html.Element = lxml.html.fromstring(html)
-    post_xpath: str = "//div[@id='content']/div"
     try:
-        post_elem: lxml.html.Element = root.xpath(post_xpath)[0]
+        post_elem: lxml.html.Element = root.xpath(POST_XPATH)[0]
     except IndexError as no_matches_exc:
         return {"error": ccutil.format_exception_info(no_matches_exc)}
     subs_data = {
@@ -251,8 +411,11 @@ def parse_html(html: str) -> dict:
                 )
             else:
                 # This is probably the actual substitutions text
-                extract_substitutions_text(elem_text, subs_data)
+                extract_substitutions_text(elem_text, subs_data, context)
 
+    # Get the lesson plans of all of the classes on the page at once
+    context = PlanContext()
+    context.load(get_mentioned_class_names(post_elem))
     for i, p_elem in enumerate(post_elem):
         try:
             next_elem = post_elem[i + 1]
@@ -287,50 +450,83 @@ def parse_html(html: str) -> dict:
     return subs_data
 
 
-def parse_html_new(html: str) -> dict:
-    """Parses the HTML and finds a specific hard-coded substitutions post, then collects the
-    relevant data from it. Only collects information regarding cancelled IB classes.
+def parse_html_if_changed(html: str, known_hash: str = None) -> tuple[str, dict or None]:
+    """Hashes the substitutions post and parses it using `parse_html_streamed()` in a single pass.
+    Combined into a single function so that it can be run in the parser process pool.
 
     Arguments:
-        html -- a string containing whole HTML code, e.g. from the contents of a web request's
-        response.
+        html -- a string containing whole HTML code.
+        known_hash -- the hash of the post that the current cache was generated from, if any.
 
-    Returns a dictionary containing the extracted data.
+    Returns a tuple consisting of the post's hash and the parsed data, or None instead of the data
+    if the post is unchanged.
     """
-    root: lxml.html.Element = lxml.html.fromstring(html)
-    post_xpath: str = "//div[@id='content']/div"
-    try:
-        post_elem: lxml.html.Element = root.xpath(post_xpath)[0]
-    except IndexError as no_matches_exc:
-        return {"error": ccutil.format_exception_info(no_matches_exc)}
+    post_hash = hashlib.sha1()
+    data = parse_html_streamed(html, post_hash)
+    post_hash = None if "error" in data else post_hash.hexdigest()
+    if known_hash is not None and post_hash == known_hash:
+        return post_hash, None
+    return post_hash, data
 
+
+def extract_cancelled_classes(post_elems: Iterable[lxml.html.Element]) -> dict[str, list[str]]:
+    """Collects the surnames of the teachers whose IB classes are cancelled on each date from the
+    child elements of the substitutions post."""
     result: dict[str, list[str]] = {}
     date = None
-
-    def extract(elem: lxml.html.Element):
+    for elem in post_elems:
         if elem.tag != "p":
-            return
+            continue
         text: str = elem.text_content().strip()
         if not text:
-            return
+            continue
         match = DATE_PATTERN.match(text)
         if match:
-            nonlocal date
             date = match.groupdict().get("date")
             result[date] = []
-            return
+            continue
         match = TEACHER_PATTERN.match(text)
         if not match:
-            return
+            continue
         match = TEACHERS_PATTERN.findall(text)
         result[date] += match
-
-    for p_elem in post_elem:
-        extract(p_elem)
     return result
 
 
-def get_substitutions(force_update: bool = False) -> tuple[dict, dict]:
+def parse_html_new(html: str) -> dict:
+    """Parses the HTML and finds a specific hard-coded substitutions post, then collects the
+    relevant data from it. Only collects information regarding cancelled IB classes.
+
+    Arguments:
+        html -- a string containing whole HTML code, e.g. from the contents of a web request's
+        response.
+
+    Returns a dictionary containing the extracted data.
+    """
+    root: lxml.html.Element = lxml.html.fromstring(html)
+    try:
+        post_elem: lxml.html.Element = root.xpath(POST_XPATH)[0]
+    except IndexError as no_matches_exc:
+        return {"error": ccutil.format_exception_info(no_matches_exc)}
+    return extract_cancelled_classes(post_elem)
+
+
+def parse_html_streamed(html: str, post_hash=None) -> dict:
+    """Same as `parse_html_new()`, but only builds the tree of the substitutions post, one child
+    element at a time, and stops parsing the page once the post is closed (see
+    `iter_post_elements()`). Uses much less memory and time on the full page.
+
+    Arguments:
+        html -- a string containing whole HTML code.
+        post_hash -- a hash object to update with the HTML code of the post, if given.
+    """
+    try:
+        return extract_cancelled_classes(iter_post_elements(html, post_hash))
+    except IndexError as no_matches_exc:
+        return {"error": ccutil.format_exception_info(no_matches_exc)}
+
+
+async def get_substitutions_async(force_update: bool = False) -> tuple[dict, dict]:
     """Gets the current lesson substitutions.
 
     Arguments:
@@ -340,11 +536,57 @@ def get_substitutions(force_update: bool = False) -> tuple[dict, dict]:
     check if the cache has changed).
     """
 
-    def update_cache_callback() -> dict:
-        html: str = web.get_html(SOURCE_URL, ignore_request_limit=force_update)
-        return parse_html_new(html)
+    async def update_cache_callback() -> dict:
+        global _last_post_hash
+        # Only skip parsing if there is an existing cache that was generated from the same post
+        has_cache = cache.get_cache_age("subs") is not None
+        html: str = await async_web.get_html(
+            SOURCE_URL, ignore_request_limit=force_update, conditional=has_cache
+        )
+        if html is None:
+            poll_stats["not_modified"] += 1
+            raise cache.CacheUnchanged()
+        shadow.schedule("substitutions", PRIMARY_PARSER, html)
+        known_hash = _last_post_hash if has_cache else None
+        post_hash, data = await parsing.run_parser(parse_html_if_changed, html, known_hash)
+        if data is None:
+            poll_stats["unchanged_hash"] += 1
+            raise cache.CacheUnchanged()
+        poll_stats["parsed"] += 1
+        # No hash is known for a page that could not be parsed, so it is parsed again next time
+        _last_post_hash = post_hash
+        if "error" in data:
+            # Fetch the whole page next time instead of keeping the error until the page changes
+            async_web.forget_validators(SOURCE_URL)
+        return data
+
+    global _last_check_time
+    new_cache, old_cache = await cache.get_cache(
+        "subs",
+        force_update,
+        update_cache_callback,
+        source_url=SOURCE_URL,
+        max_age=MAX_CACHE_AGE,
+        # Only the forced updates check for new substitutions to announce
+        consumer="poll" if force_update else None,
+    )
+    if isinstance(new_cache, cache.StaleCache):
+        # The substitutions could not be checked
+        return new_cache, old_cache
+    check_time = datetime.datetime.now()
+    is_changed = new_cache is not old_cache and old_cache and new_cache != old_cache
+    if is_changed and _last_check_time is not None:
+        # Let the polling planner learn when the school publishes the substitutions, which was
+        # some time after the previous check
+        polling.planner.record_change(check_time, since=_last_check_time)
+    if force_update or is_changed:
+        _last_check_time = check_time
+    return new_cache, old_cache
+
 
-    return file_manager.get_cache("subs", force_update, update_cache_callback)
+def get_substitutions(force_update: bool = False) -> tuple[dict, dict]:
+    """Synchronous version of `get_substitutions_async()`."""
+    return async_web.run_sync(get_substitutions_async(force_update))
 
 
 if __name__ == "__main__":
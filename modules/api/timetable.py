@@ -0,0 +1,345 @@
+"""Functionality for storing the lesson plans of every class in the school in a compact form.
+
+The parsed lesson plans are nested lists of a dictionary per lesson, which repeat the same subject
+names, group codes, rooms and teachers hundreds of times. The timetable instead stores each lesson
+as a row of integers in array-backed columns -- class, weekday, period, subject, group, room and
+teacher -- and each distinct string only once, in a string table that the columns refer to. The
+rows of each class are contiguous, so the lessons of a class are a slice of the columns.
+
+The timetable is filled with the lesson plans as they are fetched or read from the cache, and it
+can be saved to a binary file in the cache directory that is loaded with a single read. In
+read-only mode (see `cache.read_only`), the file is reloaded whenever the fetcher saves it.
+"""
+
+# Standard library imports
+import bisect
+import json
+import os
+import struct
+import sys
+from array import array
+
+# Third-party imports
+from corny_commons import file_manager
+
+# Local application imports
+from modules import WEEKDAY_NAMES
+from modules.api import cache
+
+FILE_NAME = "timetable.bin"
+FILE_MAGIC = b"DZTT"
+FILE_VERSION = 1
+# Magic, version, number of rows, size of the string table and size of the metadata in bytes
+HEADER_FORMAT = struct.Struct("<4sHIII")
+# The name and the array type code of each column, in the order in which they are saved
+COLUMNS = (
+    ("plan_ids", "H"),
+    ("weekdays", "B"),
+    ("periods", "B"),
+    ("subject_ids", "H"),
+    ("group_ids", "H"),
+    ("room_ids", "H"),
+    ("teacher_ids", "H"),
+)
+
+
+class StringTable:
+    """Custom object type containing each distinct string once, identified by its position.
+
+    The empty string always has the ID 0, which stands for a missing value, e.g. no teacher.
+    """
+
+    def __init__(self, strings: list[str] = None) -> None:
+        self.strings: list[str] = strings or [""]
+        self._ids: dict[str, int] = {string: index for index, string in enumerate(self.strings)}
+
+    def intern(self, string: str) -> int:
+        """Returns the ID of the string, adding it to the table if it is new."""
+        string_id = self._ids.get(string)
+        if string_id is None:
+            string_id = self._ids[string] = len(self.strings)
+            self.strings.append(string)
+        return string_id
+
+    def get_id(self, string: str) -> int or None:
+        """Returns the ID of the string, or None if it is not in the table."""
+        return self._ids.get(string)
+
+
+class Timetable:
+    """Custom object type containing the lessons of every class in the school in columns.
+
+    Attributes:
+        strings -- the string table that the subject, group, room and teacher columns refer to.
+        class_ranges -- the start and end row of the lessons of each class, keyed by plan ID.
+        period_numbers -- the period numbers of each class' lesson plan (the 'Nr' column).
+        period_times -- the start and end times of each period of each class' lesson plan.
+        revision -- incremented whenever the lessons of a class are replaced or removed.
+        plan_revisions -- the revision at which the lessons of each class were last replaced, so
+        that the indexes built from the timetable can tell which classes to index again.
+    """
+
+    def __init__(self) -> None:
+        self.strings = StringTable()
+        self.columns: dict[str, array] = {name: array(code) for name, code in COLUMNS}
+        self.class_ranges: dict[int, tuple[int, int]] = {}
+        self.period_numbers: dict[int, list[int]] = {}
+        self.period_times: dict[int, list] = {}
+        self.revision: int = 0
+        self.plan_revisions: dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.columns["plan_ids"])
+
+    def __contains__(self, plan_id: int) -> bool:
+        return plan_id in self.class_ranges
+
+    def remove_plan(self, plan_id: int) -> None:
+        """Removes the lessons of the class. Its strings stay in the string table."""
+        start, end = self.class_ranges.pop(plan_id, (0, 0))
+        if self.plan_revisions.pop(plan_id, None) is not None:
+            self.revision += 1
+        if start == end:
+            return
+        for column in self.columns.values():
+            del column[start:end]
+        # Shift the classes whose rows came after the removed ones
+        for other_id, (other_start, other_end) in self.class_ranges.items():
+            if other_start >= end:
+                self.class_ranges[other_id] = other_start - (end - start), other_end - (end - start)
+
+    def set_plan(self, plan_id: int, plan: dict[str, list]) -> None:
+        """Replaces the lessons of the class with those of its parsed lesson plan.
+
+        Arguments:
+            plan_id -- the lesson plan ID of the class.
+            plan -- the lesson plan as returned by `lesson_plan.parse_html()`.
+        """
+        self.remove_plan(plan_id)
+        self.period_numbers.pop(plan_id, None)
+        self.period_times.pop(plan_id, None)
+        start = len(self)
+        columns = self.columns
+        intern = self.strings.intern
+        for weekday, weekday_name in enumerate(WEEKDAY_NAMES):
+            for period, lessons in enumerate(plan.get(weekday_name, [])):
+                for lesson in lessons:
+                    columns["plan_ids"].append(plan_id)
+                    columns["weekdays"].append(weekday)
+                    columns["periods"].append(period)
+                    columns["subject_ids"].append(intern(lesson["name"]))
+                    columns["group_ids"].append(intern(lesson["group"]))
+                    columns["room_ids"].append(intern(lesson.get("room_id", "")))
+                    columns["teacher_ids"].append(intern(lesson.get("teacher", "")))
+        self.class_ranges[plan_id] = start, len(self)
+        self.revision += 1
+        self.plan_revisions[plan_id] = self.revision
+        self.period_numbers[plan_id] = list(plan.get("Nr", []))
+        self.period_times[plan_id] = [
+            [list(start_time), list(end_time)] for start_time, end_time in plan.get("Godz", [])
+        ]
+
+    def get_changed_plans(self, indexed_revisions: dict[int, int]) -> tuple[list[int], list[int]]:
+        """Returns the plan IDs of the classes whose lessons were replaced and of those that were
+        removed since an index was built from the timetable.
+
+        Arguments:
+            indexed_revisions -- the revision of each class that the index was built from.
+        """
+        changed = [
+            plan_id
+            for plan_id, revision in self.plan_revisions.items()
+            if indexed_revisions.get(plan_id) != revision
+        ]
+        removed = [plan_id for plan_id in indexed_revisions if plan_id not in self.plan_revisions]
+        return changed, removed
+
+    def get_lesson(self, row: int) -> dict[str, str]:
+        """Returns the lesson in the given row in the format of the parsed lesson plans."""
+        strings = self.strings.strings
+        lesson = {
+            "name": strings[self.columns["subject_ids"][row]],
+            "group": strings[self.columns["group_ids"][row]],
+            "room_id": strings[self.columns["room_ids"][row]],
+        }
+        teacher_id = self.columns["teacher_ids"][row]
+        if teacher_id:
+            lesson["teacher"] = strings[teacher_id]
+        return lesson
+
+    def get_class_rows(self, plan_id: int, weekday: int = None, period: int = None) -> range:
+        """Returns the rows of the lessons of the class, optionally only those on the given weekday
+        and period. The rows of a class are ordered by weekday and period, so they are found with
+        a binary search."""
+        rows = range(*self.class_ranges.get(plan_id, (0, 0)))
+        if weekday is None:
+            return rows
+        weekdays, periods = self.columns["weekdays"], self.columns["periods"]
+        if period is None:
+            start = bisect.bisect_left(rows, weekday, key=weekdays.__getitem__)
+            end = bisect.bisect_right(rows, weekday, key=weekdays.__getitem__)
+        else:
+            key = (weekday, period)
+            start = bisect.bisect_left(rows, key, key=lambda row: (weekdays[row], periods[row]))
+            end = bisect.bisect_right(rows, key, key=lambda row: (weekdays[row], periods[row]))
+        return rows[start:end]
+
+    def find_rows(self, plan_id: int = None, **filters) -> list[int]:
+        """Returns the rows of the lessons matching all of the given filters.
+
+        Arguments:
+            plan_id -- only include the lessons of this class.
+            filters -- the values that the lessons must have in the given columns, e.g.
+            `weekday=0` or `teacher="AB"`. The subject, group, room and teacher are strings.
+        """
+        if plan_id is None:
+            rows = range(len(self))
+        else:
+            rows = self.get_class_rows(plan_id, filters.pop("weekday", None))
+        conditions = []
+        for name, value in filters.items():
+            column_name = name + "s" if name in ("weekday", "period") else name + "_ids"
+            if column_name not in self.columns:
+                raise TypeError(f"There is no column named {name!r}.")
+            if isinstance(value, str):
+                value = self.strings.get_id(value)
+                if value is None:
+                    # No lesson can have a string that is not in the table
+                    return []
+            conditions.append((self.columns[column_name], value))
+        return [row for row in rows if all(column[row] == value for column, value in conditions)]
+
+    def get_lessons(self, plan_id: int, weekday: int, period: int) -> list[dict[str, str]]:
+        """Returns the lessons of the class on the given period of the given weekday."""
+        return [self.get_lesson(row) for row in self.get_class_rows(plan_id, weekday, period)]
+
+    def get_day(self, plan_id: int, weekday: int) -> list[list[dict[str, str]]]:
+        """Returns the lessons of the class on each period of the given weekday."""
+        day = [[] for _ in self.period_numbers.get(plan_id, [])]
+        for row in self.find_rows(plan_id, weekday=weekday):
+            period = self.columns["periods"][row]
+            while len(day) <= period:
+                day.append([])
+            day[period].append(self.get_lesson(row))
+        return day
+
+    def get_plan(self, plan_id: int) -> dict[str, list]:
+        """Returns the lesson plan of the class in the format of `lesson_plan.parse_html()`."""
+        plan = {
+            "Nr": list(self.period_numbers[plan_id]),
+            "Godz": [[list(time) for time in times] for times in self.period_times[plan_id]],
+        }
+        for weekday, weekday_name in enumerate(WEEKDAY_NAMES):
+            plan[weekday_name] = self.get_day(plan_id, weekday)
+        return plan
+
+    def to_bytes(self) -> bytes:
+        """Serialises the timetable into the binary file format."""
+        strings = "\0".join(self.strings.strings).encode("UTF-8")
+        metadata = {
+            "classes": {
+                plan_id: [start, end, self.period_numbers[plan_id], self.period_times[plan_id]]
+                for plan_id, (start, end) in self.class_ranges.items()
+            }
+        }
+        metadata = json.dumps(metadata, separators=(",", ":")).encode("UTF-8")
+        header = HEADER_FORMAT.pack(
+            FILE_MAGIC, FILE_VERSION, len(self), len(strings), len(metadata)
+        )
+        parts = [header, strings, metadata]
+        for name, _ in COLUMNS:
+            column = self.columns[name]
+            if sys.byteorder != "little":
+                column = array(column.typecode, column)
+                column.byteswap()
+            parts.append(column.tobytes())
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "Timetable":
+        """Deserialises the timetable from the binary file format.
+
+        Raises ValueError if the data is not a timetable saved in the current format.
+        """
+        try:
+            magic, version, num_rows, strings_size, metadata_size = HEADER_FORMAT.unpack_from(data)
+        except struct.error as exc:
+            raise ValueError("The timetable file is truncated.") from exc
+        if magic != FILE_MAGIC or version != FILE_VERSION:
+            raise ValueError("The file is not a timetable saved in the current format.")
+        view = memoryview(data)
+        position = HEADER_FORMAT.size
+        timetable = cls()
+        strings = bytes(view[position : position + strings_size]).decode("UTF-8")
+        timetable.strings = StringTable(strings.split("\0"))
+        position += strings_size
+        metadata = json.loads(bytes(view[position : position + metadata_size]))
+        position += metadata_size
+        for name, code in COLUMNS:
+            column = array(code)
+            size = num_rows * column.itemsize
+            if position + size > len(data):
+                raise ValueError("The timetable file is truncated.")
+            column.frombytes(view[position : position + size])
+            if sys.byteorder != "little":
+                column.byteswap()
+            timetable.columns[name] = column
+            position += size
+        for plan_id, (start, end, numbers, times) in metadata["classes"].items():
+            timetable.class_ranges[int(plan_id)] = start, end
+            timetable.period_numbers[int(plan_id)] = numbers
+            timetable.period_times[int(plan_id)] = times
+            timetable.plan_revisions[int(plan_id)] = timetable.revision
+        return timetable
+
+
+_timetable: Timetable = None
+# The modification time of the saved timetable when it was last loaded or saved
+_file_mtime: float = None
+
+
+def get_file_path() -> str:
+    """Returns the path of the saved timetable in the cache directory."""
+    return os.path.join(file_manager.CACHE_DIRECTORY, FILE_NAME)
+
+
+def get_file_mtime() -> float or None:
+    """Returns the modification time of the saved timetable, or None if it does not exist."""
+    try:
+        return os.path.getmtime(get_file_path())
+    except OSError:
+        return None
+
+
+def get_timetable() -> Timetable:
+    """Returns the school-wide timetable, loading the saved one on first use if there is one.
+
+    In read-only mode the saved timetable is kept up-to-date by the fetcher process, so it is
+    reloaded whenever the file has been modified since it was last loaded.
+    """
+    global _timetable, _file_mtime  # pylint: disable=global-statement
+    if _timetable is not None and not cache.read_only:
+        return _timetable
+    file_mtime = get_file_mtime()
+    if _timetable is not None and file_mtime == _file_mtime:
+        return _timetable
+    try:
+        with open(get_file_path(), "rb") as file:
+            _timetable = Timetable.from_bytes(file.read())
+    except (OSError, ValueError):
+        if _timetable is None:
+            _timetable = Timetable()
+    _file_mtime = file_mtime
+    return _timetable
+
+
+def save() -> None:
+    """Saves the timetable to the cache directory, replacing the file atomically."""
+    global _file_mtime  # pylint: disable=global-statement
+    os.makedirs(file_manager.CACHE_DIRECTORY, exist_ok=True)
+    filepath = get_file_path()
+    temp_filepath = f"{filepath}.{os.getpid()}.tmp"
+    with open(temp_filepath, "wb") as file:
+        file.write(get_timetable().to_bytes())
+    os.replace(temp_filepath, filepath)
+    _file_mtime = get_file_mtime()
@@ -4,6 +4,8 @@
 import asyncio
 import datetime
 import json
+import os
+from typing import Iterator
 from aiohttp import ClientConnectionError
 
 # Third-party imports
@@ -13,7 +15,8 @@ from corny_commons import file_manager, util as ccutil
 from corny_commons.util import web
 
 # Local application imports
-from modules import Month, data_manager, commands, util, api
+from modules import data_manager, commands, util, api, polling, fetcher, precompute, prefetch
+from modules import teachers, timeline
 from modules import Emoji, Weekday, ROLE_CODES
 from modules.commands import (
     get_help,
@@ -24,11 +27,14 @@ from modules.commands import (
 )
 
 
-# These settings ensure that data from the SU ILO API is only fetched a maximum of 3 times a day.
-# If the bot finds new data for a given day, it stops checking, so usually less than 3.
-UPDATE_NUMBERS_AT = 6  # Hour; i.e. check only if it's 06:00 AM
-UPDATE_NUMBERS_FOR = 1  # Minute; i.e. only check from 01:00:00 - 01:00:59
-UPDATE_NUMBERS_EVERY = 20  # Seconds; i.e. only check 3 times a minute
+# Default settings of the task that fetches the lucky numbers from the SU ILO API once a school day.
+# Each can be overridden by setting the environment variable of the same name, e.g. in '.env'.
+LUCKY_NUMBERS_SETTINGS = {
+    "LUCKY_NUMBERS_FETCH_AT": "06:00",  # Time of day at which to start fetching the numbers
+    "LUCKY_NUMBERS_GIVE_UP_AT": "12:00",  # Time of day after which not to retry any more
+    "LUCKY_NUMBERS_RETRY_DELAY": "20",  # Seconds before the first retry; doubles after each one
+    "LUCKY_NUMBERS_MAX_RETRY_DELAY": "900",  # Seconds
+}
 
 # Sets the maximum length of a message that can be sent without causing errors with the Discord API.
 MAX_MESSAGE_LENGTH = 4000  # Characters
@@ -65,9 +71,6 @@ HOMEWORK_EMOJI = Emoji.UNICODE_CHECK, Emoji.UNICODE_ALARM_CLOCK
 # noinspection SpellCheckingInspection
 AUTOMATIC_BOT_REPLIES = {MY_SERVER_ID: {"co jest?": "nie wjem"}}
 
-DAYS_IN_WEEKEND = len([Weekday.SATURDAY, Weekday.SUNDAY])
-
-
 class StatusMsg(str):
     """Constant declarations for bot status messages."""
 
@@ -123,6 +126,9 @@ restart_on_exit: bool = True
 # If this is set, it will override most output channels to be the channel with the given ID.
 testing_channel: int = None
 
+# The task that fetches the lucky numbers, started once the client is ready.
+lucky_numbers_task: asyncio.Task = None
+
 
 def send_log(*raw_message, force: bool = False) -> None:
     """Determine if the message should actually be logged.
@@ -168,19 +174,25 @@ async def on_ready() -> None:
     login_message = f"Successfully connected as {client.user}.\nActive guilds:"
     send_log(login_message, guilds, force=True)
 
+    check_for_fetcher()
+
+    # Discover the plan IDs of the classes before any lesson plans are fetched
+    await api.lesson_plan.update_plan_index_async()
+
     # Initialise lesson plan forcefully; force_update switch bypasses checking for cache.
     try:
-        plan = api.lesson_plan.get_lesson_plan_dp()
-    except web.InvalidResponseException as web_exc:
-        exc = ccutil.format_exception_info(web_exc)
+        plan = await api.lesson_plan.get_lesson_plan_dp_async()
+    except (web.InvalidResponseException, ValueError) as exc:
+        exc = ccutil.format_exception_info(exc)
         send_log(f"{BAD_RESPONSE}{exc}", force=True)
     else:
         send_log(f"Initialised lesson plan as {type(plan)}.")
-        util.lesson_plan_dp = plan
+        set_lesson_plan_dp(plan)
 
     with open("teachers.json", "r", encoding="utf-8") as file:
         data = json.load(file)
         util.teacher_subjects = data
+    teachers.build_index()
 
     # Intialise array of schooldays
     # schooldays = [key for key in plan if key in WEEKDAY_NAMES]
@@ -198,6 +210,23 @@ async def on_ready() -> None:
 
     # Starts loops that run continuously
     main_update_loop.start()
+    global lucky_numbers_task  # pylint: disable=global-statement
+    if lucky_numbers_task is None or lucky_numbers_task.done():
+        lucky_numbers_task = asyncio.create_task(run_lucky_numbers_task())
+
+
+@client.event
+async def on_member_update(before: discord.Member, after: discord.Member) -> None:
+    """Forgets the cached group mask of the member if their roles have changed."""
+    if before.roles != after.roles:
+        commands.forget_member_mask(after)
+
+
+@client.event
+async def on_guild_role_update(before: discord.Role, after: discord.Role) -> None:
+    """Forgets the cached group masks of all members if a role has been renamed."""
+    if before.name != after.name:
+        commands.forget_member_masks()
 
 
 # This function is called when someone sends a message in the server
@@ -238,6 +267,9 @@ async def on_message(message: discord.Message) -> None:
     async def run_command():
         try:
             reply = command_info["function"](message)
+            if asyncio.iscoroutine(reply):
+                # The command handler makes web requests; wait for it without blocking the loop
+                reply = await reply
         except MissingPermissionsException as invalid_perms_exc:
             error_message = (
                 f"{Emoji.WARNING} Nie posiadasz uprawnień do {invalid_perms_exc}."
@@ -354,7 +386,7 @@ def get_new_status_msg(query_time: datetime.datetime = None) -> str or False:
         is_weekend = query_time.weekday() >= Weekday.FRIDAY
         return StatusMsg.WEEKEND if is_weekend else StatusMsg.LESSONS_END
 
-    if check_is_summer_holidays(query_time):
+    if util.check_is_summer_holidays(query_time):
         new_status_msg = StatusMsg.SUMMER_HOLIDAYS
     elif next_period_is_today:
         new_status_msg = get_message_for_today_2()
@@ -444,19 +476,6 @@ async def remind_about_homework_event(
     data_manager.save_data_file()
 
 
-def check_is_summer_holidays(current_time: datetime.datetime) -> bool:
-    """Returns a boolean indicating if it is currently the summer holidays."""
-    current_year = current_time.year
-    holidays_end = datetime.datetime(current_year, Month.SEPTEMBER, 1)
-    if current_time >= holidays_end:
-        return False
-    # The summer holidays start after the Friday of the second-to-last week of June
-    june_thirtieth = datetime.date(current_year, Month.JUNE, 30)
-    holidays_start = 30 - june_thirtieth.weekday() - DAYS_IN_WEEKEND
-    holidays_start = datetime.datetime(current_year, Month.JUNE, holidays_start)
-    return current_time >= holidays_start
-
-
 @loop(seconds=1)
 async def main_update_loop() -> None:
     """Routinely fetches data from various APIs to ensure the cache is up-to-date.
@@ -464,8 +483,10 @@ async def main_update_loop() -> None:
 
     API updates:
         - Steam Community Market item prices -- every 30 min
-        - The substitutions from the I LO website -- every 1 h
-        - The lucky numbers from the SUI LO API -- according to the settings
+        - The substitutions from the I LO website -- according to the polling planner
+        - The lesson plans of all classes from the I LO website -- every day at 05:00
+        - The lesson plans of the most requested classes -- every day before the first lessons
+        - All of the above used by the morning commands, rendering their responses -- every night
 
     Non-API updates:
         - The bot status -- every 1 min
@@ -476,6 +497,9 @@ async def main_update_loop() -> None:
 
     # Tasks that only update on the first second of a given minute
     if current_time.second == 0:
+        # Only read the caches while the fetcher process is keeping them up-to-date
+        check_for_fetcher()
+
         # Update the bot status once a minute
         status_update_msg: str = await check_for_status_updates(current_time)
         if status_update_msg != STATUS_UPDATE_UNNECESSARY_MSG:
@@ -485,48 +509,28 @@ async def main_update_loop() -> None:
             # Update the Steam Market prices every half hour
             await check_for_steam_market_updates()
 
-            if current_time.minute == 0:
-                # Update the substitutions cache every hour
-                await check_for_substitutions_updates(use_debug_channel=False)
+        if current_time.hour == 5 and current_time.minute == 0:
+            # Sync the lesson plans of all classes once a day
+            await check_for_lesson_plan_updates()
 
-    # Check if the lucky numbers data is outdated
-    try:
-        # Try to parse the lucky numbers data date
-        cached_date: datetime.datetime = api.lucky_numbers.cached_data["date"]
-    except (TypeError, KeyError) as exception:
-        # Lucky numbers data does not contain a date
-        # await ping_owner()
-        fmt_exc = ccutil.format_exception_info(exception)
-        send_log(fmt_exc)
-    else:
-        if cached_date == current_time.date() or current_time.hour != UPDATE_NUMBERS_AT:
-            # Data does not need to be updated; only update at the given time
-            return
-            # The bot will update every x seconds so that it doesn't exceed the max
-        if (
-            current_time.minute >= UPDATE_NUMBERS_FOR
-            or current_time.second % UPDATE_NUMBERS_EVERY
-        ):
-            # Initial update period of API update window; don't update more than the maximum
-            return
-    if check_is_summer_holidays(current_time):
-        return
-    # Lucky numbers data is not current; update it
-    await check_for_lucky_numbers_updates()
+        if (current_time.hour, current_time.minute) == prefetch.PREFETCH_TIME:
+            # Keep the lesson plans that will likely be requested today warm
+            await check_for_plan_prefetch(current_time)
+
+        if (current_time.hour, current_time.minute) == precompute.PRECOMPUTE_TIME:
+            # Render the responses to the morning commands while nobody is using the bot
+            await precompute_responses(current_time)
+
+        if polling.planner.should_poll(current_time):
+            # Update the substitutions cache, more often when they are usually published
+            await check_for_substitutions_updates(use_debug_channel=False)
 
 
 async def check_for_status_updates(current_time: datetime.datetime, force=False) -> str:
     """Checks if the current hour and minute is in any time slot for the lesson plan timetable."""
-    now = current_time.hour, current_time.minute
-    # Loop throught each period to see if the current time is the same as either start or end time
-    if not force:
-        for start_end_times in util.lesson_plan_dp["times"]:
-            if now in start_end_times:
-                # Current time is either the period's start or end time; stop checking further times
-                break
-        else:
-            # We have reached the end of the loop without finding a match
-            return STATUS_UPDATE_UNNECESSARY_MSG
+    if not force and not timeline.is_transition(current_time):
+        # The current time is neither the start nor the end time of any period
+        return STATUS_UPDATE_UNNECESSARY_MSG
     # Check is successful; update bot's Discord status
     msg: str = get_new_status_msg(current_time)
     if not msg:
@@ -592,7 +596,7 @@ async def check_for_steam_market_updates() -> None:
     for item in steam_market.tracked_market_items:
         await asyncio.sleep(3)
         try:
-            result = api.steam_market.get_item(item.name)
+            result = await api.steam_market.get_item_async(item.name, tracked=True)
             price = api.steam_market.get_item_price(result)
         except web.WebException as web_exc:
             await ping_owner()
@@ -612,25 +616,188 @@ async def check_for_steam_market_updates() -> None:
         data_manager.save_data_file()
 
 
-async def check_for_lucky_numbers_updates() -> None:
+def check_for_fetcher() -> None:
+    """Switches the web API caches to read-only mode if the fetcher process is running.
+
+    Switches them back if it has stopped, so that the bot fetches the data itself again.
+    """
+    is_running = fetcher.is_running()
+    if is_running == api.cache.read_only:
+        return
+    api.cache.read_only = is_running
+    if is_running:
+        send_log("Fetcher process detected; reading the data from the shared cache.", force=True)
+    else:
+        send_log("Fetcher process stopped; fetching the data directly.", force=True)
+
+
+def set_lesson_plan_dp(plan: dict) -> None:
+    """Replaces the DP lesson plan and rebuilds the lookups that are compiled from it."""
+    commands.compile_lesson_plan_dp(plan)
+    util.lesson_plan_dp = plan
+    teachers.build_index()
+    timeline.build()
+
+
+async def check_for_lesson_plan_updates() -> None:
+    """Syncs the lesson plans of all classes and logs the classes whose timetables have changed.
+
+    Reloads the DP lesson plan if its timetable is among them.
+    """
+    report = await api.lesson_plan.sync_lesson_plans()
+    if report["changed"]:
+        class_names = [api.lesson_plan.get_class_name(plan_id) for plan_id in report["changed"]]
+        send_log(f"The lesson plans of these classes have changed: {class_names}", force=True)
+    if report["failed"]:
+        send_log(f"Could not sync the lesson plans with IDs {report['failed']}.", force=True)
+    if api.lesson_plan.get_dp_times_plan_id() in report["changed"]:
+        set_lesson_plan_dp(await api.lesson_plan.get_lesson_plan_dp_async())
+        precompute.invalidate(precompute.LESSON_PLAN)
+
+
+async def precompute_responses(current_time: datetime.datetime) -> None:
+    """Refreshes the caches used by the '!plan', '!zast' and '!num' commands, and renders their
+    responses for the next school day."""
+    day = precompute.get_target_day(current_time)
+    # Render the responses from scratch rather than serving the previous ones
+    precompute.clear()
+    try:
+        set_lesson_plan_dp(await api.lesson_plan.get_lesson_plan_dp_async())
+    except (web.WebException, ValueError) as exc:
+        send_log(f"Could not refresh the DP lesson plan: {exc}", force=True)
+    await check_for_substitutions_updates(use_debug_channel=False)
+    await check_for_lucky_numbers_updates(ping_on_error=False)
+    responses = {
+        "plan": (
+            commands.plan.format_lesson_plan_dp(day.weekday()),
+            [precompute.LESSON_PLAN],
+        ),
+        "zast": (
+            await substitutions.get_new_substitutions_embed(),
+            [precompute.SUBSTITUTIONS, precompute.LESSON_PLAN],
+        ),
+        "num": (await lucky_numbers.get_lucky_numbers_embed(), [precompute.LUCKY_NUMBERS]),
+    }
+    for command_name, (response, sources) in responses.items():
+        if isinstance(response, discord.Embed):
+            precompute.store(command_name, response, sources, day)
+    send_log(f"Pre-rendered the command responses for {day}:", precompute.stats)
+
+
+async def check_for_plan_prefetch(current_time: datetime.datetime) -> None:
+    """Refreshes the lesson plans of the most requested classes and logs the prefetch statistics."""
+    refreshed = await prefetch.prefetcher.prefetch(current_time)
+    if refreshed:
+        class_names = [api.lesson_plan.get_class_name(plan_id) for plan_id in refreshed]
+        send_log(f"Prefetched the lesson plans of classes {class_names}.")
+    send_log(prefetch.prefetcher.get_report())
+
+
+def get_lucky_numbers_setting(name: str) -> datetime.time or int:
+    """Returns the value of the lucky numbers task setting, from the environment if it's set there.
+
+    Values in the format 'HH:MM' are returned as times of day, all other values as integers.
+    """
+    value: str = os.environ.get(name, LUCKY_NUMBERS_SETTINGS[name])
+    if ":" in value:
+        hour, minute = value.split(":")
+        return datetime.time(int(hour), int(minute))
+    return int(value)
+
+
+def get_next_lucky_numbers_fetch(
+    now: datetime.datetime, skip_today: bool = False
+) -> datetime.datetime:
+    """Returns the time at which the lucky numbers should next be fetched.
+
+    Arguments:
+        now -- the current time.
+        skip_today -- if True, the next fetch will be on the next school day after today.
+    """
+    fetch_at: datetime.time = get_lucky_numbers_setting("LUCKY_NUMBERS_FETCH_AT")
+    give_up_at: datetime.time = get_lucky_numbers_setting("LUCKY_NUMBERS_GIVE_UP_AT")
+    day = now.date()
+    is_current = api.lucky_numbers.cached_data.get("date") == day
+    if skip_today or is_current or now.time() >= give_up_at:
+        day += datetime.timedelta(days=1)
+    while not polling.is_school_day(day):
+        day += datetime.timedelta(days=1)
+    return max(now, datetime.datetime.combine(day, fetch_at))
+
+
+def get_lucky_numbers_retry_delays() -> Iterator[int]:
+    """Yields the number of seconds to wait before each retry of today's lucky numbers fetch.
+    The delay doubles after each retry, and there are no more retries after the give-up time."""
+    delay: int = get_lucky_numbers_setting("LUCKY_NUMBERS_RETRY_DELAY")
+    max_delay: int = get_lucky_numbers_setting("LUCKY_NUMBERS_MAX_RETRY_DELAY")
+    give_up_at: datetime.time = get_lucky_numbers_setting("LUCKY_NUMBERS_GIVE_UP_AT")
+    give_up_time = datetime.datetime.combine(datetime.date.today(), give_up_at)
+    while datetime.datetime.now() + datetime.timedelta(seconds=delay) <= give_up_time:
+        yield delay
+        delay = min(delay * 2, max_delay)
+
+
+async def fetch_current_lucky_numbers() -> None:
+    """Fetches the lucky numbers until the SU ILO API returns the numbers for today.
+
+    Retries with exponential backoff, giving up at the time given by the settings.
+    """
+    retry_delays = get_lucky_numbers_retry_delays()
+    while True:
+        try:
+            await check_for_lucky_numbers_updates(ping_on_error=False)
+        except Exception as exc:  # pylint: disable=broad-except
+            # E.g. a malformed response; don't let it end the task, and retry as for bad responses
+            exc_info: str = ccutil.format_exception_info(exc)
+            send_log(f"Error while fetching the lucky numbers:\n{exc_info}", force=True)
+        if api.lucky_numbers.cached_data.get("date") == datetime.date.today():
+            return
+        delay = next(retry_delays, None)
+        if delay is None:
+            await ping_owner()
+            send_log("Could not fetch today's lucky numbers; giving up.", force=True)
+            return
+        send_log(f"The lucky numbers are not for today yet. Retrying in {delay}s.")
+        await asyncio.sleep(delay)
+
+
+async def run_lucky_numbers_task() -> None:
+    """Sleeps until the lucky numbers fetch window of each school day, then fetches them."""
+    await client.wait_until_ready()
+    fetched_today = False
+    while True:
+        now = datetime.datetime.now()
+        next_fetch = get_next_lucky_numbers_fetch(now, skip_today=fetched_today)
+        send_log(f"Next lucky numbers fetch at {next_fetch:%d/%m/%Y %X}.")
+        await asyncio.sleep((next_fetch - now).total_seconds())
+        await fetch_current_lucky_numbers()
+        fetched_today = True
+
+
+async def check_for_lucky_numbers_updates(ping_on_error: bool = True) -> None:
     """Updates the lucky numbers cache.
 
     If it has changed, announces announces the new numbers in the specified channel.
+
+    Arguments:
+        ping_on_error -- a boolean indicating if the owner should be pinged if the request fails.
     """
     try:
-        old_cache = api.lucky_numbers.update_cache()
+        old_cache = await api.lucky_numbers.update_cache_async()
     except web.InvalidResponseException as web_exc:
-        await ping_owner()
+        if ping_on_error:
+            await ping_owner()
         exc: str = ccutil.format_exception_info(web_exc)
         send_log(f"Lucky numbers update: {BAD_RESPONSE}{exc}", force=True)
     else:
         if old_cache != api.lucky_numbers.cached_data:
+            precompute.invalidate(precompute.LUCKY_NUMBERS)
             old_str: str = api.lucky_numbers.serialise(old_cache, pretty=True)
             send_log(f"Lucky numbers data updated! Old data:\n{old_str}", force=True)
             target_channel = testing_channel or ChannelID.NUMERKI
             target_channel = client.get_channel(target_channel)
             data_manager.save_data_file()
-            lucky_numbers_msg = lucky_numbers.get_lucky_numbers_embed()
+            lucky_numbers_msg = await lucky_numbers.get_lucky_numbers_embed()
             if isinstance(lucky_numbers_msg, discord.Embed):
                 await target_channel.send(embed=lucky_numbers_msg)
                 return
@@ -653,7 +820,7 @@ async def announce_substitutions(
     if not isinstance(subs, discord.Embed):
         # The provided substitutions embed is an error message
         return subs
-    raw_subs: dict[str, any] = api.substitutions.get_substitutions()[0]
+    raw_subs: dict[str, any] = (await api.substitutions.get_substitutions_async())[0]
     send_message_args = {
         "channel": target_channel,
         "content": subs,
@@ -693,11 +860,20 @@ async def announce_substitutions(
 async def check_for_substitutions_updates(use_debug_channel: bool = True) -> None:
     """Updates the substitutions cache and checks if it's changed."""
     try:
-        new_cache, old_cache = api.substitutions.get_substitutions(force_update=True)
+        new_cache, old_cache = await api.substitutions.get_substitutions_async(
+            force_update=True
+        )
         if "error" in new_cache:
             raise RuntimeError("Substitutions data could not be parsed.")
     except web.InvalidResponseException as web_exc:
         # The web request returned an invalid response; log the error details
+        if isinstance(
+            web_exc, (api.async_web.CircuitOpenException, api.cache.CacheNotFoundException)
+        ):
+            # The school website is down or the fetcher process has only just started; don't ping
+            # the owner again until the substitutions are available
+            send_log(f"Skipping substitutions update. {web_exc}", force=True)
+            return
         if web_exc.status_code == 403:
             send_log("Suppressing 403 Forbidden on substitutions page.", force=True)
             return
@@ -708,11 +884,16 @@ async def check_for_substitutions_updates(use_debug_channel: bool = True) -> Non
         exc: str = new_cache.get("error")
         exception_message = f"Error! {err_desc} Exception trace:\n{exc}"
     else:
+        if new_cache is old_cache:
+            # The page was not modified, so it was not even parsed. Skip the comparison.
+            send_log("Substitutions page unchanged:", api.substitutions.poll_stats)
+            return
         send_log("Substitutions cache equality:", new_cache == old_cache)
         if new_cache == old_cache:
             # The cache was not updated. Do nothing.
             return
-        subs_embed: discord.Embed or str = substitutions.get_new_substitutions_embed()
+        precompute.invalidate(precompute.SUBSTITUTIONS)
+        subs_embed: discord.Embed or str = await substitutions.get_new_substitutions_embed()
         same_day = new_cache.keys() == old_cache.keys()
         exception_message = await announce_substitutions(
             subs_embed, same_day=same_day, debug_mode=use_debug_channel
@@ -730,6 +911,11 @@ async def close() -> None:
     await client.wait_until_ready()
     await client.change_presence(status=discord.Status.offline)
     send_log("Bot is offline.")
+    if lucky_numbers_task is not None:
+        lucky_numbers_task.cancel()
+    # Close the web API connection pool and stop the parser processes
+    await api.async_web.close()
+    api.parsing.shutdown()
     # Sleep for 500 ms to ensure that the client.close() coroutine is the last to execute.
     await asyncio.sleep(0.5)
     await client.close()
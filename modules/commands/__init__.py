@@ -4,10 +4,25 @@
 from datetime import datetime, timedelta
 
 # Third-party imports
-from discord import Role, Message, TextChannel
+from discord import Member, Role, Message, TextChannel
+from corny_commons.util import polish
 
 # Local application imports
-from modules import Weekday, Emoji, WEEKDAY_NAMES, ROLE_CODES, bot, util
+from modules import Emoji, WEEKDAY_NAMES, ROLE_CODES, bot, timeline, util
+from modules.api.cache import StaleCache
+
+# Each group is mapped to a bit, so that the groups of a member or a lesson are a single integer
+GROUP_BITS: dict[str, int] = {group: 1 << index for index, group in enumerate(ROLE_CODES)}
+_ROLE_NAME_BITS: dict[str, int] = {ROLE_CODES[group]: bit for group, bit in GROUP_BITS.items()}
+
+# The group masks of the members' roles, keyed by guild ID and member ID; forgotten when their roles
+# change or any role is renamed
+_member_masks: dict[tuple[int, int], int] = {}
+# The group mask index of the lesson plan (see `get_lesson_index()`) and the plan it was built from
+_lesson_index: dict[str, list[tuple[int, list[tuple[int, dict]]]]] = {}
+_indexed_plan: dict = None
+# The DP lesson plan and its compiled form (see `compile_lesson_plan_dp()`)
+_compiled_plan_dp: tuple[dict, tuple[tuple[tuple[str]]]] = None, ()
 
 
 class HomeworkEvent:
@@ -156,76 +171,95 @@ def get_next_period(given_time: datetime) -> tuple[bool, int, int]:
     If the current time is during a lesson, the period number will be incremented by 20.
     """
     bot.send_log(f"Getting next period for {given_time:%d/%m/%Y %X} ...")
-    current_day_index: int = given_time.weekday()
-
-    if current_day_index < Weekday.SATURDAY:
-        for period, times in enumerate(util.lesson_plan_dp["times"]):
-            # I don't know why this was here so I'm commenting it out
-            # if period > 10:
-            #     bot.send_log("Early breaking loop searching for next lesson")
-            #     # There are no more lessons for today
-            #     break
-            for is_during_lesson, time in enumerate(times):
-                hour, minute = time
-                if given_time.hour * 60 + given_time.minute < hour * 60 + minute:
-                    when = "lesson" if is_during_lesson else "break"
-                    found = f"... this is before {hour:02}:{minute:02} (period {period} {when})."
-                    bot.send_log(found)
-                    return True, period + 20 * is_during_lesson, current_day_index
-        # Could not find any such lesson.
-        # If it's currently Friday, the modulo operation will return 0 (Monday).
-        next_school_day: Weekday = (current_day_index + 1) % Weekday.SATURDAY
+    next_period_is_today, period, weekday = timeline.get_next_period(given_time)
+    if next_period_is_today:
+        when = "lesson" if period >= timeline.LESSON_PERIOD_OFFSET else "break"
+        bot.send_log(f"... this is period {period % timeline.LESSON_PERIOD_OFFSET} {when}.")
     else:
-        next_school_day = Weekday.MONDAY
-
-    # If it's currently weekend or after the last lesson for the day
-    bot.send_log(
-        f"... there are no more lessons today. Next school day: {next_school_day}"
-    )
-    first_period = -1  # Initialise so PyLint doesn't complain
-    for first_period, lessons in enumerate(
-        util.lesson_plan_dp["weekdays"][next_school_day]
-    ):
-        # Stop incrementing 'first_period' when the 'lessons' object is a non-empty list
-        if lessons:
-            break
-    return False, first_period, next_school_day
+        bot.send_log(f"... there are no more lessons today. Next school day: {weekday}")
+    return next_period_is_today, period, weekday
 
 
-def get_lesson_by_roles(
-    query_period: int, weekday: int, roles: list[str, Role]
-) -> dict[str, str]:
-    """Get the lesson details for a given period, day and user roles list.
+def get_roles_mask(roles: list[str, Role]) -> int:
+    """Returns the mask of the groups that the lessons for the given roles are intended for.
+
     Arguments:
-        `query_period` -- the period number to look for.
+        roles -- the group codes (e.g. 'grupa_1') or the Discord roles named after the groups.
+    """
+    # The lessons for the entire class are always included
+    mask = GROUP_BITS["grupa_0"]
+    for role in roles:
+        if role in GROUP_BITS:
+            mask |= GROUP_BITS[role]
+        mask |= _ROLE_NAME_BITS.get(str(role), 0)
+    return mask
 
-        `weekday` -- the index of the weekday to look at.
 
-        `roles` -- the roles of the user that the lesson is defined to be intended for.
+def get_member_mask(member: Member) -> int:
+    """Returns the group mask of the member's roles. Cached until the member's roles change."""
+    key = member.guild.id, member.id
+    mask = _member_masks.get(key)
+    if mask is None:
+        mask = _member_masks[key] = get_roles_mask(member.roles)
+    return mask
+
+
+def forget_member_mask(member: Member) -> None:
+    """Forgets the cached group mask of the member, e.g. because their roles have changed."""
+    _member_masks.pop((member.guild.id, member.id), None)
+
+
+def forget_member_masks() -> None:
+    """Forgets the cached group masks of all members, e.g. because a role has been renamed."""
+    _member_masks.clear()
+
+
+def get_lesson_index() -> dict[str, list[tuple[int, list[tuple[int, dict]]]]]:
+    """Returns the group mask index of `util.lesson_plan`, rebuilding it if the plan was replaced.
+
+    For each weekday name, the index contains a list of periods. Each period is a tuple of the
+    union of the group masks of its lessons and a list of the lessons paired with their masks.
+    """
+    global _indexed_plan  # pylint: disable=global-statement
+    if _indexed_plan is not util.lesson_plan:
+        _lesson_index.clear()
+        for weekday_name in WEEKDAY_NAMES:
+            periods = []
+            for lessons in util.lesson_plan.get(weekday_name, []):
+                # Lessons for groups without a role are never found
+                lesson_masks = [(GROUP_BITS.get(lesson["group"], 0), lesson) for lesson in lessons]
+                period_mask = 0
+                for lesson_mask, _ in lesson_masks:
+                    period_mask |= lesson_mask
+                periods.append((period_mask, lesson_masks))
+            _lesson_index[weekday_name] = periods
+        _indexed_plan = util.lesson_plan
+    return _lesson_index
+
+
+def get_lesson_by_mask(query_period: int, weekday: int, mask: int) -> dict[str, str]:
+    """Get the lesson details for a given period, day and group mask.
+
+    Arguments:
+        query_period -- the period number to look for.
+        weekday -- the index of the weekday to look at.
+        mask -- the mask of the groups that the lesson is intended for (see `get_roles_mask()`).
 
     Returns a dictionary containing the lesson details including the period, or an empty dictionary
     if no lesson was found.
     """
-    # Initialise the roles we would like the lesson to be for
-    target_roles = [] if "grupa_0" in roles else ["grupa_0"]
-    for role in roles:
-        if role in ROLE_CODES or str(role) in ROLE_CODES.values():
-            target_roles.append(str(role))
-    # Loop through each lesson that day
     weekday_name = WEEKDAY_NAMES[weekday]
-    looking_msg = (
-        f"{weekday_name}, period {query_period} on  with roles: {target_roles})"
-    )
-    bot.send_log("Looking for lesson on " + looking_msg)
-    for period, lessons in enumerate(util.lesson_plan[weekday_name]):
-        if period < query_period:
+    bot.send_log(f"Looking for lesson on {weekday_name}, period {query_period} for mask {mask:#x}")
+    periods = get_lesson_index()[weekday_name]
+    for period in range(max(query_period, 0), len(periods)):
+        period_mask, lesson_masks = periods[period]
+        if not period_mask & mask:
             continue
-        for lesson in lessons:
-            group = lesson["group"]
-            if not (group in target_roles or ROLE_CODES[group] in target_roles):
+        for lesson_mask, lesson in lesson_masks:
+            if not lesson_mask & mask:
                 continue
             found_lesson_msg = (
-                f"Found lesson '{lesson['name']}' for '{group}' on period {period}."
+                f"Found lesson '{lesson['name']}' for '{lesson['group']}' on period {period}."
             )
             bot.send_log(found_lesson_msg)
             lesson_info = dict(lesson)
@@ -236,23 +270,75 @@ def get_lesson_by_roles(
     return {}
 
 
-def get_lessons_dp(query_period: int, weekday: int) -> list[str]:
-    """Returns a list of all the lessons currently taking place."""
+def get_lesson_by_roles(
+    query_period: int, weekday: int, roles: list[str, Role]
+) -> dict[str, str]:
+    """Get the lesson details for a given period, day and user roles list.
+    Arguments:
+        `query_period` -- the period number to look for.
+
+        `weekday` -- the index of the weekday to look at.
+
+        `roles` -- the roles of the user that the lesson is defined to be intended for.
 
-    def format_lesson(lesson: dict) -> str:
-        formatted = lesson["name"]
-        level = lesson.get("level")
-        if level:
-            formatted += f" {level}"
-        return formatted
+    Returns a dictionary containing the lesson details including the period, or an empty dictionary
+    if no lesson was found.
+    """
+    return get_lesson_by_mask(query_period, weekday, get_roles_mask(roles))
+
+
+def format_lesson_dp(lesson: dict) -> str:
+    """Returns the lesson's name followed by its level, if any, e.g. 'Physics HL'."""
+    formatted = lesson["name"]
+    level = lesson.get("level")
+    if level:
+        formatted += f" {level}"
+    return formatted
+
+
+def compile_lesson_plan_dp(plan: dict) -> None:
+    """Compiles the DP lesson plan into the formatted lessons taking place on each period of each
+    weekday, and replaces the previously compiled plan with it."""
+    global _compiled_plan_dp  # pylint: disable=global-statement
+    compiled_weekdays = []
+    for blocks in plan["weekdays"]:
+        num_periods = max([len(plan["times"])] + [block["blockEnd"] + 1 for block in blocks])
+        periods = [[] for _ in range(num_periods)]
+        for block in blocks:
+            lessons = [format_lesson_dp(lesson) for lesson in block["lessons"]]
+            for period in range(block["blockStart"], block["blockEnd"] + 1):
+                periods[period] += lessons
+        compiled_weekdays.append(tuple(tuple(lessons) for lessons in periods))
+    # Replace the source plan and the compiled plan at once
+    _compiled_plan_dp = plan, tuple(compiled_weekdays)
+
+
+def get_lessons_dp_on_day(weekday: int) -> tuple[tuple[str]]:
+    """Returns the formatted lessons taking place on each period of the given day."""
+    if _compiled_plan_dp[0] is not util.lesson_plan_dp:
+        compile_lesson_plan_dp(util.lesson_plan_dp)
+    return _compiled_plan_dp[1][weekday]
 
-    plan_for_today = util.lesson_plan_dp["weekdays"][weekday]
+
+def get_lessons_dp(query_period: int, weekday: int) -> list[str]:
+    """Returns a list of all the lessons currently taking place."""
     bot.send_log(f"Getting lessons for {WEEKDAY_NAMES[weekday]} period {query_period}.")
-    lessons = []
-    for block in plan_for_today:
-        if block["blockStart"] <= query_period % 20 <= block["blockEnd"]:
-            lessons += map(format_lesson, block["lessons"])
-    return lessons
+    periods = get_lessons_dp_on_day(weekday)
+    query_period %= 20
+    return list(periods[query_period]) if query_period < len(periods) else []
+
+
+def get_stale_data_notice(data: dict) -> str:
+    """Returns a notice informing about the age of the data if it is a stale copy of a cache that
+    could not be refreshed. Otherwise, returns an empty string."""
+    if not isinstance(data, StaleCache):
+        return ""
+    mins = int(data.age // 60)
+    if mins < 60:
+        age = polish.conjugate_numeric(mins, "minut")
+    else:
+        age = polish.conjugate_numeric(mins // 60, "godzin")
+    return f"\nDane pobrane {age} temu; strona szkoły jest chwilowo niedostępna."
 
 
 def get_datetime_from_input(message: Message, calling_command: str) -> datetime or str:
@@ -298,3 +384,24 @@ def get_datetime_from_input(message: Message, calling_command: str) -> datetime
         "microsecond": 0,
     }
     return current_time.replace(**params)
+
+
+def get_weekday_from_input(arg: str) -> int:
+    """Returns the weekday number (0-4) given as a command argument, which is either the day of the
+    week's number (1-5), its abbreviation or the beginning of its name.
+
+    Raises ValueError if the argument is not a valid weekday.
+    """
+    arg = arg.lower()
+    try:
+        return {"pn": 0, "śr": 2, "sr": 2, "pt": 4}[arg]
+    except KeyError:
+        pass
+    if arg.isdigit():
+        if not 1 <= int(arg) <= len(WEEKDAY_NAMES):
+            raise ValueError(f"{arg} is not a number between 1 and 5.")
+        return int(arg) - 1
+    for weekday, weekday_name in enumerate(WEEKDAY_NAMES):
+        if weekday_name.lower().startswith(arg):
+            return weekday
+    raise ValueError(f"invalid weekday name: {arg}")
@@ -0,0 +1,42 @@
+"""Module containing code relating to the 'sale' command."""
+
+# Third-party imports
+from discord import Message, Embed
+
+# Local application imports
+from modules import bot, rooms, util, Emoji
+from modules.api import lesson_plan
+from modules.commands import get_weekday_from_input
+from modules.commands.plan import get_lesson_description, get_weekday
+
+
+DESC = """Podaje sale, w których nie ma żadnej lekcji w danym dniu na danej lekcji.
+    Parametry: __dzień tygodnia__, __numer lekcji__
+    Przykład: `{p}sale pon 3` - wyświetliłyby się wolne sale na 3. lekcji w poniedziałek."""
+
+NO_PLANS_MSG = "{} Plany lekcji nie zostały jeszcze pobrane. Spróbuj ponownie później."
+INVALID_ARGS_MSG = (
+    "{} Należy napisać po komendzie `{}sale` numer dnia (1-5) bądź dzień tygodnia, "
+    "a następnie numer lekcji."
+)
+
+
+def get_free_rooms(message: Message) -> str or Embed:
+    """Event handler for the 'sale' command."""
+    args: list[str] = message.content.split(" ")
+    try:
+        query_day = get_weekday_from_input(args[1])
+        period = int(args[2])
+        if not 0 <= period < len(util.lesson_plan_dp["times"]):
+            raise ValueError(f"there is no period {period} in the lesson plan")
+    except (IndexError, ValueError):
+        return INVALID_ARGS_MSG.format(Emoji.WARNING, bot.prefix)
+    if not lesson_plan.is_timetable_complete():
+        return NO_PLANS_MSG.format(Emoji.WARNING)
+    free_rooms = rooms.get_free_rooms(query_day, period)
+    desc = f"Wyświetlam wolne sale na **{get_weekday(query_day)}**."
+    embed = Embed(title="Wolne sale", description=desc)
+    embed.set_footer(text=f"Użyj komendy {bot.prefix}sale, aby pokazać tą wiadomość.")
+    value = ", ".join(free_rooms) or "*Brak wolnych sal.*"
+    embed.add_field(name=get_lesson_description(period, query_day), value=value, inline=False)
+    return embed
@@ -6,12 +6,14 @@ from discord import Message, Embed
 # Local application imports
 from modules import bot
 from modules.commands import (
+    free_rooms,
     next_lesson,
     next_break,
     plan,
     homework,
     steam_market,
     lucky_numbers,
+    teacher_schedule,
 )
 from modules.commands import substitutions, meet, exec as execute, terminate, dump_file
 
@@ -84,6 +86,11 @@ INFO: dict[str, dict[str, any]] = {
         "description": "Alias komendy `{p}numerki`.",
         "function": lucky_numbers.get_lucky_numbers_embed,
     },
+    "sale": {"description": free_rooms.DESC, "function": free_rooms.get_free_rooms},
+    "nauczyciel": {
+        "description": teacher_schedule.DESC,
+        "function": teacher_schedule.get_teacher_schedule,
+    },
     "zast": {
         "description": substitutions.DESC,
         "function": substitutions.get_new_substitutions_embed,
@@ -9,17 +9,20 @@ from corny_commons import util as ccutil
 from corny_commons.util import web
 
 # Local application imports
-from modules import bot, util, MEMBER_IDS
-from modules.api.lucky_numbers import get_lucky_numbers
+from modules import bot, util, precompute, MEMBER_IDS
+from modules.api.lucky_numbers import get_lucky_numbers_async
 
 
 DESC = """Podaje aktualne szczęśliwe numerki oraz klasy, które są z nich wykluczone."""
 
 
-def get_lucky_numbers_embed(_: Message = None) -> Embed or str:
+async def get_lucky_numbers_embed(_: Message = None) -> Embed or str:
     """Event handler for the 'num' command."""
+    rendered = precompute.get_rendered("num")
+    if rendered is not None:
+        return rendered
     try:
-        data = get_lucky_numbers()
+        data = await get_lucky_numbers_async()
     except web.WebException as web_exc:
         exc: str = ccutil.format_exception_info(web_exc)
         bot.send_log(f"{bot.BAD_RESPONSE}{exc}", force=True)
@@ -12,7 +12,8 @@ from corny_commons.util import polish
 from modules import bot, util, Emoji
 from modules.commands import (
     get_datetime_from_input,
-    get_lesson_by_roles,
+    get_lesson_by_mask,
+    get_member_mask,
     get_next_period,
 )
 
@@ -33,8 +34,8 @@ def get_next_break(message: Message) -> str:
     next_period_is_today, lesson_period = get_next_period(time)[:2]
 
     if next_period_is_today:
-        lesson = get_lesson_by_roles(
-            lesson_period % 20, time.weekday(), message.author.roles
+        lesson = get_lesson_by_mask(
+            lesson_period % 20, time.weekday(), get_member_mask(message.author)
         )
         if not lesson:
             return f"{Emoji.INFO} Dzisiaj już nie ma dla Ciebie żadnych lekcji!"
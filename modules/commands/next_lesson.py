@@ -13,7 +13,8 @@ from modules import bot, util, Emoji, Weekday, GROUP_NAMES
 from modules.commands import (
     get_datetime_from_input,
     get_next_period,
-    get_lesson_by_roles,
+    get_lesson_by_mask,
+    get_member_mask,
 )
 
 
@@ -33,8 +34,8 @@ def get_next_lesson(message: Message) -> str or Embed:
         # next_lesson_is_today, lesson_period, weekday_index = get_next_period(time)
         next_lesson = get_next_period(time)
         next_period = next_lesson[1] % 19
-        lesson = next_period, next_lesson[-1], message.author.roles
-        lesson = get_lesson_by_roles(*lesson)
+        lesson = next_period, next_lesson[-1], get_member_mask(message.author)
+        lesson = get_lesson_by_mask(*lesson)
         if not lesson:
             return (
                 f"{Emoji.INFO} Nie ma żadnych zajęć dla Twojej grupy"
@@ -8,9 +8,9 @@ from discord import Message, Embed
 from corny_commons.util import web
 
 # Local application imports
-from modules import bot, util, Weekday, Emoji, WEEKDAY_NAMES
+from modules import bot, util, precompute, prefetch, Weekday, Emoji, WEEKDAY_NAMES
 from modules.api import lesson_plan
-from modules.commands import get_lessons_dp
+from modules.commands import get_lessons_dp_on_day, get_stale_data_notice, get_weekday_from_input
 
 
 DESC = """Pokazuje plan lekcji dla danego dnia, domyślnie dla naszej klasy na dzień dzisiejszy.
@@ -29,7 +29,10 @@ def get_weekday(day: int) -> str:
 
 def get_lesson_description(period: int, day: int) -> str:
     """Gets the description for a given period in the lesson plan."""
-    txt = f"Lekcja {period} ({util.get_formatted_period_time(period)})"
+    txt = f"Lekcja {period}"
+    if period < len(util.lesson_plan_dp["times"]):
+        # Other classes may have later periods than the DP class, whose times are not known
+        txt += f" ({util.get_formatted_period_time(period)})"
     is_current_lesson = (
         day == datetime.now().weekday() and period == util.current_period
     )
@@ -58,7 +61,8 @@ def format_lesson_plan(
     embed = Embed(
         title=f"Plan lekcji dla {class_code}", description=desc, url=lesson_plan_url
     )
-    embed.set_footer(text=f"Użyj komendy {bot.prefix}plan, aby pokazać tą wiadomość.")
+    footer = f"Użyj komendy {bot.prefix}plan, aby pokazać tą wiadomość."
+    embed.set_footer(text=footer + get_stale_data_notice(plan))
 
     for period in plan["Nr"]:
         if not today_plan[period]:
@@ -85,8 +89,10 @@ def format_lesson_plan_dp(query_day: int) -> str or Embed:
         description=f"Wyświetlam plan na **{get_weekday(query_day)}**.",
     )
     embed.set_footer(text=f"Użyj komendy {bot.prefix}plan, aby pokazać tą wiadomość.")
+    # The compiled plan has at least as many periods as there are period times
+    lessons_on_day = get_lessons_dp_on_day(query_day)
     for period, _ in enumerate(util.lesson_plan_dp["times"]):
-        lessons = "\n".join(get_lessons_dp(period, query_day))
+        lessons = "\n".join(lessons_on_day[period])
         if not lessons:
             continue
         embed.add_field(
@@ -95,40 +101,26 @@ def format_lesson_plan_dp(query_day: int) -> str or Embed:
     return embed
 
 
-def get_lesson_plan(message: Message) -> str or Embed:
+async def get_lesson_plan(message: Message) -> str or Embed:
     """Event handler for the 'plan' command."""
     args: list[str] = message.content.split(" ")
+    # The current lesson is marked at the time of the request, so the lesson plan rendered overnight
+    # is only served while there is no lesson in progress
+    is_lesson_in_progress = 0 <= util.current_period < len(util.lesson_plan_dp["times"])
+    if len(args) == 1 and not is_lesson_in_progress:
+        # Serve the lesson plan for today if it was rendered overnight
+        rendered = precompute.get_rendered("plan")
+        if rendered is not None:
+            return rendered
     today = datetime.now().weekday()
     query_day = today if today < Weekday.SATURDAY else Weekday.MONDAY
     if len(args) > 1:
-        query_day = -1
         # This 'try' clause raises RuntimeError if the input is invalid for whatever reason
         try:
             try:
-                query_day = {"pn": 0, "śr": 2, "sr": 2, "pt": 4}[args[1]]
-            except KeyError:
-                try:
-                    # Check if the input is a number
-                    if not 1 <= int(args[1]) <= 5:
-                        # It is, but of invalid format
-                        err_msg = f"{args[1]} is not a number between 1 and 5."
-                        raise RuntimeError(err_msg) from None
-                    # It is, and of correct format
-                    query_day = int(args[1]) - 1
-                except ValueError:
-                    # The input is not a number.
-                    # Check if it is a day of the week
-                    for i, weekday in enumerate(WEEKDAY_NAMES):
-                        if weekday.lower().startswith(args[1].lower()):
-                            # The input is a valid weekday name.
-                            query_day = i
-                            break
-                    # 'query_day' == -1 if there are no matched lessons from the above loop.
-                    if query_day == -1:
-                        # The input is not a valid weekday name.
-                        # ValueError can't be used since it has already been caught
-                        err_msg = f"invalid weekday name: {args[1]}"
-                        raise RuntimeError(err_msg) from None
+                query_day = get_weekday_from_input(args[1])
+            except ValueError as invalid_weekday_exc:
+                raise RuntimeError(invalid_weekday_exc) from None
             if len(args) > 2:
                 try:
                     plan_id = lesson_plan.get_plan_id(args[2])
@@ -136,8 +128,9 @@ def get_lesson_plan(message: Message) -> str or Embed:
                     raise RuntimeError(f"invalid class name: {args[2]}") from None
                 else:
                     class_code = args[2].lower()
+                    prefetch.prefetcher.record_request(plan_id, query_day)
                     try:
-                        plan, _ = lesson_plan.get_lesson_plan(plan_id)
+                        plan, _ = await lesson_plan.get_lesson_plan_async(plan_id)
                     except web.WebException as web_exc:
                         # Invalid web response
                         return util.get_error_message(web_exc)
@@ -35,7 +35,7 @@ STEAM_URL = "https://www.steamcommunity.com/market/search/?q="
 tracked_market_items: list[TrackedItem] = []
 
 
-def get_market_price(message: Message or str, result_override=None) -> str:
+async def get_market_price(message: Message or str, result_override=None) -> str:
     """Event handler for the 'cena' command."""
     if result_override is None:
         args: list[str] = message.content[len(f"{bot.prefix}cena "):].split(" waluta=")
@@ -44,7 +44,7 @@ def get_market_price(message: Message or str, result_override=None) -> str:
     currency = args[-1].strip() if len(args) > 1 else 'PLN'
     try:
         params = args[0], 730, currency
-        result = result_override or steam_market.get_item(*params)
+        result = result_override or await steam_market.get_item_async(*params)
         price = steam_market.get_item_price(result)
     except web.WebException as web_exc:
         return util.get_error_message(web_exc)
@@ -52,11 +52,11 @@ def get_market_price(message: Message or str, result_override=None) -> str:
         return f"{Emoji.INFO} Aktualna cena dla *{args[0]}* to `{price}`."
 
 
-def search_for_item(message: Message) -> Embed:
+async def search_for_item(message: Message) -> Embed:
     """Event handler for the 'wyszukaj' command."""
     raw_query = message.content[len(f"{bot.prefix}wyszukaj "):]
     try:
-        response: dict[str, any] = steam_market.search_item(raw_query)
+        response: dict[str, any] = await steam_market.search_item_async(raw_query)
     except web.WebException as web_exc:
         return util.get_error_message(web_exc)
     total =  response.get("total_count", 0)
@@ -75,7 +75,7 @@ def search_for_item(message: Message) -> Embed:
 
 
 # Returns the message to send when the user wishes to track an item on the Steam Community Market
-def start_market_tracking(message: Message):
+async def start_market_tracking(message: Message):
     """Event handling for the 'sledz' command."""
     # noinspection SpellCheckingInspection
     args = message.content[len(f"{bot.prefix}sledz "):].split(" min=")
@@ -92,7 +92,7 @@ def start_market_tracking(message: Message):
     else:
         item_name = args[0].strip()
         try:
-            result = steam_market.get_item(item_name)
+            result = await steam_market.get_item_async(item_name)
         except web.WebException as web_exc:
             return util.get_error_message(web_exc)
         author_id = message.author.id
@@ -109,7 +109,7 @@ def start_market_tracking(message: Message):
                     f"przez {other_author_description}.")
         tracked_market_items.append(item)
         data_manager.save_data_file()
-        price = get_market_price(item_name, result_override=result)
+        price = await get_market_price(item_name, result_override=result)
         return (f"{Emoji.CHECK} Stworzono zlecenie śledzenia przedmiotu *{item_name}* w"
                 f" przedziale `{min_price/100:.2f}zł - {max_price/100:.2f}zł`.\n{price}")
 
@@ -9,8 +9,9 @@ from corny_commons import util as ccutil
 from corny_commons.util import web
 
 # Local application imports
-from modules import bot, util, WEEKDAY_NAMES
+from modules import bot, util, precompute, teachers, WEEKDAY_NAMES
 from modules.api import substitutions
+from modules.commands import get_stale_data_notice
 
 
 DESC = """Podaje zastępstwa na dany dzień."""
@@ -26,46 +27,6 @@ DESC_TEMPLATE = "Liczba zastępstw dla klasy {}: **{}**"
 temp_data: dict[str, bool] = {}
 
 
-def get_all_lessons_on_day(weekday: int) -> list[dict[str, str]]:
-    """Gets all the lessons taking place on a given day of the week."""
-    plan = util.lesson_plan_dp["weekdays"][weekday]
-    lessons = []
-    for block in plan:
-        lessons += block["lessons"]
-    return lessons
-
-
-def get_lessons_with_teacher(
-    raw_teacher: str, lessons: list[dict[str, str]]
-) -> tuple[str, list]:
-    """Filters the lessons to those taking place with the given teacher.
-
-    Returns the teacher's unconjugated surname form as well as a list of their lessons."""
-    mappings = {"ą": "a", "im": "i", "iem": ""}
-
-    # De-conjugate the teacher surnames
-    def map_word_part(part):
-        for ending, new_ending in mappings.items():
-            if not part.endswith(ending):
-                continue
-            return part[: -len(ending)] + new_ending
-        return part
-
-    teacher_name = "-".join(map(map_word_part, raw_teacher.split("-")))
-    subjects = util.teacher_subjects.get(teacher_name)
-    if not isinstance(subjects, list):
-        subjects = [subjects]
-
-    # Get the subjects taught by that teacher on the given day
-    result = []
-    for lesson in lessons:
-        lesson_name = lesson["name"]
-        lesson_full_name = f"{lesson_name} {lesson.get('level', '')}".strip()
-        if lesson_full_name in subjects or lesson_name in subjects:
-            result.append(lesson_full_name)
-    return teacher_name, (result or ["brak"])
-
-
 def add_substitution_text_fields(
     embed: discord.Embed, data: dict, source_url: str
 ) -> int:
@@ -101,10 +62,10 @@ def add_substitution_text_fields(
     return our_substitutions
 
 
-def get_substitutions_embed(_: discord.Message = None) -> discord.Embed or str:
+async def get_substitutions_embed(_: discord.Message = None) -> discord.Embed or str:
     """Event handler for the 'zast' command."""
     try:
-        data, old_data = substitutions.get_substitutions()
+        data, old_data = await substitutions.get_substitutions_async()
     except web.WebException as web_exc:
         ex: str = ccutil.format_exception_info(web_exc)
         bot.send_log(f"{bot.BAD_RESPONSE}{ex}", force=True)
@@ -119,10 +80,11 @@ def get_substitutions_embed(_: discord.Message = None) -> discord.Embed or str:
 
     # Initialise the embed
     url = f"{substitutions.SOURCE_URL}#{data['post'].get('id', 'content')}"
+    footer = FOOTER_TEMPLATE.format(bot.prefix) + get_stale_data_notice(data)
     embed = discord.Embed(
         title=f"Zastępstwa na {datetime.strptime(data['date'], '%Y-%m-%d'):%d.%m.%Y}",
         url=url,
-    ).set_footer(text=FOOTER_TEMPLATE.format(bot.prefix))
+    ).set_footer(text=footer)
 
     # Add fields
     embed.add_field(
@@ -165,10 +127,13 @@ def get_substitutions_embed(_: discord.Message = None) -> discord.Embed or str:
     return embed
 
 
-def get_new_substitutions_embed(_: discord.Message = None) -> discord.Embed or str:
+async def get_new_substitutions_embed(_: discord.Message = None) -> discord.Embed or str:
     """Event handler for the 'zast' command, following the new substitutions format."""
+    rendered = precompute.get_rendered("zast")
+    if rendered is not None:
+        return rendered
     try:
-        data, old_data = substitutions.get_substitutions()
+        data, old_data = await substitutions.get_substitutions_async()
     except web.WebException as web_exc:
         ex: str = ccutil.format_exception_info(web_exc)
         bot.send_log(f"{bot.BAD_RESPONSE}{ex}", force=True)
@@ -180,18 +145,18 @@ def get_new_substitutions_embed(_: discord.Message = None) -> discord.Embed or s
 
     # Initialise the embed
     dates = sorted(data.keys(), key=lambda x: datetime.strptime(x, "%d.%m.%Y"))
+    footer = FOOTER_TEMPLATE.format(bot.prefix) + get_stale_data_notice(data)
     embed = discord.Embed(
         title=f"Zastępstwa na {', '.join(dates)}",
         url=f"{substitutions.SOURCE_URL}#content",
-    ).set_footer(text=FOOTER_TEMPLATE.format(bot.prefix))
+    ).set_footer(text=footer)
 
     for date in dates:
         weekday = datetime.strptime(date, "%d.%m.%Y").weekday()
-        all_lessons = get_all_lessons_on_day(weekday)
         teachers_msg = "*Następujące zajęcia są odwołane:*\n"
         for teacher in data[date]:
-            teacher_name, lessons = get_lessons_with_teacher(teacher, all_lessons)
-            teachers_msg += f"p. {teacher_name} — {', '.join(lessons)}\n"
+            teacher_name, lessons = teachers.get_lessons_with_teacher(teacher, weekday)
+            teachers_msg += f"p. {teacher_name} — {', '.join(lessons or ['brak'])}\n"
         embed.add_field(
             name=f"{WEEKDAY_NAMES[weekday]} {date}",
             value=teachers_msg,
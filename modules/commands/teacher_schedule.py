@@ -0,0 +1,76 @@
+"""Module containing code relating to the 'nauczyciel' command."""
+
+# Standard library imports
+from datetime import datetime
+
+# Third-party imports
+from discord import Message, Embed
+
+# Local application imports
+from modules import bot, teachers, util, Emoji, Weekday
+from modules.api import lesson_plan
+from modules.commands import get_weekday_from_input
+from modules.commands.plan import get_lesson_description, get_weekday
+
+
+DESC = """Pokazuje lekcje danego nauczyciela w całej szkole w danym dniu, domyślnie dzisiaj.
+    Parametry: __nazwisko lub skrót nauczyciela__, __dzień tygodnia__
+    Przykłady:
+    `{p}nauczyciel Gawol` - wyświetliłyby się dzisiejsze lekcje nauczyciela o nazwisku Gawol.
+    `{p}nauczyciel LG pt` - wyświetliłyby się lekcje nauczyciela o skrócie LG w piątek."""
+
+NO_PLANS_MSG = "{} Plany lekcji nie zostały jeszcze pobrane. Spróbuj ponownie później."
+INVALID_ARGS_MSG = (
+    "{} Należy napisać po komendzie `{}nauczyciel` nazwisko lub skrót nauczyciela, "
+    "a opcjonalnie także numer dnia (1-5) bądź dzień tygodnia."
+)
+UNKNOWN_TEACHER_MSG = (
+    "{} Nie znaleziono w planach lekcji nauczyciela *{}*. Proszę podać skrót nauczyciela."
+)
+AMBIGUOUS_TEACHER_MSG = (
+    "{} Nazwisko *{}* pasuje do kilku nauczycieli: {}. Proszę podać skrót nauczyciela."
+)
+
+
+def format_lesson(lesson: tuple[int, int, str, str]) -> str:
+    """Formats a lesson from the teacher's schedule, e.g. '2a: mat (sala 12)'."""
+    _, plan_id, subject, room = lesson
+    class_name = util.plan_class_names.get(plan_id, str(plan_id))
+    return f"{class_name}: {subject} (sala {room})" if room else f"{class_name}: {subject}"
+
+
+def get_teacher_schedule(message: Message) -> str or Embed:
+    """Event handler for the 'nauczyciel' command."""
+    args: list[str] = message.content.split(" ")
+    today = datetime.now().weekday()
+    query_day = today if today < Weekday.SATURDAY else Weekday.MONDAY
+    try:
+        raw_name = args[1]
+        if len(args) > 2:
+            query_day = get_weekday_from_input(args[2])
+    except (IndexError, ValueError):
+        return INVALID_ARGS_MSG.format(Emoji.WARNING, bot.prefix)
+    if not lesson_plan.is_timetable_complete():
+        return NO_PLANS_MSG.format(Emoji.WARNING)
+    codes = teachers.find_teacher_codes(raw_name)
+    if not codes:
+        return UNKNOWN_TEACHER_MSG.format(Emoji.WARNING, raw_name)
+    if len(codes) > 1:
+        return AMBIGUOUS_TEACHER_MSG.format(Emoji.WARNING, raw_name, ", ".join(codes))
+    code = codes[0]
+    lessons = teachers.get_teacher_schedule(code, query_day)
+
+    # Group the lessons by period, since a teacher may teach several classes at once
+    periods: dict[int, list[str]] = {}
+    for lesson in lessons:
+        periods.setdefault(lesson[0], []).append(format_lesson(lesson))
+    desc = f"Liczba lekcji na **{get_weekday(query_day)}**: {len(periods)}"
+    embed = Embed(title=f"Lekcje nauczyciela {code}", description=desc)
+    embed.set_footer(text=f"Użyj komendy {bot.prefix}nauczyciel, aby pokazać tą wiadomość.")
+    for period, formatted_lessons in periods.items():
+        embed.add_field(
+            name=get_lesson_description(period, query_day),
+            value="\n".join(formatted_lessons),
+            inline=False,
+        )
+    return embed
@@ -9,7 +9,7 @@ from datetime import datetime
 from corny_commons import util as ccutil
 
 # Local application imports
-from modules import bot, commands, util
+from modules import bot, commands, util, polling, prefetch
 from modules.api import lucky_numbers
 
 DATA_IDENTICAL_MSG = "... data is identical; no changes have been made."
@@ -41,6 +41,10 @@ def read_data_file(filename: str = "data.json") -> None:
     on_exit_msg.update(data.get("on_exit_msg", {}))
     # Read the last substitutions info saved in data file if it exists
     last_substitutions.update(data.get("last_substitutions", {}))
+    # Read the times at which the substitutions were observed to have changed
+    polling.planner.load(data.get("substitutions_changes", []))
+    # Read the number of requests for each class' lesson plan
+    prefetch.prefetcher.load(data.get("plan_requests", {}))
     # Creates new instances of the HomeworkEvent class with the data from the file
     new_event_candidates = commands.HomeworkEventContainer()
     for attributes in data.get("homework_events", {}).values():
@@ -108,6 +112,8 @@ def save_data_file(filename: str = "data.json", allow_logs: bool = True) -> None
         "lucky_numbers": lucky_numbers.serialise(),
         "on_exit_msg": on_exit_msg,
         "last_substitutions": last_substitutions,
+        "substitutions_changes": polling.planner.serialise(),
+        "plan_requests": prefetch.prefetcher.serialise(),
     }
     # Checks if the data actually needs to be saved
     with open(filename, "r", encoding="UTF-8") as file:
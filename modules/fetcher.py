@@ -0,0 +1,186 @@
+"""Standalone process that fetches the data from the web APIs and publishes it in the shared cache.
+
+Usage: `python -m modules.fetcher [data file]`
+
+While the fetcher is running, it keeps the on-disk caches up-to-date and the bot only reads them
+(see `api.cache.read_only`). This way a slow upstream or a crashing parser does not affect the bot,
+the caches stay warm when the bot is restarted, and each process can be restarted on its own.
+The bot stops reading the caches and fetches the data itself once the fetcher's heartbeat is too
+old, so running the fetcher is optional.
+"""
+
+# Standard library imports
+import asyncio
+import json
+import os
+import sys
+import time
+from datetime import date, datetime
+
+# Third-party imports
+from corny_commons import file_manager, util as ccutil
+from corny_commons.util import web
+
+# Local application imports
+from modules import bot, polling
+from modules.api import async_web, cache, lesson_plan, lucky_numbers, parsing, substitutions
+from modules.api import steam_market
+
+HEARTBEAT_CACHE_NAME = "fetcher"
+# The substitutions change history that the fetcher has learnt from its own polls
+PLANNER_CACHE_NAME = "fetcher_polling"
+HEARTBEAT_INTERVAL = 30  # Seconds
+HEARTBEAT_TIMEOUT = 120  # Seconds after the last heartbeat for the fetcher to be considered dead
+STEAM_MARKET_INTERVAL = 30  # Minutes
+PLAN_SYNC_TIME = (5, 0)  # Hour and minute of the daily lesson plan sync
+STEAM_MARKET_COOLDOWN = 3  # Seconds between the requests for each tracked item
+
+
+def is_running() -> bool:
+    """Returns a boolean indicating if the fetcher process has recently published a heartbeat."""
+    age = cache.get_cache_age(HEARTBEAT_CACHE_NAME)
+    return age is not None and age < HEARTBEAT_TIMEOUT
+
+
+def write_heartbeat() -> None:
+    """Saves the heartbeat that tells the bot that the fetcher is running."""
+    cache.write_cache(HEARTBEAT_CACHE_NAME, {"pid": os.getpid(), "time": time.time()})
+
+
+async def send_heartbeats() -> None:
+    """Saves the heartbeat regularly, independently of how long the fetches take."""
+    while True:
+        write_heartbeat()
+        await asyncio.sleep(HEARTBEAT_INTERVAL)
+
+
+def read_data_file(filename: str) -> dict[str, any]:
+    """Reads the bot's data file without changing any of the bot's state.
+
+    The fetcher only needs the tracked Steam Market items, and the substitutions change history
+    if it has not saved its own yet. Returns an empty dictionary if the file does not exist.
+    """
+    try:
+        with open(filename, "r", encoding="UTF-8") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def load_planner(data: dict[str, any]) -> None:
+    """Loads the substitutions change history that the fetcher has saved, or the bot's history
+    from its data file if there is none yet."""
+    saved_planner = file_manager.read_cache(PLANNER_CACHE_NAME)
+    if saved_planner:
+        polling.planner.load(saved_planner.get("substitutions_changes", []))
+    else:
+        polling.planner.load(data.get("substitutions_changes", []))
+
+
+async def fetch_substitutions() -> None:
+    """Refreshes the substitutions cache and saves the change history if it has learnt anything."""
+    old_changes = polling.planner.serialise()
+    await substitutions.get_substitutions_async(force_update=True)
+    changes = polling.planner.serialise()
+    if changes != old_changes:
+        cache.write_cache(PLANNER_CACHE_NAME, {"substitutions_changes": changes})
+
+
+async def fetch_lesson_plans() -> None:
+    """Syncs the lesson plans of all classes."""
+    await lesson_plan.sync_lesson_plans()
+
+
+async def fetch_lucky_numbers() -> None:
+    """Refreshes the lucky numbers cache."""
+    await lucky_numbers.update_cache_async()
+
+
+async def run_lucky_numbers_task() -> None:
+    """Sleeps until the lucky numbers fetch window of each school day, then fetches them until
+    they are for today, with the same backoff as the bot (see `bot.fetch_current_lucky_numbers()`).
+    """
+    fetched_today = False
+    while True:
+        now = datetime.now()
+        next_fetch = bot.get_next_lucky_numbers_fetch(now, skip_today=fetched_today)
+        await asyncio.sleep((next_fetch - now).total_seconds())
+        retry_delays = bot.get_lucky_numbers_retry_delays()
+        while True:
+            await run_task("lucky numbers", fetch_lucky_numbers())
+            if lucky_numbers.cached_data.get("date") == date.today():
+                break
+            delay = next(retry_delays, None)
+            if delay is None:
+                _log("Could not fetch today's lucky numbers; giving up.")
+                break
+            await asyncio.sleep(delay)
+        fetched_today = True
+
+
+async def fetch_steam_market(item_names: list[str]) -> None:
+    """Refreshes the cached prices of the tracked Steam Market items."""
+    for item_name in item_names:
+        await asyncio.sleep(STEAM_MARKET_COOLDOWN)
+        await steam_market.get_item_async(item_name, tracked=True)
+
+
+async def run_task(task_name: str, coroutine) -> None:
+    """Awaits the fetch coroutine, logging any errors so that they do not stop the fetcher."""
+    try:
+        await coroutine
+    except web.WebException as web_exc:
+        _log(f"Could not fetch the {task_name}: {web_exc}")
+    except Exception as exc:  # pylint: disable=broad-except
+        _log(f"Error while fetching the {task_name}:\n{ccutil.format_exception_info(exc)}")
+
+
+async def run(data_filename: str = "data.json") -> None:
+    """Fetches the data from each web API according to its schedule until cancelled."""
+    _log(f"Fetcher started with PID {os.getpid()}.")
+    data = read_data_file(data_filename)
+    load_planner(data)
+    lucky_numbers.load_data(file_manager.read_cache(lucky_numbers.CACHE_NAME))
+    heartbeat_task = asyncio.create_task(send_heartbeats())
+    lucky_numbers_task = asyncio.create_task(run_lucky_numbers_task())
+    await lesson_plan.update_plan_index_async()
+    while True:
+        if heartbeat_task.done():
+            # Don't keep fetching if the bot can no longer tell that the fetcher is running
+            heartbeat_task.result()
+        if lucky_numbers_task.done():
+            # The task logs its own errors, so this is unexpected
+            lucky_numbers_task.result()
+        now = datetime.now()
+        if polling.planner.should_poll(now):
+            await run_task("substitutions", fetch_substitutions())
+        if (now.hour, now.minute) == PLAN_SYNC_TIME:
+            await run_task("lesson plans", fetch_lesson_plans())
+        if now.minute % STEAM_MARKET_INTERVAL == 0:
+            # Pick up any changes to the tracked items
+            data = read_data_file(data_filename)
+            item_names = [item["name"] for item in data.get("tracked_market_items", [])]
+            await run_task("Steam Market prices", fetch_steam_market(item_names))
+        # Sleep until the start of the next minute
+        await asyncio.sleep(60 - datetime.now().second)
+
+
+async def main(data_filename: str) -> None:
+    """Runs the fetcher, closing the connection pool and parser processes when it stops."""
+    try:
+        await run(data_filename)
+    finally:
+        await async_web.close()
+        parsing.shutdown()
+
+
+def _log(*args) -> None:
+    file_manager.log(*args, filename="fetcher")
+
+
+if __name__ == "__main__":
+    file_manager.read_env()
+    try:
+        asyncio.run(main(sys.argv[1] if len(sys.argv) > 1 else "data.json"))
+    except KeyboardInterrupt:
+        _log("Fetcher stopped.")
@@ -0,0 +1,315 @@
+"""Functionality for planning when to poll the substitutions page.
+
+The planner learns from the intervals in which the substitutions were published, i.e. between the
+last check that found the old version and the one that found the change. Each change is spread over
+its interval, so that the planner learns when the school publishes the changes rather than when it
+happened to poll. It polls every few minutes during the parts of the day when the school has
+historically published changes, only sparsely otherwise, and never on weekends, holidays or school
+breaks. The number of polls on a single day is limited by a budget.
+
+Running this module replays recorded change timestamps against the planner and compares it to the
+old behaviour of polling at the start of every hour:
+`python -m modules.polling data.json [daily budget]`
+"""
+
+# Standard library imports
+import json
+import os
+import statistics
+import sys
+from datetime import date, datetime, timedelta
+
+# Local application imports
+from modules import Weekday, util
+
+BUCKET_SIZE = 15  # Minutes; the resolution of the publication history
+DENSE_INTERVAL = 5  # Minutes between polls inside a historically active window
+SPARSE_INTERVAL = 60  # Minutes between polls outside of the active windows
+DAY_START = 6 * 60  # Minute of the day of the first poll (06:00)
+DAY_END = 22 * 60  # Minute of the day after which there are no more polls (22:00)
+ACTIVE_BUCKET_SHARE = 0.05  # Fraction of all recorded changes for a window to count as active
+MAX_DAILY_POLLS = 60
+HISTORY_DAYS = 120  # Changes older than this are forgotten
+
+# Public holidays with fixed dates, as (month, day)
+HOLIDAYS = [(1, 1), (1, 6), (5, 1), (5, 3), (8, 15), (11, 1), (11, 11), (12, 25), (12, 26)]
+# Public holidays on weekdays whose dates depend on Easter, as days after Easter Sunday
+# (Easter Monday and Corpus Christi)
+EASTER_HOLIDAYS = [1, 60]
+# The spring break lasts from the Thursday before Easter until the Tuesday after it
+EASTER_BREAK = (-3, 2)
+# The winter break lasts from the 23rd until the 31st of December
+CHRISTMAS_BREAK = ((12, 23), (12, 31))
+# The winter holidays of the voivodeship change every year, so their first day is set in the
+# environment, e.g. WINTER_HOLIDAYS_START=2027-01-18
+WINTER_HOLIDAYS_ENV = "WINTER_HOLIDAYS_START"
+WINTER_HOLIDAYS_LENGTH = 14  # Days
+
+
+def get_easter_sunday(year: int) -> date:
+    """Returns the date of Easter Sunday in the given year (using the Gregorian computus)."""
+    golden = year % 19
+    century, year_of_century = divmod(year, 100)
+    leap_centuries, non_leap_centuries = divmod(century, 4)
+    correction = (century - (century + 8) // 25 + 1) // 3
+    epact = (19 * golden + century - leap_centuries - correction + 15) % 30
+    leap_years, non_leap_years = divmod(year_of_century, 4)
+    weekday = (32 + 2 * non_leap_centuries + 2 * leap_years - epact - non_leap_years) % 7
+    offset = (golden + 11 * epact + 22 * weekday) // 451
+    month, day = divmod(epact + weekday - 7 * offset + 114, 31)
+    return date(year, month, day + 1)
+
+
+def get_school_breaks(year: int) -> list[tuple[date, date]]:
+    """Returns the first and last days of the school breaks and the holidays that depend on Easter
+    in the given year. The winter holidays are only included if they are set in the environment."""
+    easter_sunday = get_easter_sunday(year)
+    breaks = [
+        (easter_sunday + timedelta(days=offset), easter_sunday + timedelta(days=offset))
+        for offset in EASTER_HOLIDAYS
+    ]
+    first_day, last_day = EASTER_BREAK
+    breaks.append(
+        (easter_sunday + timedelta(days=first_day), easter_sunday + timedelta(days=last_day))
+    )
+    (first_month, first_day), (last_month, last_day) = CHRISTMAS_BREAK
+    breaks.append((date(year, first_month, first_day), date(year, last_month, last_day)))
+    winter_holidays_start = os.environ.get(WINTER_HOLIDAYS_ENV)
+    if winter_holidays_start:
+        start = date.fromisoformat(winter_holidays_start)
+        breaks.append((start, start + timedelta(days=WINTER_HOLIDAYS_LENGTH - 1)))
+    return breaks
+
+
+def is_school_day(day: date) -> bool:
+    """Returns a boolean indicating if there may be lessons on the given day."""
+    if day.weekday() >= Weekday.SATURDAY or (day.month, day.day) in HOLIDAYS:
+        return False
+    if any(first_day <= day <= last_day for first_day, last_day in get_school_breaks(day.year)):
+        return False
+    return not util.check_is_summer_holidays(datetime(day.year, day.month, day.day))
+
+
+def get_bucket_weights(since: datetime, when: datetime) -> dict[int, float]:
+    """Spreads a change over the buckets of the day that the interval in which it was published
+    overlaps, in proportion to the overlap. The weights add up to 1."""
+    if since >= when:
+        return {(when.hour * 60 + when.minute) // BUCKET_SIZE: 1.0}
+    duration = (when - since).total_seconds()
+    weights: dict[int, float] = {}
+    start = since
+    while start < when:
+        midnight = datetime(start.year, start.month, start.day)
+        bucket = int((start - midnight).total_seconds() // 60) // BUCKET_SIZE
+        end = min(when, midnight + timedelta(minutes=(bucket + 1) * BUCKET_SIZE))
+        weights[bucket] = weights.get(bucket, 0) + (end - start).total_seconds() / duration
+        start = end
+    return weights
+
+
+def parse_change(change: str) -> tuple[datetime, datetime]:
+    """Returns the interval in which a change was published from its serialised form, which is
+    either 'since/when' or a single time if the interval is not known."""
+    since, _, when = change.rpartition("/")
+    when = datetime.fromisoformat(when)
+    return datetime.fromisoformat(since) if since else when, when
+
+
+class PollPlanner:
+    """Custom object type that decides when the substitutions page should be polled."""
+
+    def __init__(self, daily_budget: int = MAX_DAILY_POLLS) -> None:
+        self.daily_budget: int = daily_budget
+        # The intervals in which the changes were published, as (since, when) tuples
+        self.changes: list[tuple[datetime, datetime]] = []
+        self.polls_today: int = 0
+        self._polls_date: date = None
+        self._schedules: dict[date, list[int]] = {}
+
+    def record_change(self, when: datetime, since: datetime) -> None:
+        """Records that the substitutions were observed to have changed.
+
+        Arguments:
+            when -- the time at which the change was observed.
+            since -- the time of the last check before that, which found the old version.
+        """
+        self.changes.append((min(since, when), when))
+        cutoff = when - timedelta(days=HISTORY_DAYS)
+        self.changes = [change for change in self.changes if change[1] >= cutoff]
+        # Later schedules may now be different
+        self._schedules = {
+            day: schedule for day, schedule in self._schedules.items() if day <= when.date()
+        }
+
+    def get_active_buckets(self, before: date = None) -> dict[int, float]:
+        """Returns the share of the recorded changes that fall into each active window.
+
+        Arguments:
+            before -- only consider the changes that were observed before this date.
+        """
+        weights: dict[int, float] = {}
+        total = 0
+        for since, when in self.changes:
+            if before is not None and when.date() >= before:
+                continue
+            for bucket, weight in get_bucket_weights(since, when).items():
+                weights[bucket] = weights.get(bucket, 0) + weight
+            total += 1
+        return {
+            bucket: weight / total
+            for bucket, weight in weights.items()
+            if weight / total >= ACTIVE_BUCKET_SHARE
+        }
+
+    def get_schedule(self, day: date) -> list[int]:
+        """Returns the sorted list of minutes of the day at which to poll on the given day."""
+        if day in self._schedules:
+            return self._schedules[day]
+        if not is_school_day(day):
+            self._schedules[day] = []
+            return []
+        active_buckets = self.get_active_buckets(before=day)
+        # Each candidate poll is given a priority; the sparse baseline is always kept first
+        priorities: dict[int, float] = {}
+        for minute in range(DAY_START, DAY_END, SPARSE_INTERVAL):
+            priorities[minute] = 1.0
+        for bucket, share in active_buckets.items():
+            start = bucket * BUCKET_SIZE
+            for minute in range(start, start + BUCKET_SIZE, DENSE_INTERVAL):
+                priorities.setdefault(minute, share)
+        kept = sorted(priorities, key=lambda minute: priorities[minute], reverse=True)
+        schedule = sorted(kept[: self.daily_budget])
+        self._schedules[day] = schedule
+        return schedule
+
+    def should_poll(self, now: datetime) -> bool:
+        """Returns a boolean indicating if the page should be polled during the given minute.
+        Counts the poll towards the daily budget if it should."""
+        if self._polls_date != now.date():
+            self._polls_date = now.date()
+            self.polls_today = 0
+        if self.polls_today >= self.daily_budget:
+            return False
+        if now.hour * 60 + now.minute not in self.get_schedule(now.date()):
+            return False
+        self.polls_today += 1
+        return True
+
+    def get_next_poll(self, now: datetime) -> datetime or None:
+        """Returns the time of the next scheduled poll in the following week, if there is one."""
+        for days_ahead in range(7):
+            day = now.date() + timedelta(days=days_ahead)
+            for minute in self.get_schedule(day):
+                poll_time = datetime(day.year, day.month, day.day, minute // 60, minute % 60)
+                if poll_time > now:
+                    return poll_time
+        return None
+
+    def serialise(self) -> list[str]:
+        """Returns the recorded changes as a JSON-serialisable list of ISO intervals, e.g.
+        '2023-01-09T07:05/2023-01-09T07:10'."""
+        return [
+            f"{since.isoformat(timespec='minutes')}/{when.isoformat(timespec='minutes')}"
+            for since, when in self.changes
+        ]
+
+    def load(self, changes: list[str]) -> None:
+        """Replaces the recorded changes with the given ISO intervals. Changes recorded as a single
+        time, as they used to be, are taken to have been published at that time."""
+        self.changes = [parse_change(change) for change in changes]
+        self._schedules = {}
+
+
+planner = PollPlanner()
+
+
+def replay(
+    change_times: list[datetime], daily_budget: int = MAX_DAILY_POLLS
+) -> dict[str, dict[str, float]]:
+    """Evaluates the planner against the recorded publication times, learning from the intervals
+    between its own polls as the bot would. Compares it to polling at the start of every hour.
+
+    Returns a dictionary containing the number of requests and the announcement latency statistics
+    (in minutes) for each strategy.
+    """
+    change_times = sorted(change_times)
+    first_day = change_times[0].date()
+    last_day = change_times[-1].date()
+    num_days = (last_day - first_day).days + 1
+    replay_planner = PollPlanner(daily_budget)
+    strategies = {
+        "hourly": lambda day: list(range(0, 24 * 60, 60)),
+        "planner": replay_planner.get_schedule,
+    }
+    results = {}
+    for name, get_schedule in strategies.items():
+        replay_planner.changes = []
+        replay_planner._schedules = {}  # pylint: disable=protected-access
+        requests = 0
+        latencies: list[int] = []
+        pending = list(change_times)
+        last_poll_time = None
+        for day_index in range(num_days):
+            day = first_day + timedelta(days=day_index)
+            schedule = get_schedule(day)
+            requests += len(schedule)
+            for minute in schedule:
+                poll_time = datetime(day.year, day.month, day.day, minute // 60, minute % 60)
+                # Every change published before this poll is announced by it
+                is_changed = False
+                while pending and pending[0] <= poll_time:
+                    change = pending.pop(0)
+                    latencies.append(int((poll_time - change).total_seconds() // 60))
+                    is_changed = True
+                if is_changed and last_poll_time is not None:
+                    # The planner only learns when it observed the change, as the bot does
+                    replay_planner.record_change(poll_time, since=last_poll_time)
+                last_poll_time = poll_time
+        results[name] = {
+            "requests": requests,
+            "requests_per_day": requests / num_days,
+            "announced": len(latencies),
+            "missed": len(pending),
+            "mean_latency": statistics.mean(latencies) if latencies else 0,
+            "p90_latency": _percentile(latencies, 0.9),
+            "max_latency": max(latencies, default=0),
+        }
+    return results
+
+
+def _percentile(values: list[int], fraction: float) -> float:
+    """Returns the given percentile of the values."""
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+if __name__ == "__main__":
+    # Replay CLI
+    try:
+        filename = sys.argv[1]
+    except IndexError:
+        print("Usage: python -m modules.polling <data.json | changes.json> [daily budget]")
+        sys.exit(1)
+    with open(filename, "r", encoding="UTF-8") as file:
+        recorded = json.load(file)
+    if isinstance(recorded, dict):
+        # This is the bot's data file
+        recorded = recorded.get("substitutions_changes", [])
+    if not recorded:
+        print("There are no recorded substitutions changes in the file.")
+        sys.exit(1)
+    budget = int(sys.argv[2]) if len(sys.argv) > 2 else MAX_DAILY_POLLS
+    # The changes are taken to have been published in the middle of their intervals
+    publication_times = [since + (when - since) / 2 for since, when in map(parse_change, recorded)]
+    replay_results = replay(publication_times, budget)
+    print(f"Replayed {len(recorded)} changes with a daily budget of {budget} polls.")
+    for strategy, result in replay_results.items():
+        print(
+            f"{strategy:>8}: {result['requests']:6} requests "
+            f"({result['requests_per_day']:5.1f}/day), "
+            f"latency mean {result['mean_latency']:5.1f} min, "
+            f"p90 {result['p90_latency']:4} min, max {result['max_latency']:4} min, "
+            f"missed {result['missed']}"
+        )
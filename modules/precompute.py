@@ -0,0 +1,83 @@
+"""Functionality for storing command responses that were rendered ahead of time.
+
+Every night the bot refreshes the caches and renders the responses to the commands that everyone
+uses in the morning (`!plan`, `!zast` and `!num`) for the next school day. The commands then only
+serve the pre-rendered responses on that day.
+
+Each response is stored along with the names of the data sources it was rendered from. When a
+source changes, only the responses rendered from that source are discarded, and the commands
+render those responses themselves again.
+"""
+
+# Standard library imports
+from datetime import date, datetime, timedelta
+
+# Local application imports
+from modules import polling
+
+PRECOMPUTE_TIME = (3, 0)  # Hour and minute; after the last lessons and before the morning
+
+# The names of the data sources that the responses can be rendered from
+LESSON_PLAN = "lesson_plan"
+SUBSTITUTIONS = "substitutions"
+LUCKY_NUMBERS = "lucky_numbers"
+
+# The pre-rendered responses keyed by command name. Each entry contains the day the response is
+# for, the sources it was rendered from and the response itself.
+_rendered: dict[str, dict[str, any]] = {}
+
+# How many responses were served, rendered and discarded because their sources changed.
+# View with `!exec precompute.stats`.
+stats: dict[str, int] = {"served": 0, "rendered": 0, "invalidated": 0}
+
+
+def get_target_day(now: datetime) -> date:
+    """Returns the first school day on or after the given day, which the responses are for."""
+    day = now.date()
+    while not polling.is_school_day(day):
+        day += timedelta(days=1)
+    return day
+
+
+def store(command_name: str, response: any, sources: list[str], day: date) -> None:
+    """Saves the pre-rendered response to the command.
+
+    Arguments:
+        command_name -- the name of the command, e.g. 'plan'.
+        response -- the rendered embed or message.
+        sources -- the names of the data sources that the response was rendered from.
+        day -- the day on which the response should be served.
+    """
+    _rendered[command_name] = {"day": day, "sources": set(sources), "response": response}
+    stats["rendered"] += 1
+
+
+def get_rendered(command_name: str) -> any:
+    """Returns the pre-rendered response to the command if there is one for today, else None."""
+    entry = _rendered.get(command_name)
+    if entry is None:
+        return None
+    if entry["day"] != date.today():
+        if entry["day"] < date.today():
+            # The response is outdated
+            del _rendered[command_name]
+        return None
+    stats["served"] += 1
+    return entry["response"]
+
+
+def clear() -> None:
+    """Discards all of the pre-rendered responses."""
+    _rendered.clear()
+
+
+def invalidate(source: str) -> list[str]:
+    """Discards the responses that were rendered from the given data source.
+
+    Returns the list of the names of the commands whose responses were discarded.
+    """
+    discarded = [name for name, entry in _rendered.items() if source in entry["sources"]]
+    for command_name in discarded:
+        del _rendered[command_name]
+    stats["invalidated"] += len(discarded)
+    return discarded
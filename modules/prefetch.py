@@ -0,0 +1,146 @@
+"""Functionality for keeping the lesson plans of the most requested classes warm.
+
+The `!plan <day> <class>` command fetches a class' lesson plan the first time someone asks for it,
+so the user has to wait for the request and the parser. The prefetcher counts the requests for each
+class and weekday, and every school morning before the first lessons it refreshes the plans of the
+classes that are most likely to be requested that day, within a daily budget.
+
+The counts decay every day, so classes that are no longer being asked about are eventually
+forgotten. Only plans whose caches would expire during the day are refreshed, so the prefetches
+cost nothing on days when the daily lesson plan sync has already refreshed them.
+"""
+
+# Standard library imports
+import time
+from datetime import datetime
+
+# Local application imports
+from modules import polling
+from modules.api import cache, lesson_plan
+
+PREFETCH_TIME = (6, 30)  # Hour and minute; before the first lessons of the day
+DAILY_BUDGET = 5  # Maximum number of lesson plans refreshed each morning
+DECAY_FACTOR = 0.8  # Applied to all counts once a day
+MIN_SCORE = 0.1  # Classes whose counts all decay below this are forgotten
+
+
+class PlanPrefetcher:
+    """Custom object type that tracks the popularity of each class' lesson plan and keeps the most
+    popular ones warm."""
+
+    def __init__(self, daily_budget: int = DAILY_BUDGET) -> None:
+        self.daily_budget: int = daily_budget
+        # Decayed request counts, keyed by plan ID and then by weekday index
+        self.scores: dict[int, dict[int, float]] = {}
+        # View with `!exec prefetch.prefetcher.stats`
+        self.stats: dict[str, float] = {
+            "hits": 0,
+            "misses": 0,
+            "prefetches": 0,
+            "prefetch_seconds": 0.0,
+            "prefetch_failures": 0,
+        }
+
+    @property
+    def hit_ratio(self) -> float:
+        """Returns the fraction of the requested lesson plans that were already cached."""
+        requests = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / requests if requests else 0.0
+
+    def record_request(self, plan_id: int, weekday: int) -> None:
+        """Counts a request for the lesson plan, noting if it could be served from the cache.
+
+        Arguments:
+            plan_id -- the ID of the requested lesson plan.
+            weekday -- the index of the weekday that the plan was requested for.
+        """
+        self.stats["hits" if is_warm(plan_id) else "misses"] += 1
+        weekday_scores = self.scores.setdefault(plan_id, {})
+        weekday_scores[weekday] = weekday_scores.get(weekday, 0) + 1
+
+    def decay(self) -> None:
+        """Reduces all counts so that recent requests weigh more, forgetting the cold classes."""
+        for plan_id in list(self.scores):
+            weekday_scores = {
+                weekday: score * DECAY_FACTOR
+                for weekday, score in self.scores[plan_id].items()
+                if score * DECAY_FACTOR >= MIN_SCORE
+            }
+            if weekday_scores:
+                self.scores[plan_id] = weekday_scores
+            else:
+                del self.scores[plan_id]
+
+    def get_hot_plans(self, weekday: int) -> list[int]:
+        """Returns the IDs of the lesson plans most likely to be requested on the given weekday,
+        most popular first, limited by the daily budget."""
+
+        def get_priority(plan_id: int) -> tuple[float, float]:
+            # Requests for the weekday come first, then requests for any other weekday
+            weekday_scores = self.scores[plan_id]
+            return weekday_scores.get(weekday, 0), sum(weekday_scores.values())
+
+        ranked = sorted(self.scores, key=get_priority, reverse=True)
+        return ranked[: self.daily_budget]
+
+    async def prefetch(self, now: datetime) -> list[int]:
+        """Refreshes the lesson plans of the hot classes whose caches would expire during the day.
+
+        Returns the list of the IDs of the refreshed lesson plans.
+        """
+        self.decay()
+        if not polling.is_school_day(now.date()):
+            return []
+        # Seconds until the end of the day
+        remaining_time = (24 - now.hour) * 3600 - now.minute * 60
+        refreshed: list[int] = []
+        for plan_id in self.get_hot_plans(now.weekday()):
+            age = cache.get_cache_age(f"plan_{plan_id}")
+            if age is not None and age + remaining_time < lesson_plan.MAX_CACHE_AGE:
+                # The cache will stay fresh for the rest of the day
+                continue
+            start_time = time.perf_counter()
+            try:
+                await lesson_plan.get_lesson_plan_async(plan_id, force_update=True)
+            except Exception:  # pylint: disable=broad-except
+                self.stats["prefetch_failures"] += 1
+            else:
+                refreshed.append(plan_id)
+            self.stats["prefetches"] += 1
+            self.stats["prefetch_seconds"] += time.perf_counter() - start_time
+        return refreshed
+
+    def get_report(self) -> str:
+        """Returns a summary of the statistics that can be used to tune the budget."""
+        mean_cost = self.stats["prefetch_seconds"] / (self.stats["prefetches"] or 1)
+        return (
+            f"Plan requests: {self.stats['hits']:.0f} hits, {self.stats['misses']:.0f} misses "
+            f"(hit ratio {self.hit_ratio:.0%}). Prefetches: {self.stats['prefetches']:.0f} "
+            f"({self.stats['prefetch_failures']:.0f} failed), {mean_cost:.2f}s each on average. "
+            f"Tracking {len(self.scores)} classes with a budget of {self.daily_budget}."
+        )
+
+    def serialise(self) -> dict[str, dict[str, float]]:
+        """Returns the request counts as a JSON-serialisable dictionary."""
+        return {
+            str(plan_id): {
+                str(weekday): round(score, 3) for weekday, score in weekday_scores.items()
+            }
+            for plan_id, weekday_scores in self.scores.items()
+        }
+
+    def load(self, scores: dict[str, dict[str, float]]) -> None:
+        """Replaces the request counts with the given serialised counts."""
+        self.scores = {
+            int(plan_id): {int(weekday): score for weekday, score in weekday_scores.items()}
+            for plan_id, weekday_scores in scores.items()
+        }
+
+
+def is_warm(plan_id: int) -> bool:
+    """Returns a boolean indicating if the lesson plan can be served without a web request."""
+    age = cache.get_cache_age(f"plan_{plan_id}")
+    return age is not None and age <= lesson_plan.MAX_CACHE_AGE
+
+
+prefetcher = PlanPrefetcher()
@@ -0,0 +1,108 @@
+"""Functionality for looking up the rooms that are free during a given lesson.
+
+The index maps each room in the school-wide timetable to a bitset of the periods in which it is
+occupied on each weekday, so finding the free rooms is a scan of one bit per room. Each class'
+contribution to the bitsets is kept separately, so when the lesson plan of a class changes only
+that class is indexed again. The index is brought up to date with the timetable before each lookup,
+which does not fetch anything.
+"""
+
+# Local application imports
+from modules import WEEKDAY_NAMES
+from modules.api import timetable
+
+# Room -> the periods in which it is occupied on each weekday, as bitsets, e.g. {'12': [0b110, ...]}
+_occupied: dict[str, list[int]] = {}
+# Plan ID -> the periods in which the class occupies each room on each weekday
+_plan_rooms: dict[int, dict[str, list[int]]] = {}
+# The timetable and the revisions of its classes that the index was built from
+_indexed_timetable: timetable.Timetable = None
+_indexed_revision: int = None
+_indexed_plan_revisions: dict[int, int] = {}
+
+# How many times each class was indexed and how many lookups there have been.
+# View with `!exec rooms.stats`.
+stats: dict[str, int] = {"indexed": 0, "removed": 0, "lookups": 0}
+
+
+def get_room_sort_key(room: str) -> tuple[bool, int, str]:
+    """Returns the key by which the rooms are sorted, i.e. numerically, then the named rooms."""
+    digits = len(room) - len(room.lstrip("0123456789"))
+    return not digits, int(room[:digits] or 0), room[digits:]
+
+
+def get_plan_rooms(school_timetable: timetable.Timetable, plan_id: int) -> dict[str, list[int]]:
+    """Returns the periods in which the class occupies each room on each weekday, as bitsets."""
+    plan_rooms: dict[str, list[int]] = {}
+    columns = school_timetable.columns
+    strings = school_timetable.strings.strings
+    for row in school_timetable.get_class_rows(plan_id):
+        room_id = columns["room_ids"][row]
+        if not room_id:
+            # The lesson has no room
+            continue
+        room = strings[room_id]
+        if room not in plan_rooms:
+            plan_rooms[room] = [0] * len(WEEKDAY_NAMES)
+        plan_rooms[room][columns["weekdays"][row]] |= 1 << columns["periods"][row]
+    return plan_rooms
+
+
+def _set_plan_rooms(plan_id: int, plan_rooms: dict[str, list[int]] or None) -> None:
+    """Replaces the contribution of the class to the index and recalculates the affected rooms."""
+    old_plan_rooms = _plan_rooms.pop(plan_id, {})
+    if plan_rooms is not None:
+        _plan_rooms[plan_id] = plan_rooms
+    for room in old_plan_rooms.keys() | (plan_rooms or {}).keys():
+        occupied = [0] * len(WEEKDAY_NAMES)
+        for other_plan_rooms in _plan_rooms.values():
+            for weekday, periods in enumerate(other_plan_rooms.get(room, ())):
+                occupied[weekday] |= periods
+        if any(occupied):
+            _occupied[room] = occupied
+        else:
+            # The room is not used by any class any more
+            _occupied.pop(room, None)
+
+
+def update_index() -> None:
+    """Indexes the classes whose lessons have changed in the timetable since the last update."""
+    # pylint: disable=global-statement
+    global _indexed_timetable, _indexed_revision
+    school_timetable = timetable.get_timetable()
+    if school_timetable is not _indexed_timetable:
+        # The timetable has been loaded from a file; start over
+        _occupied.clear()
+        _plan_rooms.clear()
+        _indexed_plan_revisions.clear()
+        _indexed_timetable, _indexed_revision = school_timetable, None
+    if school_timetable.revision == _indexed_revision:
+        return
+    changed, removed = school_timetable.get_changed_plans(_indexed_plan_revisions)
+    for plan_id in removed:
+        _set_plan_rooms(plan_id, None)
+        del _indexed_plan_revisions[plan_id]
+        stats["removed"] += 1
+    for plan_id in changed:
+        _set_plan_rooms(plan_id, get_plan_rooms(school_timetable, plan_id))
+        _indexed_plan_revisions[plan_id] = school_timetable.plan_revisions[plan_id]
+        stats["indexed"] += 1
+    _indexed_revision = school_timetable.revision
+
+
+def get_free_rooms(weekday: int, period: int) -> list[str]:
+    """Returns the rooms in which no class has a lesson on the given period of the given weekday,
+    sorted. Only the rooms that are used by at least one class in the timetable are known."""
+    update_index()
+    stats["lookups"] += 1
+    period_bit = 1 << period
+    free_rooms = [
+        room for room, occupied in _occupied.items() if not occupied[weekday] & period_bit
+    ]
+    return sorted(free_rooms, key=get_room_sort_key)
+
+
+def get_known_rooms() -> list[str]:
+    """Returns all the rooms used by at least one class in the timetable, sorted."""
+    update_index()
+    return sorted(_occupied, key=get_room_sort_key)
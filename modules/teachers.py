@@ -0,0 +1,332 @@
+"""Functionality for looking up the lessons taught by each teacher.
+
+The substitutions page names the absent teachers by their surnames in the instrumental case, e.g.
+'z p. Kowalską' or 'z p. Tonderą-Salą'. The index maps every form of each surname in
+`teachers.json` that the page may use to the teacher's DP lessons on each weekday, so looking up
+the lessons of a teacher is a dictionary access. It is rebuilt whenever `teachers.json` or the DP
+lesson plan is loaded. Surname forms that are not in the index are matched fuzzily against the
+known surnames, and the matches are cached.
+
+The schedule index covers the whole school. It maps the teacher codes that the lesson plans of all
+classes use, e.g. 'LG' or 'Kw', to the teacher's lessons on each weekday. Like the room index in
+`modules.rooms`, only the classes whose lessons have changed in the timetable are indexed again.
+"""
+
+# Standard library imports
+import difflib
+import itertools
+import re
+from typing import Iterable
+
+# Local application imports
+from modules import util, WEEKDAY_NAMES
+from modules.api import timetable
+
+# Instrumental case endings -> the nominative endings, checked in this order
+CONJUGATED_ENDINGS = {"ą": "a", "im": "i", "iem": ""}
+# All endings of the surname forms, which are stripped before the stems are compared
+STEM_ENDINGS = ("iem", "em", "im", "ym", "ą", "a", "i", "y")
+# The minimum similarity of the stem of an unknown surname form to the stem of a known surname
+FUZZY_MATCH_CUTOFF = 0.9
+# Polish letters -> the letters that they are written as without diacritics
+DIACRITICS_TABLE = str.maketrans("ąćęłńóśźżĄĆĘŁŃÓŚŹŻ", "acelnoszzACELNOSZZ")
+# A final 'ó' that becomes 'o' when the surname is conjugated, e.g. Naróg -> Narogiem
+FINAL_O_ACUTE_PATTERN = re.compile(r"ó(?=[^aąeęioóuy]+$)")
+
+# Teacher's surname -> the names of their lessons on each weekday, e.g. {'Gawol': [['Biology SL']]}
+_lessons: dict[str, list[list[str]]] = {}
+# Every known form of each surname -> the surname, e.g. {'Kowalską': 'Kowalska'}
+_surname_forms: dict[str, str] = {}
+# Unknown surname forms -> the closest known surname, or None if none is close enough
+_fuzzy_matches: dict[str, str or None] = {}
+
+# How the surnames were found since the index was built. View with `!exec teachers.stats`.
+stats: dict[str, int] = {"indexed": 0, "fuzzy": 0, "fuzzy_cached": 0, "unknown": 0}
+
+# Teacher code -> their lessons on each weekday as (period, plan ID, subject, room) tuples, sorted
+_schedules: dict[str, list[list[tuple[int, int, str, str]]]] = {}
+# Plan ID -> the lessons of each teacher in that class, in the same format as `_schedules`
+_plan_schedules: dict[int, dict[str, list[list[tuple[int, int, str, str]]]]] = {}
+# Any form of a teacher's name or code -> the codes of the teachers that it may refer to
+_code_matches: dict[str, list[str]] = {}
+# The timetable and the revisions of its classes that the schedule index was built from
+_indexed_timetable: timetable.Timetable = None
+_indexed_revision: int = None
+_indexed_plan_revisions: dict[int, int] = {}
+
+# How many times each class was indexed and how the teachers were found.
+# View with `!exec teachers.schedule_stats`.
+schedule_stats: dict[str, int] = {"indexed": 0, "removed": 0, "cached": 0, "matched": 0}
+
+
+def normalise_surname(raw_surname: str) -> str:
+    """Returns the nominative form of the surname by replacing the instrumental case ending of
+    each of its parts, e.g. 'Tonderą-Salą' -> 'Tondera-Sala'."""
+
+    def map_word_part(part: str) -> str:
+        for ending, new_ending in CONJUGATED_ENDINGS.items():
+            if part.endswith(ending):
+                return part[: -len(ending)] + new_ending
+        return part
+
+    return "-".join(map(map_word_part, raw_surname.split("-")))
+
+
+def get_part_forms(part: str) -> set[str]:
+    """Returns the nominative and the instrumental case forms of one part of a surname."""
+    forms = {part}
+    if part.endswith("a"):
+        forms.add(part[:-1] + "ą")  # Kowalska -> Kowalską
+    elif part.endswith(("i", "y")):
+        forms.add(part + "m")  # Zieliński -> Zielińskim
+    elif part.endswith(("k", "g")):
+        forms.add(part + "iem")  # Nowak -> Nowakiem
+        if part.endswith(("ek", "eg")):
+            forms.add(part[:-2] + part[-1] + "iem")  # Korek -> Korkiem
+    else:
+        forms.add(part + "em")  # Gawol -> Gawolem
+        if part.endswith("ec"):
+            forms.add(part[:-2] + "cem")  # Malec -> Malcem
+    stem_changed = FINAL_O_ACUTE_PATTERN.sub("o", part)
+    if stem_changed != part:
+        # Naróg -> Narogiem
+        forms |= get_part_forms(stem_changed) - {stem_changed}
+    return forms
+
+
+def get_surname_forms(surname: str) -> set[str]:
+    """Returns every form of the surname that the substitutions page may use. The parts of
+    hyphenated surnames are conjugated separately, e.g. 'Malec-Pytel' -> 'Malcem-Pytlem'."""
+    part_forms = [get_part_forms(part) for part in surname.split("-")]
+    forms = {"-".join(parts) for parts in itertools.product(*part_forms)}
+    # Also include the forms that the endings in `CONJUGATED_ENDINGS` de-conjugate to
+    return forms | {normalise_surname(form) for form in forms}
+
+
+def build_index() -> None:
+    """Rebuilds the index from the loaded `teachers.json` and DP lesson plan."""
+    weekdays = util.lesson_plan_dp.get("weekdays", [])
+    _lessons.clear()
+    _surname_forms.clear()
+    _fuzzy_matches.clear()
+    # The surnames that the teacher codes were matched through may have changed
+    _code_matches.clear()
+    for stat in stats:
+        stats[stat] = 0
+    for surname, subjects in util.teacher_subjects.items():
+        if not isinstance(subjects, list):
+            subjects = [subjects]
+        _lessons[surname] = []
+        for blocks in weekdays:
+            # Get the subjects taught by that teacher on the given day
+            lesson_names = []
+            for lesson in itertools.chain.from_iterable(block["lessons"] for block in blocks):
+                lesson_name = lesson["name"]
+                lesson_full_name = f"{lesson_name} {lesson.get('level', '')}".strip()
+                if lesson_full_name in subjects or lesson_name in subjects:
+                    lesson_names.append(lesson_full_name)
+            _lessons[surname].append(lesson_names)
+        for form in get_surname_forms(surname):
+            _surname_forms.setdefault(form, surname)
+
+
+def get_stem(form: str) -> str:
+    """Returns the surname form without its ending and diacritics, e.g. 'Oblawsk' for 'Obławską'."""
+    for ending in STEM_ENDINGS:
+        if form.endswith(ending):
+            form = form[: -len(ending)]
+            break
+    return form.translate(DIACRITICS_TABLE)
+
+
+def is_a_declension(form: str) -> bool:
+    """Checks if the surname form is of one that ends with 'a' in the nominative case, e.g.
+    'Kowalska' or 'Kotułą'. These are never forms of the other surnames, e.g. 'Kowalski'."""
+    return form.endswith(("a", "ą"))
+
+
+def get_closest_surname(raw_surname: str) -> str or None:
+    """Returns the known surname whose stem is nearly the same as that of the given form, e.g.
+    with a typo or without diacritics, or None if there is no such surname.
+
+    Only surnames of the same declension are compared, so that e.g. 'Winiarską' is never taken for
+    'Winiarski', since reporting the lessons of the wrong teacher is worse than none at all.
+    """
+    stems = {
+        get_stem(surname): surname
+        for surname in _lessons
+        if is_a_declension(surname) == is_a_declension(raw_surname)
+    }
+    matches = difflib.get_close_matches(
+        get_stem(raw_surname), stems.keys(), n=1, cutoff=FUZZY_MATCH_CUTOFF
+    )
+    return stems[matches[0]] if matches else None
+
+
+def find_surname(raw_surname: str) -> str or None:
+    """Returns the surname in `teachers.json` that the given form refers to, or None if there is
+    no such teacher."""
+    surname = _surname_forms.get(raw_surname) or _surname_forms.get(normalise_surname(raw_surname))
+    if surname is not None:
+        stats["indexed"] += 1
+        return surname
+    if raw_surname in _fuzzy_matches:
+        stats["fuzzy_cached"] += 1
+        surname = _fuzzy_matches[raw_surname]
+    else:
+        stats["fuzzy"] += 1
+        surname = _fuzzy_matches[raw_surname] = get_closest_surname(raw_surname)
+    if surname is None:
+        stats["unknown"] += 1
+    return surname
+
+
+def get_lessons_with_teacher(raw_surname: str, weekday: int) -> tuple[str, list[str]]:
+    """Returns the teacher's unconjugated surname and the names of their lessons on the given day.
+
+    Arguments:
+        raw_surname -- the surname in any form, e.g. 'Kowalską'.
+        weekday -- the index of the day of the week, starting at 0 for Monday.
+    """
+    surname = find_surname(raw_surname)
+    if surname is None:
+        return normalise_surname(raw_surname), []
+    lessons = _lessons[surname]
+    return surname, (lessons[weekday] if weekday < len(lessons) else [])
+
+
+def get_plan_schedules(
+    school_timetable: timetable.Timetable, plan_id: int
+) -> dict[str, list[list[tuple[int, int, str, str]]]]:
+    """Returns the lessons of each teacher in the class on each weekday."""
+    plan_schedules: dict[str, list[list[tuple[int, int, str, str]]]] = {}
+    columns = school_timetable.columns
+    strings = school_timetable.strings.strings
+    for row in school_timetable.get_class_rows(plan_id):
+        teacher_id = columns["teacher_ids"][row]
+        if not teacher_id:
+            # The teacher is not specified in the lesson plan
+            continue
+        teacher = strings[teacher_id]
+        if teacher not in plan_schedules:
+            plan_schedules[teacher] = [[] for _ in WEEKDAY_NAMES]
+        lesson = (
+            columns["periods"][row],
+            plan_id,
+            strings[columns["subject_ids"][row]],
+            strings[columns["room_ids"][row]],
+        )
+        plan_schedules[teacher][columns["weekdays"][row]].append(lesson)
+    return plan_schedules
+
+
+def _set_plan_schedules(plan_id: int, plan_schedules: dict[str, list[list]] or None) -> None:
+    """Replaces the lessons of the class in the index and merges the schedules of the affected
+    teachers again."""
+    old_plan_schedules = _plan_schedules.pop(plan_id, {})
+    if plan_schedules is not None:
+        _plan_schedules[plan_id] = plan_schedules
+    for teacher in old_plan_schedules.keys() | (plan_schedules or {}).keys():
+        schedule = [[] for _ in WEEKDAY_NAMES]
+        for other_plan_schedules in _plan_schedules.values():
+            for weekday, lessons in enumerate(other_plan_schedules.get(teacher, ())):
+                schedule[weekday].extend(lessons)
+        if any(schedule):
+            _schedules[teacher] = [sorted(lessons) for lessons in schedule]
+        else:
+            # The teacher does not teach any class any more
+            _schedules.pop(teacher, None)
+
+
+def update_schedule_index() -> None:
+    """Indexes the classes whose lessons have changed in the timetable since the last update."""
+    # pylint: disable=global-statement
+    global _indexed_timetable, _indexed_revision
+    school_timetable = timetable.get_timetable()
+    if school_timetable is not _indexed_timetable:
+        # The timetable has been loaded from a file; start over
+        _schedules.clear()
+        _plan_schedules.clear()
+        _indexed_plan_revisions.clear()
+        _indexed_timetable, _indexed_revision = school_timetable, None
+    if school_timetable.revision == _indexed_revision:
+        return
+    changed, removed = school_timetable.get_changed_plans(_indexed_plan_revisions)
+    for plan_id in removed:
+        _set_plan_schedules(plan_id, None)
+        del _indexed_plan_revisions[plan_id]
+        schedule_stats["removed"] += 1
+    for plan_id in changed:
+        _set_plan_schedules(plan_id, get_plan_schedules(school_timetable, plan_id))
+        _indexed_plan_revisions[plan_id] = school_timetable.plan_revisions[plan_id]
+        schedule_stats["indexed"] += 1
+    # The set of teachers may have changed
+    _code_matches.clear()
+    _indexed_revision = school_timetable.revision
+
+
+def get_surname_codes(
+    surname: str, codes: Iterable[str], known_surnames: Iterable[str]
+) -> list[str]:
+    """Returns the teacher codes that may stand for the known surname, sorted. The codes are either
+    the beginning of the surname, e.g. 'Kw' -> 'Kwiatkowski', or the initial of the first name
+    followed by those of the surname, e.g. 'LG' -> 'Gawol' or 'ATS' -> 'Tondera-Sala'. Codes of the
+    first kind are more specific, so the others are only returned if there are none of them.
+
+    A beginning shared by several known surnames, e.g. 'Kw' for both 'Kwiatkowski' and 'Kwiecień',
+    does not tell them apart, so such codes are ignored. Initials are shared by many surnames, so
+    all codes of the second kind are returned if there are several.
+
+    Arguments:
+        surname -- the teacher's surname in the nominative case, e.g. 'Gawol'.
+        codes -- the teacher codes used in the lesson plans.
+        known_surnames -- the surnames in `teachers.json`.
+    """
+    initials = "".join(part[:1] for part in surname.split("-")).upper()
+    prefix_codes, initials_codes = [], []
+    for code in codes:
+        if len(code) > 1 and code[0].isupper() and code[1:].islower():
+            if surname.startswith(code):
+                prefix_codes.append(code)
+        elif code.isupper() and code[1:] == initials:
+            initials_codes.append(code)
+    prefix_codes = [
+        code
+        for code in prefix_codes
+        if sum(other.startswith(code) for other in known_surnames) == 1
+    ]
+    return sorted(prefix_codes or initials_codes)
+
+
+def find_teacher_codes(raw_name: str) -> list[str]:
+    """Returns the codes of the teachers that the given code or surname in any form may refer to,
+    e.g. 'LG', 'Gawol' or 'Gawolem'. Surnames that are not in `teachers.json` are not matched to
+    any codes, so that the teacher's code is asked for instead. The matches are cached until the
+    schedule index changes."""
+    update_schedule_index()
+    if raw_name in _schedules:
+        return [raw_name]
+    if raw_name in _code_matches:
+        schedule_stats["cached"] += 1
+        return _code_matches[raw_name]
+    schedule_stats["matched"] += 1
+    codes = [code for code in _schedules if code.lower() == raw_name.lower()]
+    if not codes:
+        surname = find_surname(raw_name)
+        if surname is not None:
+            codes = get_surname_codes(surname, _schedules, _lessons)
+    _code_matches[raw_name] = codes
+    return codes
+
+
+def get_teacher_schedule(code: str, weekday: int) -> list[tuple[int, int, str, str]]:
+    """Returns the lessons of the teacher with the given code on the given day as
+    (period, plan ID, subject, room) tuples, sorted by period.
+
+    Arguments:
+        code -- the teacher's code in the lesson plans, e.g. 'LG'.
+        weekday -- the index of the day of the week, starting at 0 for Monday.
+    """
+    update_schedule_index()
+    schedule = _schedules.get(code)
+    return schedule[weekday] if schedule and weekday < len(schedule) else []
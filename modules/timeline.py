@@ -0,0 +1,160 @@
+"""Functionality for looking up the period at any minute of the school week.
+
+The timeline is compiled from the times of the periods in the DP lesson plan whenever the plan is
+loaded with different times. For each minute of the week it stores the result of
+`commands.get_next_period()` for that minute, whether that minute is a lesson start or end time, and
+the next such time, so that all the lookups are a single array access.
+"""
+
+# Standard library imports
+from array import array
+from datetime import datetime, timedelta
+
+# Local application imports
+from modules import Weekday, util
+
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+LESSON_PERIOD_OFFSET = 20  # Added to the period number if the minute is during that lesson
+
+# Flags of each minute in `_flags`
+IS_TODAY = 1  # The next period is on the same day
+IN_LESSON = 2  # The minute is during a lesson
+IS_TRANSITION = 4  # A lesson starts or ends at this minute
+
+# The period number (see `commands.get_next_period()`), the flags, the weekday of the next period
+# and the minute of the next lesson start or end time, for each minute of the week. The next
+# transition of the minutes after the last one of the week is in the next week, after
+# MINUTES_PER_WEEK.
+_periods = array("b")
+_flags = array("B")
+_weekdays = array("b")
+_next_transitions = array("H")
+# The minutes of the week at which a lesson starts or ends, in ascending order
+transitions: list[int] = []
+# The period times and the first periods of each day that the timeline was compiled from
+_compiled_from: tuple = None
+
+# How many times the timeline was compiled and how many times the compiling was skipped because
+# the times did not change. View with `!exec timeline.stats`.
+stats: dict[str, int] = {"compiled": 0, "unchanged": 0}
+
+
+def get_minute_of_week(given_time: datetime) -> int:
+    """Returns the number of minutes since the start of the given time's week, i.e. Monday 00:00."""
+    return given_time.weekday() * MINUTES_PER_DAY + given_time.hour * 60 + given_time.minute
+
+
+def get_period_times() -> list[tuple[int, int]]:
+    """Returns the start and end times of each period in the DP lesson plan in minutes since
+    midnight. The times can be tuples or, if the plan was read from the cache, lists."""
+    return [
+        (start_hour * 60 + start_minute, end_hour * 60 + end_minute)
+        for (start_hour, start_minute), (end_hour, end_minute) in util.lesson_plan_dp["times"]
+    ]
+
+
+def get_first_period(weekday: int) -> int:
+    """Returns the first period on the given day of the week, or -1 if it has no lessons."""
+    first_period = -1
+    for first_period, lessons in enumerate(util.lesson_plan_dp["weekdays"][weekday]):
+        # Stop incrementing 'first_period' when the 'lessons' object is a non-empty list
+        if lessons:
+            break
+    return first_period
+
+
+def get_day_periods(period_times: list[tuple[int, int]]) -> list[int or None]:
+    """Returns the period number of the next period for each minute of a school day, incremented
+    by `LESSON_PERIOD_OFFSET` if the minute is during that lesson. The minutes after the last lesson
+    are None."""
+    day_periods = []
+    for minute in range(MINUTES_PER_DAY):
+        for period, times in enumerate(period_times):
+            if minute < times[0]:
+                day_periods.append(period)
+                break
+            if minute < times[1]:
+                day_periods.append(period + LESSON_PERIOD_OFFSET)
+                break
+        else:
+            day_periods.append(None)
+    return day_periods
+
+
+def build() -> None:
+    """Compiles the timeline from the DP lesson plan, unless its times have not changed."""
+    # pylint: disable=global-statement
+    global _periods, _flags, _weekdays, _next_transitions, transitions, _compiled_from
+    period_times = get_period_times()
+    first_periods = [get_first_period(weekday) for weekday in range(Weekday.SATURDAY)]
+    if (period_times, first_periods) == _compiled_from:
+        stats["unchanged"] += 1
+        return
+
+    day_periods = get_day_periods(period_times)
+    day_transitions = sorted({time for times in period_times for time in times})
+    periods = array("b", bytes(MINUTES_PER_WEEK))
+    flags = array("B", bytes(MINUTES_PER_WEEK))
+    weekdays = array("b", bytes(MINUTES_PER_WEEK))
+    for weekday in range(7):
+        # If it's currently Friday, the modulo operation will return 0 (Monday)
+        next_school_day = (weekday + 1) % Weekday.SATURDAY if weekday < Weekday.SATURDAY else 0
+        week_minute = weekday * MINUTES_PER_DAY
+        for minute, period in enumerate(day_periods):
+            if weekday >= Weekday.SATURDAY or period is None:
+                # It's the weekend or after the last lesson for the day
+                periods[week_minute + minute] = first_periods[next_school_day]
+                weekdays[week_minute + minute] = next_school_day
+            else:
+                periods[week_minute + minute] = period
+                weekdays[week_minute + minute] = weekday
+                in_lesson = period >= LESSON_PERIOD_OFFSET
+                flags[week_minute + minute] = IS_TODAY | (IN_LESSON if in_lesson else 0)
+        for minute in day_transitions:
+            flags[week_minute + minute] |= IS_TRANSITION
+
+    # The status is checked at the lesson times on every day of the week
+    week_transitions = [
+        weekday * MINUTES_PER_DAY + minute for weekday in range(7) for minute in day_transitions
+    ]
+    next_transitions = array("H", bytes(2 * MINUTES_PER_WEEK))
+    # Without any lessons, the next transition is never reached
+    next_transition = (week_transitions or [MINUTES_PER_WEEK])[0] + MINUTES_PER_WEEK
+    for minute in reversed(range(MINUTES_PER_WEEK)):
+        next_transitions[minute] = next_transition
+        if flags[minute] & IS_TRANSITION:
+            next_transition = minute
+
+    _periods, _flags, _weekdays, _next_transitions = periods, flags, weekdays, next_transitions
+    transitions = week_transitions
+    _compiled_from = period_times, first_periods
+    stats["compiled"] += 1
+
+
+def _ensure_built() -> None:
+    """Compiles the timeline if it has not been compiled yet."""
+    if _compiled_from is None:
+        build()
+
+
+def get_next_period(given_time: datetime) -> tuple[bool, int, int]:
+    """Returns the information about the next period for a given time; see
+    `commands.get_next_period()`."""
+    _ensure_built()
+    minute = get_minute_of_week(given_time)
+    return bool(_flags[minute] & IS_TODAY), _periods[minute], _weekdays[minute]
+
+
+def is_transition(given_time: datetime) -> bool:
+    """Returns True if a lesson starts or ends at the given time's hour and minute."""
+    _ensure_built()
+    return bool(_flags[get_minute_of_week(given_time)] & IS_TRANSITION)
+
+
+def get_next_transition(given_time: datetime) -> datetime:
+    """Returns the next time after the given time at which a lesson starts or ends."""
+    _ensure_built()
+    minute = get_minute_of_week(given_time)
+    start_of_minute = given_time.replace(second=0, microsecond=0)
+    return start_of_minute + timedelta(minutes=_next_transitions[minute] - minute)
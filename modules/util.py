@@ -1,17 +1,19 @@
 """Module containing general-purpose utility functions."""
 
 # Standard library imports
-from datetime import datetime
+from datetime import date, datetime
 import json
 
 # Third-party imports
 from corny_commons.util import web
 
 # Local application imports
-from modules import GROUP_NAMES
+from modules import GROUP_NAMES, Month, Weekday
 
 URL_404 = "https://www.guzek.uk/error/404/?lang=PL&utm_source=discord"
 
+DAYS_IN_WEEKEND = len([Weekday.SATURDAY, Weekday.SUNDAY])
+
 OUR_CLASS = "3d"
 
 lesson_plan: dict[str, any] = {}
@@ -19,6 +21,11 @@ lesson_plan_dp: dict[str, list[list[int]] or list[list[dict]]] = {}
 lesson_links: dict[str, str] = {}
 teacher_subjects: dict[str, list[str]] = {}
 
+# Maps between the class names and their plan IDs, discovered from the timetable's class list.
+# Populated by `lesson_plan.update_plan_index_async()`.
+plan_ids: dict[str, int] = {}
+plan_class_names: dict[int, str] = {}
+
 # Used to show the current lesson in the lesson plan (e.g. '!plan' command).
 current_period: int = -1
 next_period: int = -1
@@ -39,7 +46,7 @@ class ExecResultList(list):
         return self
 
 
-def format_class(class_name: str = None, reverse: bool = False):
+def format_class(class_name: str or int = None, reverse: bool = False):
     """Change the format of the class name string using roman numerals instead of arabic numerals.
     Also capitalises the class letter.
     The behaviour can be reversed using the `reverse` argument.
@@ -47,7 +54,8 @@ def format_class(class_name: str = None, reverse: bool = False):
     E.g. '2d' -> 'IID'
 
     Arguments:
-        `class_name` -- the name of the class. Defaults to the value of the `our_class` variable.
+        `class_name` -- the name of the class, or its lesson plan ID. Defaults to the value of the
+        `our_class` variable.
 
         `reverse` -- if True, the class name will be converted from roman numerals into arabic
         numerals. E.g. 'IID' -> '2d'.
@@ -56,6 +64,11 @@ def format_class(class_name: str = None, reverse: bool = False):
         class_name = (class_name or format_class()).upper()
         class_num = class_name.count("I")
         return f"{class_num}{class_name[class_num:].lower()}"
+    if isinstance(class_name, int):
+        try:
+            class_name = plan_class_names[class_name]
+        except KeyError:
+            raise ValueError(f"Invalid class name: unknown plan ID {class_name}.") from None
     class_name = class_name or OUR_CLASS
     if len(class_name) < 2:
         err_msg = (
@@ -71,6 +84,19 @@ def format_class(class_name: str = None, reverse: bool = False):
         return formatted + class_name[1:].upper()
 
 
+def check_is_summer_holidays(current_time: datetime) -> bool:
+    """Returns a boolean indicating if it is currently the summer holidays."""
+    current_year = current_time.year
+    holidays_end = datetime(current_year, Month.SEPTEMBER, 1)
+    if current_time >= holidays_end:
+        return False
+    # The summer holidays start after the Friday of the second-to-last week of June
+    june_thirtieth = date(current_year, Month.JUNE, 30)
+    holidays_start = 30 - june_thirtieth.weekday() - DAYS_IN_WEEKEND
+    holidays_start = datetime(current_year, Month.JUNE, holidays_start)
+    return current_time >= holidays_start
+
+
 def get_time(
     period: int, base_time: datetime, get_period_end_time: bool
 ) -> tuple[str, datetime]: